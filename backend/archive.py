@@ -0,0 +1,48 @@
+# archive.py
+# Moves accepted/rejected/expired quotations older than QUOTATION_ARCHIVE_AFTER_DAYS (by creation
+# date), with their items and revision history, from the working tables to the *_archive tables.
+# Listings and totals then only scan the active set, while crud.get_quotation, the PDF endpoints
+# and revision history still find archived quotations. Run it from cron (e.g. nightly, from the
+# backend directory):
+#   python archive.py
+# or keep it running with --interval SECONDS. Each chunk is its own transaction, so an
+# interrupted run simply resumes on the next one.
+
+import argparse
+import datetime
+import logging
+import os
+import time
+
+import crud, migrations
+from database import WriteSessionLocal
+
+logger = logging.getLogger("archive")
+
+QUOTATION_ARCHIVE_AFTER_DAYS = int(os.getenv("QUOTATION_ARCHIVE_AFTER_DAYS", "365"))
+
+def archive(older_than_days: int, chunk_size: int) -> int:
+    cutoff = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - datetime.timedelta(days=older_than_days)
+    total = 0
+    with WriteSessionLocal() as db:
+        for account_id, archived in crud.archive_old_quotations(db, cutoff=cutoff, chunk_size=chunk_size):
+            logger.info("Account %s: %s quotations archived", account_id, archived)
+            total += archived
+    logger.info("Archive run finished: %s quotations archived", total)
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Moves old closed quotations to the archive tables.")
+    parser.add_argument("--older-than-days", type=int, default=QUOTATION_ARCHIVE_AFTER_DAYS,
+                        help="Archive quotations created more than N days ago")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Quotations moved per transaction")
+    parser.add_argument("--interval", type=int, default=0, help="Repeat every N seconds instead of running once")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    migrations.upgrade()
+    while True:
+        archive(args.older_than_days, args.chunk_size)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
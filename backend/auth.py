@@ -1,13 +1,13 @@
 # auth.py
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 
-import crud, models, schemas
-from database import SessionLocal
+import crud, models, replicas, schemas
+from database import SessionLocal, WriteSessionLocal, route_for_account
 
 # --- Configuration ---
 # In a real app, these should be in a .env file
@@ -16,6 +16,8 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# For EventSource streams, which cannot send headers and pass the token as a query parameter instead
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 # --- Token Creation ---
 
@@ -31,8 +33,24 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 
 # --- Dependency to get DB session ---
 
-def get_db():
-    db = SessionLocal()
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+def get_db(request: Request):
+    if request.method in READ_ONLY_METHODS:
+        # Replica unless the client echoes an X-Primary-Until from a recent write (see replicas.py)
+        db = SessionLocal(info={"use_primary": replicas.wants_primary(request.headers)})
+    else:
+        # Requests that change data get a writer session; on SQLite it only takes the write lock at its first write (see database.py)
+        db = WriteSessionLocal(info={"request_state": request.state})
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db():
+    # For POST endpoints that only read (e.g. login), so they never wait for or hold the write lock.
+    # Pinned to the primary: a login right after signup or a password change must see it.
+    db = SessionLocal(info={"use_primary": True})
     try:
         yield db
     finally:
@@ -40,12 +58,14 @@ def get_db():
 
 # --- Dependency for getting the current authenticated account ---
 
-def get_current_account(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.Account:
+def account_from_token(db: Session, token: str | None) -> models.Account:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_exception
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -54,12 +74,17 @@ def get_current_account(token: str = Depends(oauth2_scheme), db: Session = Depen
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    
+
+    # Reads go to a replica unless this account wrote within the stickiness window
+    route_for_account(db, token_data.username)
     account = crud.get_account_by_username(db, username=token_data.username)
     if account is None:
         raise credentials_exception
     return account
 
+def get_current_account(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.Account:
+    return account_from_token(db, token)
+
 # Optional: Dependency for getting an active account
 def get_current_active_account(current_account: models.Account = Depends(get_current_account)) -> models.Account:
     # In the future, you could add an `is_active` flag to the Account model
@@ -0,0 +1,95 @@
+"""
+Account deletion benchmark: ORM cascade (previous behaviour) vs. a single set-based DELETE
+with ON DELETE CASCADE vs. the chunked background deletion.
+
+Each strategy runs in its own process against a copy of the same seeded SQLite database,
+so the reported peak RSS belongs to the deletion alone.
+
+Run from the backend directory:
+    python -m benchmarks.bench_account_delete [quotations] [--skip-orm]
+"""
+import datetime
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+def seed(path: str, quotations: int, items_per_quotation: int = 2):
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    import models
+    from database import engine
+
+    models.Base.metadata.create_all(bind=engine)
+    now = datetime.datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(models.Account.__table__.insert(), [{"id": 1, "username": "big", "role": "user", "settings_version": 0}])
+        conn.execute(models.User.__table__.insert(), [{"id": 1, "email": "a@example.com", "account_id": 1}])
+        conn.execute(models.Client.__table__.insert(), [{"id": 1, "name": "Cliente", "account_id": 1}])
+        conn.execute(models.Product.__table__.insert(), [{"id": 1, "name": "Producto", "price": 10.0, "account_id": 1}])
+        batch = 10_000
+        for start in range(0, quotations, batch):
+            ids = range(start + 1, min(start + batch, quotations) + 1)
+            conn.execute(models.Quotation.__table__.insert(), [
+                {"id": i, "quotation_number": str(i), "client_id": 1, "user_id": 1, "account_id": 1,
+                 "created_date": now, "valid_until_date": now, "subtotal": 20.0, "tax_percentage": 16.0,
+                 "total_tax": 3.2, "other_charges": 0.0, "total": 23.2, "status": "draft"}
+                for i in ids
+            ])
+            conn.execute(models.QuotationItem.__table__.insert(), [
+                {"quotation_id": i, "product_id": 1, "description": "Item", "unit_price": 10.0,
+                 "quantity": 1, "is_taxable": True, "total": 10.0}
+                for i in ids for _ in range(items_per_quotation)
+            ])
+
+def run_strategy(strategy: str, path: str):
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    import crud, models
+    from database import SessionLocal
+
+    db = SessionLocal()
+    start = time.perf_counter()
+    if strategy == "orm":
+        # What `db.delete(account)` with ORM cascades did: load every child, delete row by row
+        items = db.query(models.QuotationItem).join(models.Quotation).filter(models.Quotation.account_id == 1).all()
+        for row in items:
+            db.delete(row)
+        db.flush()
+        for model in (models.Quotation, models.Client, models.Product, models.User):
+            for row in db.query(model).filter(model.account_id == 1).all():
+                db.delete(row)
+            db.flush()
+        db.delete(db.get(models.Account, 1))
+        db.commit()
+    elif strategy == "bulk":
+        db.execute(models.Account.__table__.delete().where(models.Account.id == 1))
+        db.commit()
+    elif strategy == "chunked":
+        while crud.delete_account_chunk(db, account_id=1, chunk_size=1000):
+            pass
+    elapsed = time.perf_counter() - start
+    remaining = db.query(models.QuotationItem).count()
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{strategy:8s} {elapsed:9.2f} s {peak_mb:10.1f} MB   (items left: {remaining})")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--strategy":
+        run_strategy(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    quotations = int(args[0]) if args else 100_000
+    strategies = ["bulk", "chunked"] if "--skip-orm" in sys.argv else ["orm", "bulk", "chunked"]
+
+    work_dir = tempfile.mkdtemp(prefix="bench_delete_")
+    seed_path = os.path.join(work_dir, "seed.db")
+    print(f"Seeding account with {quotations} quotations ...")
+    subprocess.run([sys.executable, "-c", f"from benchmarks.bench_account_delete import seed; seed({seed_path!r}, {quotations})"], check=True)
+    print(f"{'strategy':8s} {'time':>11s} {'peak RSS':>13s}")
+    for strategy in strategies:
+        path = os.path.join(work_dir, f"{strategy}.db")
+        shutil.copy(seed_path, path)
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_account_delete", "--strategy", strategy, path], check=True)
+    shutil.rmtree(work_dir)
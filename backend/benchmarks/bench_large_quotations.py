@@ -0,0 +1,82 @@
+"""
+Large-quotation rendering benchmark: time, peak RSS and output size of rendering quotations
+with 100, 1k and 10k items, as a single document vs. the chunked large-document mode of pdf.py.
+
+Each (mode, size) render runs in its own process against a seeded SQLite database, so the
+reported peak RSS belongs to that render alone.
+
+Run from the backend directory:
+    python -m benchmarks.bench_large_quotations [sizes...]
+"""
+import datetime
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = [100, 1_000, 10_000]
+
+def seed(path: str, sizes: list[int]):
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    import models
+    from database import engine
+
+    models.Base.metadata.create_all(bind=engine)
+    now = datetime.datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(models.Account.__table__.insert(), [{"id": 1, "username": "big", "role": "user", "settings_version": 0}])
+        conn.execute(models.User.__table__.insert(), [{"id": 1, "email": "asesor@example.com", "full_name": "Asesor", "account_id": 1}])
+        conn.execute(models.Client.__table__.insert(), [{"id": 1, "name": "Cliente Industrial", "account_id": 1}])
+        conn.execute(models.Product.__table__.insert(), [{"id": 1, "name": "Refacción", "price": 12.5, "account_id": 1}])
+        for quotation_id, size in enumerate(sizes, start=1):
+            conn.execute(models.Quotation.__table__.insert(), [
+                {"id": quotation_id, "quotation_number": str(quotation_id), "client_id": 1, "user_id": 1, "account_id": 1,
+                 "created_date": now, "valid_until_date": now, "subtotal": 25.0 * size, "tax_percentage": 16.0,
+                 "total_tax": 4.0 * size, "other_charges": 0.0, "total": 29.0 * size, "status": "draft"}
+            ])
+            conn.execute(models.QuotationItem.__table__.insert(), [
+                {"quotation_id": quotation_id, "product_id": 1, "description": f"Partida {index} - pieza de repuesto",
+                 "unit_price": 12.5, "quantity": 2, "is_taxable": True, "total": 25.0}
+                for index in range(size)
+            ])
+
+def run_render(path: str, quotation_id: int):
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    import crud, pdf
+    from database import SessionLocal
+
+    with SessionLocal() as db:
+        account = crud.get_account(db, account_id=1)
+        quotation = crud.get_quotation(db, quotation_id=quotation_id, account_id=1)
+        items = len(quotation.items)
+        start = time.perf_counter()
+        content = pdf.render_quotation_pdf(db, quotation, account)
+        elapsed = time.perf_counter() - start
+    mode = "chunked" if items > pdf.PDF_LARGE_DOCUMENT_ITEMS else "single"
+    # Chunked renders run in a child process (see pdf_chunks.py)
+    peak_mb = max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) / 1024
+    print(f"{mode:8s} {items:7d} {elapsed:9.2f} s {peak_mb:10.1f} MB {len(content) / 1024:10.1f} KB")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--render":
+        run_render(sys.argv[2], int(sys.argv[3]))
+        sys.exit(0)
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    work_dir = tempfile.mkdtemp(prefix="bench_large_")
+    path = os.path.join(work_dir, "seed.db")
+    subprocess.run([sys.executable, "-c", f"from benchmarks.bench_large_quotations import seed; seed({path!r}, {sizes!r})"], check=True)
+    print(f"{'mode':8s} {'items':>7s} {'time':>11s} {'peak RSS':>13s} {'size':>13s}")
+    # "single" forces the whole table into one WeasyPrint document; "chunked" uses the default threshold
+    for mode, threshold in (("single", str(10 ** 9)), ("chunked", os.getenv("PDF_LARGE_DOCUMENT_ITEMS", "300"))):
+        for quotation_id, size in enumerate(sizes, start=1):
+            if mode == "chunked" and size <= int(threshold):
+                continue  # identical to the single-document render
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_large_quotations", "--render", path, str(quotation_id)],
+                env={**os.environ, "PDF_LARGE_DOCUMENT_ITEMS": threshold}, check=True,
+            )
+    shutil.rmtree(work_dir)
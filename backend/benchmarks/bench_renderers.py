@@ -0,0 +1,51 @@
+"""
+PDF renderer benchmark: throughput and output size of the WeasyPrint (HTML/CSS) backend vs.
+the ReportLab canvas backend of pdf.py, on quotations of a few typical sizes.
+
+Each renderer runs in its own process (so the WeasyPrint import does not skew the other one),
+reporting its import/startup cost separately from the steady-state renders.
+
+Run from the backend directory:
+    python -m benchmarks.bench_renderers [renders_per_size]
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SIZES = [5, 50, 500]
+
+def run_renderer(name: str, path: str, renders: int):
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    import crud, pdf
+    from database import SessionLocal
+
+    with SessionLocal() as db:
+        account = crud.get_account(db, account_id=1)
+        quotations = [crud.get_quotation(db, quotation_id=i, account_id=1) for i in range(1, len(SIZES) + 1)]
+        start = time.perf_counter()
+        pdf.render_quotation_pdf(db, quotations[0], account, name)  # first render pays the imports
+        startup = time.perf_counter() - start
+        for quotation, size in zip(quotations, SIZES):
+            start = time.perf_counter()
+            for _ in range(renders):
+                content = pdf.render_quotation_pdf(db, quotation, account, name)
+            elapsed = time.perf_counter() - start
+            print(f"{name:10s} {size:6d} {renders / elapsed:10.1f}/s {elapsed / renders * 1000:9.1f} ms {len(content) / 1024:9.1f} KB")
+    print(f"{name:10s} first render (incl. imports): {startup:.2f} s")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--renderer":
+        run_renderer(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        sys.exit(0)
+
+    renders = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    work_dir = tempfile.mkdtemp(prefix="bench_renderers_")
+    path = os.path.join(work_dir, "seed.db")
+    subprocess.run([sys.executable, "-c", f"from benchmarks.bench_large_quotations import seed; seed({path!r}, {SIZES!r})"], check=True)
+    print(f"{'renderer':10s} {'items':>6s} {'throughput':>12s} {'per render':>12s} {'size':>12s}")
+    for name in ("weasyprint", "canvas"):
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_renderers", "--renderer", name, path, str(renders)], check=True)
+    shutil.rmtree(work_dir)
@@ -0,0 +1,67 @@
+"""
+Serialization benchmark for the list endpoints.
+
+Compares the previous path (response_model validation + jsonable_encoder + stdlib json)
+against the cached TypeAdapter + pydantic-core JSON path used by `responses.orm_list_response`.
+
+Run from the backend directory:
+    python -m benchmarks.bench_serialization [rows]
+"""
+import datetime
+import json
+import sys
+import time
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+
+import models, schemas
+from responses import list_adapter
+
+def build_rows(count: int) -> List[models.Quotation]:
+    """Builds detached ORM quotations with the relationships the list endpoint serializes."""
+    client = models.Client(id=1, name="Cliente Demo", email="cliente@example.com", account_id=1)
+    user = models.User(id=1, full_name="Asesor Demo", email="asesor@example.com", is_active=True, account_id=1)
+    now = datetime.datetime(2024, 1, 1, 12, 0)
+    rows = []
+    for i in range(count):
+        items = [
+            models.QuotationItem(id=i * 3 + n, product_id=n, description=f"Producto {n}",
+                                 unit_price=10.5 * n, quantity=n, is_taxable=True, total=10.5 * n * n)
+            for n in range(1, 4)
+        ]
+        rows.append(models.Quotation(
+            id=i, quotation_number=str(i), client_id=1, user_id=1, account_id=1,
+            created_date=now, valid_until_date=now.date(), subtotal=147.0, tax_percentage=16.0,
+            total_tax=23.52, other_charges=0.0, total=170.52, status="draft",
+            client=client, user=user, items=items,
+        ))
+    return rows
+
+def legacy_path(rows) -> bytes:
+    validated = [schemas.Quotation.model_validate(row) for row in rows]
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+def adapter_path(rows) -> bytes:
+    adapter = list_adapter(schemas.Quotation)
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+def timed(func, rows, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rows = build_rows(count)
+    adapter_path(rows[:1])  # warm the adapter cache
+
+    before = timed(legacy_path, rows)
+    after = timed(adapter_path, rows)
+    print(f"rows={count}")
+    print(f"before (response_model + json):  {before * 1000:8.1f} ms")
+    print(f"after  (TypeAdapter dump_json):  {after * 1000:8.1f} ms")
+    print(f"speedup: {before / after:.1f}x")
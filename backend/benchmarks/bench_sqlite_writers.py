@@ -0,0 +1,82 @@
+"""
+SQLite write-concurrency benchmark: N parallel quotation creators (threads, like the API's
+threadpool) under the stock SQLite settings vs. the production profile of database.py.
+
+Each profile runs in its own process against a fresh database file.
+
+Run from the backend directory:
+    python -m benchmarks.bench_sqlite_writers [creators] [quotations_per_creator]
+"""
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ITEMS_PER_QUOTATION = 5
+
+def run_profile(path: str, creators: int, per_creator: int):
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    import crud, models, schemas
+    from database import SQLITE_PROFILE, WriteSessionLocal, write_engine
+
+    models.Base.metadata.create_all(bind=write_engine)
+    with WriteSessionLocal() as db:
+        account = models.Account(username="bench", role="user")
+        db.add(account)
+        db.commit()
+        user = models.User(email="asesor@example.com", account_id=account.id)
+        client = models.Client(name="Cliente", account_id=account.id)
+        product = models.Product(name="Producto", price=10.0, account_id=account.id)
+        db.add_all([user, client, product])
+        db.commit()
+        account_id, user_id, client_id, product_id = account.id, user.id, client.id, product.id
+
+    quotation_in = schemas.QuotationCreate(
+        client_id=client_id, user_id=user_id, valid_until_date=datetime.date(2030, 1, 1),
+        items=[schemas.QuotationItemCreate(product_id=product_id, description="Item", unit_price=10.0, quantity=2)] * ITEMS_PER_QUOTATION,
+    )
+    created, errors = [0], []
+    counter_lock = threading.Lock()
+
+    def creator():
+        for _ in range(per_creator):
+            try:
+                with WriteSessionLocal() as db:
+                    crud.create_quotation(db, quotation=quotation_in, user_id=user_id, account_id=account_id)
+                with counter_lock:
+                    created[0] += 1
+            except Exception as exc:  # "database is locked", duplicate numbers, ...
+                with counter_lock:
+                    errors.append(type(exc).__name__ + ": " + str(exc).splitlines()[0])
+
+    threads = [threading.Thread(target=creator) for _ in range(creators)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"{SQLITE_PROFILE:10s} {created[0]:7d} {len(errors):7d} {elapsed:8.2f} s {created[0] / elapsed:9.1f} q/s")
+    for message in sorted(set(errors))[:3]:
+        print(f"{'':10s} error: {message[:100]}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--profile":
+        run_profile(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+        sys.exit(0)
+
+    creators = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    per_creator = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    print(f"{creators} parallel creators x {per_creator} quotations ({ITEMS_PER_QUOTATION} items each)")
+    print(f"{'profile':10s} {'created':>7s} {'errors':>7s} {'time':>10s} {'throughput':>11s}")
+    with tempfile.TemporaryDirectory(prefix="bench_writers_") as work_dir:
+        for profile in ("default", "production"):
+            path = os.path.join(work_dir, f"{profile}.db")
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_sqlite_writers", "--profile", path, str(creators), str(per_creator)],
+                env={**os.environ, "SQLITE_PROFILE": profile}, check=True,
+            )
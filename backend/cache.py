@@ -0,0 +1,41 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+class VersionedCache:
+    """
+    Small in-process LRU cache whose entries are tagged with a version number.
+
+    Readers pass the version they currently see in the database (e.g. `Account.settings_version`,
+    which every authenticated request already loads). An entry stored under an older version is
+    treated as a miss, so a write made by any worker invalidates every other worker's copy as soon
+    as that worker sees the bumped version.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Hashable, tuple[int, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: int):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, version: int, value: Any):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
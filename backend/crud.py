@@ -1,10 +1,13 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload, selectinload, undefer
+from sqlalchemy import DateTime, Integer, String, and_, delete, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
 import datetime
 import secrets
+
+import orjson
 from fastapi import HTTPException
 
-import models, schemas
+import cache, events, jobs, models, pdf_store, revisions, schemas
 from passlib.context import CryptContext
 
 # --- Security and Authentication ---
@@ -17,6 +20,23 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# --- Account Defaults ---
+
+DEFAULT_TERMS_CONTENT = (
+    "1. Al cliente se le cobrará 70 % después de aceptada esta cotización.\n"
+    "2. El pago será debitado antes de la entrega de bienes y servicios.\n"
+    "3. Por favor enviar la cotización firmada al email indicado anteriormente.\n"
+    "4. Esta cotización no incluye IVA si requiere Factura Favor de indicar."
+)
+
+DEFAULT_COMPANY_PROFILE = {
+    "company_name": "",
+    "address": "",
+    "phone": "",
+    "website": "",
+    "logo_path": "",
+}
+
 def get_account_by_username(db: Session, username: str):
     return db.query(models.Account).filter(func.lower(models.Account.username) == func.lower(username)).first()
 
@@ -40,32 +60,21 @@ def create_account(db: Session, account: schemas.AccountCreate):
         hashed_password=hashed_password,
         role=role
     )
+    # Create the default company profile and terms together with the account,
+    # so the read path (PDF rendering, settings page) never has to write.
+    db_account.company_profile = models.CompanyProfile(**DEFAULT_COMPANY_PROFILE)
+    db_account.terms_conditions = models.TermsConditions(content=DEFAULT_TERMS_CONTENT)
     db.add(db_account)
     db.commit()
     db.refresh(db_account)
 
-    # Create default terms and conditions for the new account
-    default_terms_content = (
-        "1. Al cliente se le cobrará 70 % después de aceptada esta cotización.\n"
-        "2. El pago será debitado antes de la entrega de bienes y servicios.\n"
-        "3. Por favor enviar la cotización firmada al email indicado anteriormente.\n"
-        "4. Esta cotización no incluye IVA si requiere Factura Favor de indicar."
-    )
-    db_terms = models.TermsConditions(
-        content=default_terms_content,
-        account_id=db_account.id
-    )
-    db.add(db_terms)
-    db.commit()
-    db.refresh(db_account) # Refresh to get the relationship loaded
-
     return db_account
 
 def update_account(db: Session, account_id: int, account: schemas.AccountUpdate):
     db_account = get_account(db, account_id=account_id)
     if not db_account:
         return None
-    update_data = account.dict(exclude_unset=True)
+    update_data = account.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_account, key, value)
     db.add(db_account)
@@ -73,22 +82,56 @@ def update_account(db: Session, account_id: int, account: schemas.AccountUpdate)
     db.refresh(db_account)
     return db_account
 
-def delete_account_with_password(db: Session, *, account_id: int, admin_account: models.Account, password: str) -> bool:
-    """Verifies admin password and then deletes the target account."""
+def delete_account_with_password(db: Session, *, account_id: int, admin_account: models.Account, password: str, background: bool = False):
+    """
+    Verifies admin password and then deletes the target account.
+    With `background`, queues a chunked deletion job instead and returns it.
+    """
     # 1. Verify the admin's own password
     if not verify_password(password, admin_account.hashed_password):
         return False # Password incorrect
 
     # 2. Get the account to be deleted
-    db_account = get_account(db, account_id=account_id)
-    if not db_account:
+    if not db.query(models.Account.id).filter(models.Account.id == account_id).first():
         return False # Target account not found, though this shouldn't happen if called correctly
 
-    # 3. Delete the account (cascading delete will handle the rest)
-    db.delete(db_account)
+    # 3. Delete the account. A single DELETE; the database cascades to all of its rows.
+    if background:
+        return jobs.enqueue(db, "delete_account", {"account_id": account_id}, account_id=admin_account.id)
+    db.execute(delete(models.Account).where(models.Account.id == account_id))
     db.commit()
+    _invalidate_account_caches(account_id)
     return True
 
+# Children first, so each chunk only cascades to rows that are deleted anyway
+_ACCOUNT_OWNED_MODELS = (
+    models.QuotationDelivery, models.QuotationRevision, models.Quotation,
+    models.ArchivedQuotationRevision, models.ArchivedQuotation,
+    models.Client, models.Product, models.User,
+)
+
+def count_account_rows(db: Session, account_id: int) -> int:
+    return sum(
+        db.query(func.count(model.id)).filter(model.account_id == account_id).scalar()
+        for model in _ACCOUNT_OWNED_MODELS
+    )
+
+def delete_account_chunk(db: Session, account_id: int, chunk_size: int = 1000) -> int:
+    """
+    Deletes (and commits) up to `chunk_size` rows owned by the account, keeping each
+    transaction short. Once nothing is left, deletes the account itself and returns 0.
+    """
+    for model in _ACCOUNT_OWNED_MODELS:
+        chunk_ids = select(model.id).where(model.account_id == account_id).limit(chunk_size)
+        deleted = db.execute(delete(model).where(model.id.in_(chunk_ids))).rowcount
+        if deleted:
+            db.commit()
+            return deleted
+    db.execute(delete(models.Account).where(models.Account.id == account_id))
+    db.commit()
+    _invalidate_account_caches(account_id)
+    return 0
+
 
 # --- User (Asesor) Functions ---
 
@@ -130,26 +173,37 @@ def create_account_user(db: Session, user: schemas.UserCreate, account_id: int):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    events.publish(account_id, "user", db_user.id, "created")
     return db_user
 
 def update_user(db: Session, user_id: int, account_id: int, user_in: schemas.UserUpdate):
     db_user = get_user(db, user_id=user_id, account_id=account_id)
     if not db_user:
         return None
-    update_data = user_in.dict(exclude_unset=True)
+    update_data = user_in.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_user, key, value)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    events.publish(account_id, "user", user_id, "updated")
     return db_user
 
+def _commit_delete_or_conflict(db: Session, detail: str):
+    """Commits a delete; a foreign key violation (the row is still referenced) becomes a 400."""
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=detail)
+
 def delete_user(db: Session, user_id: int, account_id: int):
     db_user = get_user(db, user_id=user_id, account_id=account_id)
     if not db_user:
         return None
     db.delete(db_user)
-    db.commit()
+    _commit_delete_or_conflict(db, "No se puede eliminar un asesor con cotizaciones asociadas.")
+    events.publish(account_id, "user", user_id, "deleted")
     return {"message": "User deleted successfully"}
 
 
@@ -159,10 +213,11 @@ def get_clients(db: Session, account_id: int, skip: int = 0, limit: int = 100):
     return db.query(models.Client).filter(models.Client.account_id == account_id).offset(skip).limit(limit).all()
 
 def create_client(db: Session, client: schemas.ClientCreate, account_id: int):
-    db_client = models.Client(**client.dict(), account_id=account_id)
+    db_client = models.Client(**client.model_dump(), account_id=account_id)
     db.add(db_client)
     db.commit()
     db.refresh(db_client)
+    events.publish(account_id, "client", db_client.id, "created")
     return db_client
 
 def get_client(db: Session, client_id: int, account_id: int):
@@ -173,11 +228,12 @@ def update_client(db: Session, client_id: int, client: schemas.ClientCreate, acc
     if not db_client:
         return None
     # Create a new dictionary from the client schema to avoid issues with the attached state
-    update_data = client.dict()
+    update_data = client.model_dump()
     for key, value in update_data.items():
         setattr(db_client, key, value)
     db.commit()
     db.refresh(db_client)
+    events.publish(account_id, "client", client_id, "updated")
     return db_client
 
 def delete_client(db: Session, client_id: int, account_id: int):
@@ -185,7 +241,8 @@ def delete_client(db: Session, client_id: int, account_id: int):
     if not db_client:
         return None
     db.delete(db_client)
-    db.commit()
+    _commit_delete_or_conflict(db, "No se puede eliminar un cliente con cotizaciones asociadas.")
+    events.publish(account_id, "client", client_id, "deleted")
     return db_client
 
 # --- Product Functions (Scoped by Account) ---
@@ -194,10 +251,11 @@ def get_products(db: Session, account_id: int, skip: int = 0, limit: int = 100):
     return db.query(models.Product).filter(models.Product.account_id == account_id).offset(skip).limit(limit).all()
 
 def create_product(db: Session, product: schemas.ProductCreate, account_id: int):
-    db_product = models.Product(**product.dict(), account_id=account_id)
+    db_product = models.Product(**product.model_dump(), account_id=account_id)
     db.add(db_product)
     db.commit()
     db.refresh(db_product)
+    events.publish(account_id, "product", db_product.id, "created")
     return db_product
 
 def update_product(db: Session, product_id: int, product_in: schemas.ProductUpdate, account_id: int):
@@ -205,19 +263,30 @@ def update_product(db: Session, product_id: int, product_in: schemas.ProductUpda
     if not db_product:
         return None
     
-    update_data = product_in.dict(exclude_unset=True)
+    update_data = product_in.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_product, key, value)
         
     db.add(db_product)
     db.commit()
     db.refresh(db_product)
+    events.publish(account_id, "product", product_id, "updated")
     return db_product
 
 # --- Quotation Number Generation (Per Account) ---
 
 def _get_next_quotation_number(db: Session, account_id: int) -> str:
+    # Lock the account row (a no-op on SQLite, which serializes writers anyway) so two
+    # concurrent transactions of the same account cannot allocate the same number.
+    db.query(models.Account.id).filter(models.Account.id == account_id).with_for_update().first()
     last_quotation = db.query(models.Quotation).filter(models.Quotation.account_id == account_id).order_by(models.Quotation.id.desc()).first()
+    # The newest quotations may have been archived: keep counting from there (ids only grow)
+    last_archived = (
+        db.query(models.ArchivedQuotation).filter(models.ArchivedQuotation.account_id == account_id)
+        .order_by(models.ArchivedQuotation.id.desc()).first()
+    )
+    if last_archived is not None and (last_quotation is None or last_archived.id > last_quotation.id):
+        last_quotation = last_archived
     
     if not last_quotation or not last_quotation.quotation_number.isdigit():
         return "1"
@@ -227,8 +296,12 @@ def _get_next_quotation_number(db: Session, account_id: int) -> str:
 
 # --- Quotation Functions (Scoped by Account) ---
 
-def get_quotation(db: Session, quotation_id: int, account_id: int):
-    return (
+def get_quotation(db: Session, quotation_id: int, account_id: int, include_archived: bool = True):
+    """
+    The quotation with its client, advisor and items. Archived quotations (read-only, see
+    archive.py) are found too unless `include_archived` is False, as callers that modify need.
+    """
+    db_quotation = (
         db.query(models.Quotation)
         .options(
             joinedload(models.Quotation.client),
@@ -238,15 +311,43 @@ def get_quotation(db: Session, quotation_id: int, account_id: int):
         .filter(models.Quotation.id == quotation_id, models.Quotation.account_id == account_id)
         .first()
     )
+    if db_quotation is None and include_archived:
+        db_quotation = (
+            db.query(models.ArchivedQuotation)
+            .options(
+                joinedload(models.ArchivedQuotation.client),
+                joinedload(models.ArchivedQuotation.user),
+                joinedload(models.ArchivedQuotation.items).joinedload(models.ArchivedQuotationItem.product)
+            )
+            .filter(models.ArchivedQuotation.id == quotation_id, models.ArchivedQuotation.account_id == account_id)
+            .first()
+        )
+    return db_quotation
 
 def get_quotations(db: Session, account_id: int, skip: int = 0, limit: int = 100):
     return (
         db.query(models.Quotation)
         .filter(models.Quotation.account_id == account_id)
-        .options(joinedload(models.Quotation.client), joinedload(models.Quotation.user))
+        .options(
+            joinedload(models.Quotation.client),
+            joinedload(models.Quotation.user),
+            selectinload(models.Quotation.items),  # serialized by the list endpoint; avoids one lazy load per row
+        )
         .order_by(models.Quotation.id.desc()).offset(skip).limit(limit).all()
     )
 
+def get_archived_quotations(db: Session, account_id: int, skip: int = 0, limit: int = 100):
+    return (
+        db.query(models.ArchivedQuotation)
+        .filter(models.ArchivedQuotation.account_id == account_id)
+        .options(
+            joinedload(models.ArchivedQuotation.client),
+            joinedload(models.ArchivedQuotation.user),
+            selectinload(models.ArchivedQuotation.items),
+        )
+        .order_by(models.ArchivedQuotation.id.desc()).offset(skip).limit(limit).all()
+    )
+
 def create_quotation(db: Session, quotation: schemas.QuotationCreate, user_id: int, account_id: int):
     # 1. Calculate totals
     subtotal = sum(item.unit_price * item.quantity for item in quotation.items)
@@ -277,25 +378,40 @@ def create_quotation(db: Session, quotation: schemas.QuotationCreate, user_id: i
     db.refresh(db_quotation)
 
     # 4. Create the QuotationItem records
+    db_items = []
     for item in quotation.items:
         db_item = models.QuotationItem(
-            **item.dict(),
+            **item.model_dump(),
             quotation_id=db_quotation.id,
             total=item.unit_price * item.quantity
         )
         db.add(db_item)
-    
+        db_items.append(db_item)
+
+    # 5. Record the first revision (a snapshot) with the items
+    db.flush()
+    state = revisions.state_of(db_quotation, db_items)
+    revisions.record(db, account_id, {db_quotation.id: revisions.diff(revisions.EMPTY_STATE, state)},
+                     lambda ids: {db_quotation.id: state})
     db.commit()
     db.refresh(db_quotation)
+    events.publish(account_id, "quotation", db_quotation.id, "created")
+    _schedule_pdf_prerender(db, account_id, [db_quotation.id])
     return db_quotation
 
 def update_quotation(db: Session, quotation_id: int, quotation_in: schemas.QuotationUpdate, account_id: int):
-    db_quotation = get_quotation(db, quotation_id=quotation_id, account_id=account_id)
+    update_data = quotation_in.model_dump(exclude_unset=True)
+    if "items" not in update_data:
+        # Header-only update: keep the existing items instead of wiping them
+        return patch_quotation(db, quotation_id, quotation_in, account_id)
+
+    revisions.lock(db, [quotation_id])
+    db_quotation = get_quotation(db, quotation_id=quotation_id, account_id=account_id, include_archived=False)
     if not db_quotation:
         return None
+    previous_state = revisions.state_of(db_quotation)
 
     # 1. Update scalar fields from the input schema
-    update_data = quotation_in.dict(exclude_unset=True)
     for key, value in update_data.items():
         if hasattr(db_quotation, key) and key != "items":
             setattr(db_quotation, key, value)
@@ -308,7 +424,7 @@ def update_quotation(db: Session, quotation_id: int, quotation_in: schemas.Quota
     if quotation_in.items:
         for item_in in quotation_in.items:
             db_item = models.QuotationItem(
-                **item_in.dict(),
+                **item_in.model_dump(),
                 quotation_id=db_quotation.id,
                 total=item_in.unit_price * item_in.quantity
             )
@@ -325,86 +441,559 @@ def update_quotation(db: Session, quotation_id: int, quotation_in: schemas.Quota
     db_quotation.total_tax = total_tax
     db_quotation.total = total
 
-    # 5. Commit changes and refresh
+    # 5. Record the revision, commit and refresh
+    db.flush()
+    state = revisions.state_of(db_quotation, new_items)
+    revisions.record(db, account_id, {quotation_id: revisions.diff(previous_state, state)},
+                     lambda ids: {quotation_id: state})
     db.commit()
     db.refresh(db_quotation)
+    events.publish(account_id, "quotation", quotation_id, "updated")
+    _schedule_pdf_prerender(db, account_id, [quotation_id])
     return db_quotation
 
+def patch_quotation(db: Session, quotation_id: int, patch_in: schemas.QuotationPatch, account_id: int):
+    """
+    Updates only the supplied header fields with a single UPDATE; items are not touched.
+    Totals are recomputed in SQL only when the tax rate or the other charges change.
+    Returns None if the quotation does not exist in the account.
+    """
+    Q = models.Quotation
+    values = patch_in.model_dump(exclude_unset=True)
+    if "other_charges" in values and "tax_percentage" not in values:
+        # Subtotal and tax are unaffected, so the new total follows from the stored columns
+        values["total"] = Q.subtotal + Q.total_tax + values["other_charges"]
+    if values:
+        # The revision delta needs the previous values of the touched columns
+        columns = [getattr(Q, field) for field in values]
+        if "tax_percentage" in values:
+            columns += [Q.subtotal, Q.total_tax, Q.total]
+        previous = db.execute(
+            select(*columns).where(Q.id == quotation_id, Q.account_id == account_id).with_for_update()
+        ).first()
+        if previous is None:
+            return None
+        current = db.execute(
+            update(Q).where(Q.id == quotation_id, Q.account_id == account_id)
+            .values(**values).returning(*columns).execution_options(synchronize_session=False)
+        ).one()
+        if "tax_percentage" in values:
+            # The taxable amount is not stored, so the tax is recomputed from the items
+            current = (*current[:len(values)], *db.execute(
+                _recompute_totals_statement(quotation_id).returning(Q.subtotal, Q.total_tax, Q.total)
+            ).one())
+        header = {
+            column.key: revisions.encode_header_value(column.key, new)
+            for column, old, new in zip(columns, previous, current)
+            if revisions.encode_header_value(column.key, old) != revisions.encode_header_value(column.key, new)
+        }
+        revisions.record(db, account_id, {quotation_id: {"header": header} if header else {}},
+                         lambda ids: _quotation_states(db, account_id, ids))
+        db.commit()
+        events.publish(account_id, "quotation", quotation_id, "updated")
+        _schedule_pdf_prerender(db, account_id, [quotation_id])
+    return get_quotation(db, quotation_id=quotation_id, account_id=account_id)
+
+def update_quotations_status(db: Session, quotation_ids: list[int], status: str, account_id: int,
+                             from_statuses: tuple[str, ...] | None = None) -> int:
+    """
+    Moves all given quotations of the account (only those currently in `from_statuses`, if given)
+    to `status` in one UPDATE. Returns the number updated.
+    """
+    conditions = [models.Quotation.id.in_(quotation_ids), models.Quotation.account_id == account_id]
+    if from_statuses is not None:
+        conditions.append(models.Quotation.status.in_(from_statuses))
+    updated_ids = db.execute(
+        update(models.Quotation)
+        .where(*conditions)
+        .values(status=status)
+        .returning(models.Quotation.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    _record_status_revisions(db, account_id, updated_ids, status)
+    db.commit()
+    events.publish_many(account_id, "quotation", updated_ids, "updated")
+    if status == "sent":
+        _schedule_pdf_prerender(db, account_id, updated_ids)
+    return len(updated_ids)
+
+def _record_status_revisions(db: Session, account_id: int, quotation_ids: list[int], status: str):
+    revisions.record(db, account_id, {quotation_id: {"header": {"status": status}} for quotation_id in quotation_ids},
+                     lambda ids: _quotation_states(db, account_id, ids))
+
+def _quotation_states(db: Session, account_id: int, quotation_ids: list[int]) -> dict:
+    """Current revision states of the given quotations, reloaded from the database."""
+    Q = models.Quotation
+    quotations = db.execute(
+        select(Q).options(selectinload(Q.items))
+        .where(Q.id.in_(quotation_ids), Q.account_id == account_id)
+        .execution_options(populate_existing=True)
+    ).scalars().all()
+    return {quotation.id: revisions.state_of(quotation) for quotation in quotations}
+
+def _schedule_pdf_prerender(db: Session, account_id: int, quotation_ids: list[int]):
+    """With PDF_PRERENDER on, queues background renders; pending ones for the same quotation are coalesced."""
+    if pdf_store.PDF_PRERENDER_ENABLED and quotation_ids:
+        jobs.enqueue_coalesced(
+            db, "prerender_quotation_pdf", [{"quotation_id": quotation_id} for quotation_id in quotation_ids],
+            account_id=account_id, max_attempts=1, delay_seconds=pdf_store.PDF_PRERENDER_DELAY_SECONDS,
+        )
+
+def _recompute_totals_statement(quotation_id: int):
+    """UPDATE that recomputes a quotation's totals from its items entirely in SQL."""
+    subtotal = (
+        select(func.coalesce(func.sum(models.QuotationItem.total), 0.0))
+        .where(models.QuotationItem.quotation_id == quotation_id)
+        .scalar_subquery()
+    )
+    taxable_amount = (
+        select(func.coalesce(func.sum(models.QuotationItem.total), 0.0))
+        .where(models.QuotationItem.quotation_id == quotation_id, models.QuotationItem.is_taxable.is_(True))
+        .scalar_subquery()
+    )
+    total_tax = taxable_amount * models.Quotation.tax_percentage / 100
+    return (
+        update(models.Quotation)
+        .where(models.Quotation.id == quotation_id)
+        .values(subtotal=subtotal, total_tax=total_tax, total=subtotal + total_tax + models.Quotation.other_charges)
+    )
+
+def clone_quotation(db: Session, quotation_id: int, account_id: int, clone_in: schemas.QuotationClone):
+    """
+    Copies a quotation header and all of its items with INSERT ... SELECT statements in a
+    single transaction, so the rows never travel through Python. Returns None if not found.
+    """
+    # The source may be archived (see archive.py); the copy always goes to the working tables
+    Q, QI = models.Quotation, models.QuotationItem
+    if not db.query(Q.id).filter(Q.id == quotation_id, Q.account_id == account_id).first():
+        Q, QI = models.ArchivedQuotation, models.ArchivedQuotationItem
+        if not db.query(Q.id).filter(Q.id == quotation_id, Q.account_id == account_id).first():
+            return None
+
+    next_quotation_number = _get_next_quotation_number(db, account_id)
+
+    def override(column, value, type_):
+        return column if value is None else literal(value, type_)
+
+    # 1. Copy the header, applying the overrides
+    header_select = select(
+        literal(next_quotation_number, String),
+        override(Q.client_id, clone_in.client_id, Integer),
+        override(Q.user_id, clone_in.user_id, Integer),
+        Q.account_id,
+        literal(datetime.datetime.now(datetime.timezone.utc), DateTime),
+        override(Q.valid_until_date, clone_in.valid_until_date, DateTime),
+        Q.subtotal,
+        Q.tax_percentage,
+        Q.total_tax,
+        Q.other_charges,
+        Q.total,
+        literal(clone_in.status, String),
+    ).where(Q.id == quotation_id, Q.account_id == account_id)
+    header_columns = [
+        "quotation_number", "client_id", "user_id", "account_id", "created_date", "valid_until_date",
+        "subtotal", "tax_percentage", "total_tax", "other_charges", "total", "status",
+    ]
+    new_id = db.execute(insert(models.Quotation).from_select(header_columns, header_select).returning(models.Quotation.id)).scalar_one()
+
+    # 2. Copy the items, optionally re-pricing them from the current catalog
+    if clone_in.refresh_prices:
+        unit_price = func.coalesce(models.Product.price, QI.unit_price)
+        source = QI.__table__.outerjoin(
+            models.Product.__table__,
+            and_(models.Product.id == QI.product_id, models.Product.account_id == account_id),
+        )
+    else:
+        unit_price = QI.unit_price
+        source = QI.__table__
+    items_select = (
+        select(literal(new_id, Integer), QI.product_id, QI.description, unit_price, QI.quantity, QI.is_taxable, unit_price * QI.quantity)
+        .select_from(source)
+        .where(QI.quotation_id == quotation_id)
+        .order_by(QI.id)
+    )
+    item_columns = ["quotation_id", "product_id", "description", "unit_price", "quantity", "is_taxable", "total"]
+    db.execute(insert(models.QuotationItem).from_select(item_columns, items_select))
+
+    # 3. Prices may have changed, so the copied totals are recomputed from the new items
+    if clone_in.refresh_prices:
+        db.execute(_recompute_totals_statement(new_id))
+
+    # 4. The copy starts its own history
+    state = _quotation_states(db, account_id, [new_id])[new_id]
+    revisions.record(db, account_id, {new_id: revisions.diff(revisions.EMPTY_STATE, state)}, lambda ids: {new_id: state})
+
+    db.commit()
+    events.publish(account_id, "quotation", new_id, "created")
+    return get_quotation(db, quotation_id=new_id, account_id=account_id)
+
+def reprice_quotations(db: Session, quotation_ids: list[int], account_id: int):
+    """Sets item prices of the given quotations to the current Product.price and recomputes totals, in SQL."""
+    owned_ids = [
+        quotation_id for (quotation_id,) in db.query(models.Quotation.id).filter(
+            models.Quotation.id.in_(quotation_ids), models.Quotation.account_id == account_id
+        )
+    ]
+    if not owned_ids:
+        return 0
+    revisions.lock(db, owned_ids)
+    previous_states = _quotation_states(db, account_id, owned_ids)
+    current_price = (
+        select(models.Product.price)
+        .where(models.Product.id == models.QuotationItem.product_id, models.Product.account_id == account_id)
+        .scalar_subquery()
+    )
+    db.execute(
+        update(models.QuotationItem)
+        .where(models.QuotationItem.quotation_id.in_(owned_ids), current_price.is_not(None))
+        .values(unit_price=current_price, total=current_price * models.QuotationItem.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    for quotation_id in owned_ids:
+        db.execute(_recompute_totals_statement(quotation_id))
+    states = _quotation_states(db, account_id, owned_ids)
+    revisions.record(db, account_id, {
+        quotation_id: revisions.diff(previous_states[quotation_id], state) for quotation_id, state in states.items()
+    }, lambda ids: {quotation_id: states[quotation_id] for quotation_id in ids})
+    db.commit()
+    events.publish_many(account_id, "quotation", owned_ids, "updated")
+    return len(owned_ids)
+
 def delete_quotation(db: Session, quotation_id: int, account_id: int):
-    db_quotation = get_quotation(db, quotation_id=quotation_id, account_id=account_id)
-    if not db_quotation:
+    # A single DELETE; the items go with it via ON DELETE CASCADE
+    deleted = db.execute(
+        delete(models.Quotation).where(models.Quotation.id == quotation_id, models.Quotation.account_id == account_id)
+    ).rowcount
+    if not deleted:
+        deleted = db.execute(
+            delete(models.ArchivedQuotation)
+            .where(models.ArchivedQuotation.id == quotation_id, models.ArchivedQuotation.account_id == account_id)
+        ).rowcount
+    if not deleted:
         return None
-    
-    # Deletion of items is handled by cascade settings in a real app,
-    # but manual deletion is safer for now.
-    db.query(models.QuotationItem).filter(models.QuotationItem.quotation_id == quotation_id).delete()
-    db.delete(db_quotation)
     db.commit()
+    events.publish(account_id, "quotation", quotation_id, "deleted")
+    pdf_store.discard(quotation_id)
     return {"message": "Quotation deleted successfully"}
 
-# --- Company Profile Functions (Could be adapted for multi-tenancy) ---
-# These currently affect a single global profile.
+# --- Quotation Revision History (see revisions.py) ---
+
+def _revision_model(db: Session, quotation_id: int, account_id: int):
+    """Where the quotation's revisions are: they move to the archive with it (see archive.py)."""
+    R = models.QuotationRevision
+    if db.execute(select(R.id).where(R.quotation_id == quotation_id, R.account_id == account_id).limit(1)).first():
+        return R
+    return models.ArchivedQuotationRevision
+
+def get_quotation_revisions(db: Session, quotation_id: int, account_id: int):
+    """Revision summaries, newest first, or None if the quotation has no history in the account."""
+    R = _revision_model(db, quotation_id, account_id)
+    rows = db.execute(
+        select(R.revision, R.kind, R.created_at, R.summary)
+        .where(R.quotation_id == quotation_id, R.account_id == account_id)
+        .order_by(R.revision.desc())
+    ).all()
+    if not rows:
+        return None
+    return [
+        {"revision": row.revision, "kind": row.kind, "created_at": row.created_at, **orjson.loads(row.summary)}
+        for row in rows
+    ]
+
+def _revision_state(db: Session, quotation_id: int, revision: int, account_id: int):
+    R = _revision_model(db, quotation_id, account_id)
+    created_at = db.execute(
+        select(R.created_at).where(R.quotation_id == quotation_id, R.revision == revision, R.account_id == account_id)
+    ).scalar()
+    if created_at is None:
+        return None, None
+    return revisions.state_at(db, quotation_id, revision, R), created_at
+
+def get_quotation_revision(db: Session, quotation_id: int, revision: int, account_id: int):
+    state, created_at = _revision_state(db, quotation_id, revision, account_id)
+    if state is None:
+        return None
+    items = [
+        {**dict(zip(revisions.ITEM_FIELDS, values)), "position": position}
+        for position, values in enumerate(state["items"])
+    ]
+    return {"revision": revision, "created_at": created_at, **state["header"], "items": items}
+
+def diff_quotation_revisions(db: Session, quotation_id: int, from_revision: int, to_revision: int, account_id: int):
+    """What changed from one revision to another (either order), or None if either does not exist."""
+    old, _ = _revision_state(db, quotation_id, from_revision, account_id)
+    new, _ = _revision_state(db, quotation_id, to_revision, account_id)
+    if old is None or new is None:
+        return None
+    return {"from_revision": from_revision, "to_revision": to_revision, **revisions.compare(old, new)}
+
+# --- Quotation Expiry (see sweeper.py) ---
+
+EXPIRABLE_STATUSES = ("draft", "sent")
+EXPIRED_STATUS = "expired"
+
+def expire_account_quotations_chunk(db: Session, account_id: int, today: datetime.date, chunk_size: int = 1000) -> int:
+    """
+    Moves up to `chunk_size` of the account's draft/sent quotations whose validity ended before
+    `today` to `expired`, in one committed UPDATE (an index range scan on account/status/validity).
+    Returns how many were expired.
+    """
+    Q = models.Quotation
+    cutoff = datetime.datetime.combine(today, datetime.time.min)
+    overdue_ids = (
+        select(Q.id)
+        .where(Q.account_id == account_id, Q.status.in_(EXPIRABLE_STATUSES), Q.valid_until_date < cutoff)
+        .limit(chunk_size)
+    )
+    expired_ids = db.execute(
+        update(Q).where(Q.id.in_(overdue_ids)).values(status=EXPIRED_STATUS)
+        .returning(Q.id).execution_options(synchronize_session=False)
+    ).scalars().all()
+    _record_status_revisions(db, account_id, expired_ids, EXPIRED_STATUS)
+    db.commit()
+    events.publish_many(account_id, "quotation", expired_ids, "updated")
+    return len(expired_ids)
+
+def expire_overdue_quotations(db: Session, today: datetime.date | None = None, chunk_size: int = 1000,
+                              account_batch_size: int = 500):
+    """
+    Expires overdue quotations of every account, yielding (account_id, expired_count) for each
+    account that had any. Accounts are walked by keyset and quotations in chunks, so memory
+    stays constant regardless of table size.
+    """
+    today = today or datetime.date.today()
+    last_account_id = 0
+    while True:
+        account_ids = db.execute(
+            select(models.Account.id).where(models.Account.id > last_account_id)
+            .order_by(models.Account.id).limit(account_batch_size)
+        ).scalars().all()
+        if not account_ids:
+            return
+        for account_id in account_ids:
+            expired = 0
+            while chunk := expire_account_quotations_chunk(db, account_id, today, chunk_size):
+                expired += chunk
+            if expired:
+                yield account_id, expired
+        last_account_id = account_ids[-1]
+
+# --- Quotation Archival (see archive.py) ---
+
+ARCHIVABLE_STATUSES = ("accepted", "rejected", "expired")
+
+# Working table -> archive table, parents first
+_ARCHIVE_TABLES = (
+    (models.Quotation, models.ArchivedQuotation, models.Quotation.id),
+    (models.QuotationItem, models.ArchivedQuotationItem, models.QuotationItem.quotation_id),
+    (models.QuotationRevision, models.ArchivedQuotationRevision, models.QuotationRevision.quotation_id),
+)
+
+def archive_account_quotations_chunk(db: Session, account_id: int, cutoff: datetime.datetime, chunk_size: int = 500) -> int:
+    """
+    Moves up to `chunk_size` of the account's closed quotations created before `cutoff`, with
+    their items and revisions, to the archive tables in one committed transaction (copy with
+    INSERT ... SELECT, then DELETE), so an interrupted run leaves every quotation in exactly one
+    place and the next run resumes. Returns how many were moved.
+    """
+    Q = models.Quotation
+    candidates = (
+        select(Q.id)
+        .where(Q.account_id == account_id, Q.status.in_(ARCHIVABLE_STATUSES), Q.created_date < cutoff)
+        .order_by(Q.id).limit(chunk_size)
+        .with_for_update(skip_locked=True)  # rows being edited wait for the next run (no-op on SQLite)
+    )
+    quotation_ids = db.execute(candidates).scalars().all()
+    if not quotation_ids:
+        return 0
+    for source, target, key in _ARCHIVE_TABLES:
+        columns = [column.name for column in source.__table__.columns]
+        db.execute(insert(target).from_select(columns, select(*source.__table__.columns).where(key.in_(quotation_ids))))
+    # Items and revisions go with the quotations via ON DELETE CASCADE (delivery rows stay, as job history)
+    db.execute(delete(Q).where(Q.id.in_(quotation_ids)))
+    db.commit()
+    events.publish_many(account_id, "quotation", quotation_ids, "archived")
+    return len(quotation_ids)
+
+def archive_old_quotations(db: Session, cutoff: datetime.datetime, chunk_size: int = 500, account_batch_size: int = 500):
+    """
+    Archives closed quotations created before `cutoff` in every account, yielding
+    (account_id, archived_count) for each account that had any (walked like expire_overdue_quotations).
+    """
+    last_account_id = 0
+    while True:
+        account_ids = db.execute(
+            select(models.Account.id).where(models.Account.id > last_account_id)
+            .order_by(models.Account.id).limit(account_batch_size)
+        ).scalars().all()
+        if not account_ids:
+            return
+        for account_id in account_ids:
+            archived = 0
+            while chunk := archive_account_quotations_chunk(db, account_id, cutoff, chunk_size):
+                archived += chunk
+            if archived:
+                yield account_id, archived
+        last_account_id = account_ids[-1]
+
+# --- Company Profile and Terms Functions (Scoped by Account) ---
+# Both are read on every PDF render, so reads go through a per-account cache that is
+# validated against `Account.settings_version` (already loaded by auth on every request).
+# Update functions bump the version, which invalidates the copies held by other workers.
+
+_company_profile_cache = cache.VersionedCache()
+_terms_conditions_cache = cache.VersionedCache()
+
+def _invalidate_account_caches(account_id: int):
+    _company_profile_cache.invalidate(account_id)
+    _terms_conditions_cache.invalidate(account_id)
+
+def _bump_settings_version(db: Session, account_id: int):
+    db.query(models.Account).filter(models.Account.id == account_id).update(
+        {models.Account.settings_version: models.Account.settings_version + 1}
+    )
+    _invalidate_account_caches(account_id)
+
+def get_company_profile(db: Session, account: models.Account) -> schemas.CompanyProfile:
+    """Returns a detached snapshot of the account's company profile, without writing."""
+    profile = _company_profile_cache.get(account.id, account.settings_version)
+    if profile is None:
+        db_profile = db.query(models.CompanyProfile).filter(models.CompanyProfile.account_id == account.id).first()
+        if db_profile is None:
+            # Accounts created before profiles were per-account: serve defaults until the first save
+            db_profile = models.CompanyProfile(**DEFAULT_COMPANY_PROFILE, account_id=account.id)
+        profile = schemas.CompanyProfile.model_validate(db_profile)
+        _company_profile_cache.set(account.id, account.settings_version, profile)
+    return profile
 
-def get_company_profile(db: Session):
-    profile = db.query(models.CompanyProfile).first()
+def _get_or_create_company_profile_row(db: Session, account_id: int) -> models.CompanyProfile:
+    profile = db.query(models.CompanyProfile).filter(models.CompanyProfile.account_id == account_id).first()
     if not profile:
-        # If no profile exists, create a default one
-        default_profile = models.CompanyProfile(
-            company_name="",
-            address="",
-            phone="",
-            website="",
-            logo_path=""
-        )
-        db.add(default_profile)
-        db.commit()
-        db.refresh(default_profile)
-        return default_profile
+        profile = models.CompanyProfile(**DEFAULT_COMPANY_PROFILE, account_id=account_id)
+        db.add(profile)
     return profile
 
-def update_company_profile(db: Session, profile_in: schemas.CompanyProfileCreate):
-    profile = db.query(models.CompanyProfile).first()
-    if profile:
-        profile_data = profile_in.dict()
-        for key, value in profile_data.items():
-            setattr(profile, key, value)
-        db.commit()
-        db.refresh(profile)
+def update_company_profile(db: Session, account_id: int, profile_in: schemas.CompanyProfileCreate):
+    _bump_settings_version(db, account_id)  # first: it locks the account row, so two saves cannot both create the profile
+    profile = _get_or_create_company_profile_row(db, account_id)
+    profile_data = profile_in.model_dump(exclude_unset=True)
+    for key, value in profile_data.items():
+        setattr(profile, key, value)
+    db.commit()
+    db.refresh(profile)
+    events.publish(account_id, "company_profile", profile.id, "updated")
     return profile
 
-def update_logo_path(db: Session, logo_path: str):
-    profile = db.query(models.CompanyProfile).first()
-    if profile:
-        profile.logo_path = logo_path
-        db.commit()
-        db.refresh(profile)
+def update_logo_path(db: Session, account_id: int, logo_path: str):
+    _bump_settings_version(db, account_id)  # first: it locks the account row, so two saves cannot both create the profile
+    profile = _get_or_create_company_profile_row(db, account_id)
+    profile.logo_path = logo_path
+    db.commit()
+    db.refresh(profile)
+    events.publish(account_id, "company_profile", profile.id, "updated")
     return profile
 
-# --- Terms and Conditions Functions ---
-
-def get_or_create_terms_conditions(db: Session, account_id: int) -> models.TermsConditions:
-    """Gets the terms for an account, creating default ones if they don't exist."""
-    terms = db.query(models.TermsConditions).filter(models.TermsConditions.account_id == account_id).first()
-    if not terms:
-        default_content = (
-            "1. Al cliente se le cobrará 70 % después de aceptada esta cotización.\n"
-            "2. El pago será debitado antes de la entrega de bienes y servicios.\n"
-            "3. Por favor enviar la cotización firmada al email indicado anteriormente.\n"
-            "4. Esta cotización no incluye IVA si requiere Factura Favor de indicar."
-        )
-        terms = models.TermsConditions(content=default_content, account_id=account_id)
-        db.add(terms)
-        db.commit()
-        db.refresh(terms)
+def get_terms_conditions(db: Session, account: models.Account) -> schemas.TermsConditions:
+    """Returns a detached snapshot of the account's terms, falling back to the defaults without writing."""
+    terms = _terms_conditions_cache.get(account.id, account.settings_version)
+    if terms is None:
+        db_terms = db.query(models.TermsConditions).filter(models.TermsConditions.account_id == account.id).first()
+        if db_terms is None:
+            db_terms = models.TermsConditions(content=DEFAULT_TERMS_CONTENT, account_id=account.id)
+        terms = schemas.TermsConditions.model_validate(db_terms)
+        _terms_conditions_cache.set(account.id, account.settings_version, terms)
     return terms
 
 def update_terms_conditions(db: Session, account_id: int, terms_in: schemas.TermsConditionsUpdate) -> models.TermsConditions:
-    """Updates the terms and conditions for a specific account."""
-    db_terms = get_or_create_terms_conditions(db, account_id=account_id)
-    update_data = terms_in.dict(exclude_unset=True)
+    """Updates (or creates) the terms and conditions for a specific account."""
+    _bump_settings_version(db, account_id)  # first: locks the account row (see update_company_profile)
+    db_terms = db.query(models.TermsConditions).filter(models.TermsConditions.account_id == account_id).first()
+    if not db_terms:
+        db_terms = models.TermsConditions(content=DEFAULT_TERMS_CONTENT, account_id=account_id)
+        db.add(db_terms)
+    update_data = terms_in.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_terms, key, value)
-    db.add(db_terms)
     db.commit()
     db.refresh(db_terms)
+    events.publish(account_id, "terms_conditions", db_terms.id, "updated")
     return db_terms
+
+# --- Bootstrap Functions ---
+
+def get_quotation_editor_bootstrap(db: Session, account: models.Account, quotation_id: int | None = None):
+    """
+    Everything the quotation editor loads, from one session: one query per catalog, the cached
+    profile and terms, and (when editing) the quotation with its items. Returns None if
+    `quotation_id` is given but not found in the account.
+    """
+    quotation = None
+    if quotation_id is not None:
+        quotation = get_quotation(db, quotation_id=quotation_id, account_id=account.id, include_archived=False)
+        if quotation is None:
+            return None
+    return schemas.QuotationEditorBootstrap.model_validate({
+        "clients": get_clients(db, account_id=account.id),
+        "products": get_products(db, account_id=account.id),
+        "users": get_users_by_account(db, account_id=account.id),
+        "terms_conditions": get_terms_conditions(db, account=account),
+        "company_profile": get_company_profile(db, account=account),
+        "quotation": quotation,
+    }, from_attributes=True)
+
+# --- Background Job Functions (Scoped by Account) ---
+
+def get_jobs(db: Session, account_id: int, skip: int = 0, limit: int = 100):
+    return (
+        db.query(models.Job)
+        .filter(models.Job.account_id == account_id)
+        .order_by(models.Job.id.desc()).offset(skip).limit(limit).all()
+    )
+
+def get_job(db: Session, job_id: int, account_id: int, with_result: bool = False):
+    query = db.query(models.Job).filter(models.Job.id == job_id, models.Job.account_id == account_id)
+    if with_result:
+        query = query.options(undefer(models.Job.result))
+    return query.first()
+
+# --- Quotation Delivery Functions (see tasks.send_quotations) ---
+
+def get_quotation_deliveries(db: Session, job_id: int, account_id: int):
+    return (
+        db.query(models.QuotationDelivery)
+        .filter(models.QuotationDelivery.job_id == job_id, models.QuotationDelivery.account_id == account_id)
+        .order_by(models.QuotationDelivery.id).all()
+    )
+
+def prepare_quotation_deliveries(db: Session, job_id: int, account_id: int, quotation_ids: list[int]) -> list[models.QuotationDelivery]:
+    """
+    Creates the job's delivery rows on its first run, one per quotation of the account in the
+    order given, and returns the ones still pending (all of them, unless this is a retry).
+    """
+    D = models.QuotationDelivery
+    existing = set(db.execute(select(D.quotation_id).where(D.job_id == job_id)).scalars())
+    valid = set(db.execute(
+        select(models.Quotation.id).where(models.Quotation.id.in_(quotation_ids), models.Quotation.account_id == account_id)
+    ).scalars())
+    new_ids = [quotation_id for quotation_id in dict.fromkeys(quotation_ids) if quotation_id in valid and quotation_id not in existing]
+    if new_ids:
+        db.execute(insert(D), [dict(job_id=job_id, quotation_id=quotation_id, account_id=account_id, status="pending") for quotation_id in new_ids])
+        db.commit()
+    return db.query(D).filter(D.job_id == job_id, D.status == "pending").order_by(D.id).all()
+
+def update_quotation_delivery(db: Session, delivery_id: int, status: str, error: str | None = None,
+                              recipient: str | None = None, cc: str | None = None):
+    values = dict(status=status, error=error, recipient=recipient, cc=cc)
+    if status == "sent":
+        values["sent_at"] = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    db.execute(update(models.QuotationDelivery).where(models.QuotationDelivery.id == delivery_id).values(**values))
+    db.commit()
+
+def fail_pending_quotation_deliveries(db: Session, job_id: int, error: str):
+    D = models.QuotationDelivery
+    db.execute(update(D).where(D.job_id == job_id, D.status == "pending").values(status="failed", error=error))
+    db.commit()
+
+def get_sent_quotation_ids(db: Session, job_id: int) -> list[int]:
+    D = models.QuotationDelivery
+    return list(db.execute(select(D.quotation_id).where(D.job_id == job_id, D.status == "sent")).scalars())
@@ -1,8 +1,13 @@
 import os
+import sqlite3
+import threading
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
+
+import replicas
 
 load_dotenv() # Carga las variables de entorno desde .env
 
@@ -16,8 +21,143 @@ is_sqlite = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
 # Proporciona connect_args solo si es SQLite
 engine_args = {"connect_args": {"check_same_thread": False}} if is_sqlite else {}
 
+# --- SQLite Profile ---
+# "production": WAL journal, synchronous=NORMAL (no fsync per commit), busy timeout, memory-mapped
+# I/O and a larger page cache, plus a dedicated writer engine (see below).
+# "default": SQLite's stock settings (rollback journal, full fsync on every commit).
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+
+# Serializes writer transactions of this process, so concurrent requests queue on a lock
+# instead of spinning in SQLite's busy handler ("database is locked" storms).
+_sqlite_write_lock = threading.Lock()
+
+def _configure_sqlite(target_engine, writer: bool = False):
+    production = SQLITE_PROFILE == "production"
+
+    @event.listens_for(target_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        if writer:
+            # Let the "begin" hook below issue BEGIN IMMEDIATE instead of pysqlite's deferred BEGIN
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        # SQLite only enforces foreign keys (and therefore ON DELETE CASCADE) when asked to, per connection
+        cursor.execute("PRAGMA foreign_keys=ON")
+        if production:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    if not writer:
+        return
+
+    @event.listens_for(target_engine, "begin")
+    def _on_begin(conn):
+        if not _sqlite_write_lock.acquire(timeout=SQLITE_BUSY_TIMEOUT_MS / 1000):
+            raise sqlite3.OperationalError("database is locked (timed out waiting for the write lock)")
+        conn.info["holds_write_lock"] = True
+        try:
+            # Take SQLite's write lock up front: a deferred transaction that reads first and
+            # writes later fails immediately (SQLITE_BUSY_SNAPSHOT) if another writer got in between.
+            conn.connection.driver_connection.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            _release_write_lock(conn)
+            raise
+
+    # These hooks run before SQLAlchemy's own COMMIT/ROLLBACK, so they end the transaction
+    # themselves (the driver's commit()/rollback() is then a no-op) and only then release the lock.
+    @event.listens_for(target_engine, "commit")
+    def _on_commit(conn):
+        _end_transaction(conn, "COMMIT")
+
+    @event.listens_for(target_engine, "rollback")
+    def _on_rollback(conn):
+        _end_transaction(conn, "ROLLBACK")
+
+def _end_transaction(conn, statement: str):
+    try:
+        driver_connection = conn.connection.driver_connection
+        if driver_connection.in_transaction:
+            driver_connection.execute(statement)
+    finally:
+        _release_write_lock(conn)
+
+def _release_write_lock(conn):
+    if conn.info.pop("holds_write_lock", False):
+        _sqlite_write_lock.release()
+
 engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_args)
+# Engine for transactions that write. On PostgreSQL (or the default SQLite profile) it is the same engine.
+write_engine = engine
+
+if is_sqlite:
+    _configure_sqlite(engine)
+    if SQLITE_PROFILE == "production":
+        write_engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_args)
+        _configure_sqlite(write_engine, writer=True)
+
+# --- Read Replicas ---
+# Optional comma-separated URLs of read replicas; read-only sessions are routed to them (see replicas.py)
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+replica_engines = []
+for replica_url in DATABASE_REPLICA_URLS:
+    replica_engine = create_engine(replica_url, pool_pre_ping=True, **engine_args)
+    if replica_url.startswith("sqlite"):
+        _configure_sqlite(replica_engine)
+    replica_engines.append(replica_engine)
+
+replica_router = replicas.ReplicaRouter(primary=engine, replicas=replica_engines)
+
+class WriteSession(Session):
+    """
+    Session for requests and jobs that change data. It reads from the primary on the regular engine
+    until its first write (a flush, INSERT/UPDATE/DELETE or SELECT ... FOR UPDATE); from there to the
+    end of the transaction everything runs on the writer engine. On SQLite the write lock is thus
+    held from the first write to the commit, not while a request authenticates, validates, hashes a
+    password or processes an upload.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not self.info.get("writing"):
+            locking_read = getattr(clause, "_for_update_arg", None) is not None
+            if not (self._flushing or isinstance(clause, UpdateBase) or locking_read):
+                return engine
+            self.info["writing"] = True
+        return write_engine
+
+@event.listens_for(WriteSession, "after_transaction_end")
+def _end_writing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("writing", None)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=replicas.RoutingSession, router=replica_router)
+# Sessions for requests and jobs that change data
+WriteSessionLocal = sessionmaker(autocommit=False, autoflush=False, class_=WriteSession)
+
+@event.listens_for(WriteSessionLocal, "after_commit")
+def _remember_account_write(session):
+    # Read-your-writes: the account's next reads go to the primary for REPLICA_STICKY_SECONDS
+    if not replica_router.enabled:
+        return
+    account_key = session.info.get("account_key")
+    if account_key is not None:
+        replica_router.mark_written(account_key)
+    request_state = session.info.get("request_state")
+    if request_state is not None:
+        # Sent to the client as X-Primary-Until (see middleware.PrimaryUntilMiddleware)
+        request_state.primary_until = replicas.primary_until()
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def route_for_account(db, account_key: str):
+    """Tags the session with the account it serves and pins it to the primary if that account wrote recently."""
+    db.info["account_key"] = account_key
+    if replica_router.is_sticky(account_key):
+        db.info["use_primary"] = True
 
 Base = declarative_base()
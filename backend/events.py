@@ -0,0 +1,195 @@
+"""
+Per-account change feed, streamed to the browser by `GET /events` (Server-Sent Events).
+
+crud write functions call `publish()` after a successful commit. Each notification is
+compact (entity, id, action, version), so clients patch their local state or re-fetch
+a single row instead of polling whole lists.
+
+Fan-out backends (EVENTS_BACKEND):
+- "local" (default): in-process, for a single API process.
+- "postgres": PostgreSQL LISTEN/NOTIFY, so every worker process sees every change.
+
+Each subscriber has a bounded buffer. A client that falls behind gets a single
+"resync" event (it should re-fetch its lists) instead of growing memory without bound.
+"""
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "local")
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+EVENTS_SUBSCRIBER_BUFFER = int(os.getenv("EVENTS_SUBSCRIBER_BUFFER", "100"))
+EVENTS_PG_CHANNEL = "cotizaciones_events"
+EVENTS_PG_IDS_PER_NOTIFY = 500  # NOTIFY payloads are limited to 8000 bytes
+
+RESYNC = {"type": "resync"}
+
+# --- Subscribers ---
+
+class Subscriber:
+    def __init__(self, account_id: int, loop: asyncio.AbstractEventLoop, maxsize: int = EVENTS_SUBSCRIBER_BUFFER):
+        self.account_id = account_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def push(self, message: dict):
+        # Called from any thread (crud runs in the threadpool); the queue lives on the event loop
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message: dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout: float) -> dict | None:
+        """Next message, RESYNC after an overflow, or None when `timeout` passes (time for a heartbeat)."""
+        if self.overflowed:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.overflowed = False
+            return RESYNC
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class Broadcaster:
+    """Delivers messages to the subscribers of this process."""
+
+    def __init__(self):
+        self._subscribers: dict[int, set[Subscriber]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, account_id: int, loop: asyncio.AbstractEventLoop) -> Subscriber:
+        subscriber = Subscriber(account_id, loop)
+        with self._lock:
+            self._subscribers.setdefault(account_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.account_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.account_id]
+
+    def deliver(self, account_id: int, message: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(account_id, ()))
+        for subscriber in subscribers:
+            subscriber.push(message)
+
+# --- Fan-out Backends ---
+
+class LocalBackend:
+    def __init__(self, broadcaster: Broadcaster):
+        self.broadcaster = broadcaster
+
+    def start(self):
+        pass
+
+    def publish(self, account_id: int, message: dict, entity_ids: list):
+        for entity_id in entity_ids:
+            self.broadcaster.deliver(account_id, {**message, "id": entity_id})
+
+class PostgresBackend:
+    """
+    NOTIFY on publish; one LISTEN connection per process feeds the local broadcaster. A
+    notification carries the ids of every row the change touched (up to EVENTS_PG_IDS_PER_NOTIFY),
+    so a bulk update costs one NOTIFY, not one per row.
+    """
+
+    def __init__(self, broadcaster: Broadcaster, engine):
+        self.broadcaster = broadcaster
+        self.engine = engine
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if not self._started:
+                threading.Thread(target=self._listen, name="events-listener", daemon=True).start()
+                self._started = True
+
+    def publish(self, account_id: int, message: dict, entity_ids: list):
+        with self.engine.connect() as conn:
+            for start in range(0, len(entity_ids), EVENTS_PG_IDS_PER_NOTIFY):
+                payload = json.dumps({"account_id": account_id, "message": message,
+                                      "ids": entity_ids[start:start + EVENTS_PG_IDS_PER_NOTIFY]})
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": EVENTS_PG_CHANNEL, "payload": payload})
+            conn.commit()
+
+    def _listen(self):
+        while True:
+            try:
+                raw_connection = self.engine.raw_connection()
+                raw_connection.detach()  # held for the life of the process, outside the pool
+                connection = raw_connection.driver_connection
+                connection.autocommit = True
+                connection.cursor().execute(f"LISTEN {EVENTS_PG_CHANNEL}")
+                while True:
+                    if select.select([connection], [], [], EVENTS_HEARTBEAT_SECONDS) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        data = json.loads(notification.payload)
+                        for entity_id in data["ids"]:
+                            self.broadcaster.deliver(data["account_id"], {**data["message"], "id": entity_id})
+            except Exception:
+                logger.exception("Event listener connection lost; reconnecting")
+                time.sleep(1)
+
+broadcaster = Broadcaster()
+
+def _make_backend():
+    if EVENTS_BACKEND == "postgres":
+        from database import engine
+        return PostgresBackend(broadcaster, engine)
+    return LocalBackend(broadcaster)
+
+backend = _make_backend()
+
+# --- API ---
+
+def publish(account_id: int, entity: str, entity_id: int | None, action: str):
+    """Notifies the account's subscribers of a committed change. Never fails the calling write."""
+    publish_many(account_id, entity, [entity_id], action)
+
+def publish_many(account_id: int, entity: str, entity_ids, action: str):
+    """One event per id, sent to the other processes together (see PostgresBackend)."""
+    entity_ids = list(entity_ids)
+    if not entity_ids:
+        return
+    message = {"entity": entity, "action": action, "version": time.time_ns() // 1_000_000}
+    try:
+        backend.publish(account_id, message, entity_ids)
+    except Exception:
+        logger.exception("Could not publish %s %s event", entity, action)
+
+def subscribe(account_id: int) -> Subscriber:
+    backend.start()
+    return broadcaster.subscribe(account_id, asyncio.get_running_loop())
+
+def unsubscribe(subscriber: Subscriber):
+    broadcaster.unsubscribe(subscriber)
+
+def format_sse(message: dict) -> str:
+    if message is RESYNC:
+        return "event: resync\ndata: {}\n\n"
+    return f"id: {message['version']}\nevent: change\ndata: {json.dumps(message)}\n\n"
@@ -0,0 +1,125 @@
+"""
+Idempotency-Key support for create endpoints.
+
+The first request with a key inserts an `in_progress` row (the unique constraint on
+account + key makes that atomic), runs the write, then stores the serialized response.
+A retry with the same key replays the stored response without touching the data again;
+a duplicate that arrives while the first is still running waits for it (up to
+IDEMPOTENCY_WAIT_SECONDS, then 409). An `in_progress` row older than IDEMPOTENCY_LEASE_SECONDS
+belongs to a request that died, and the next duplicate takes it over. Rows expire after
+IDEMPOTENCY_TTL_HOURS (purged by jobs.run_maintenance).
+"""
+import datetime
+import hashlib
+import os
+import time
+from typing import Callable
+
+from fastapi import HTTPException
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.responses import Response
+
+import models
+
+# --- Configuration ---
+
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# How long a duplicate waits for the original request before answering 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+# When an unfinished request counts as abandoned. Far above any request's duration: taking over a
+# request that is merely slow would run the write twice
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "600"))
+IDEMPOTENCY_POLL_SECONDS = 0.1
+IN_PROGRESS, COMPLETED = "in_progress", "completed"
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+def request_hash(body) -> str:
+    return hashlib.blake2b(body.model_dump_json().encode(), digest_size=16).hexdigest()
+
+def _replay(record: models.IdempotencyKey) -> Response:
+    return Response(content=record.response_body, status_code=record.response_status,
+                    media_type="application/json", headers={"Idempotent-Replayed": "true"})
+
+# --- Execution ---
+
+def run(db: Session, account_id: int, key: str | None, endpoint: str, body, response_schema: type,
+        status_code: int, action: Callable):
+    """
+    Runs `action` (a create that commits and returns an ORM object) at most once per key.
+    Without a key it simply runs it and returns its result.
+    """
+    if not key:
+        return action()
+    fingerprint = request_hash(body)
+    record = _claim(db, account_id, key, endpoint, fingerprint)
+    if record is not None:
+        return _replay(record)
+
+    try:
+        result = action()
+    except BaseException:
+        # Nothing was stored: release the key so the client can retry
+        db.rollback()
+        db.execute(delete(models.IdempotencyKey).where(
+            models.IdempotencyKey.account_id == account_id, models.IdempotencyKey.key == key))
+        db.commit()
+        raise
+
+    content = response_schema.model_validate(result).model_dump_json().encode()
+    db.execute(
+        update(models.IdempotencyKey)
+        .where(models.IdempotencyKey.account_id == account_id, models.IdempotencyKey.key == key)
+        .values(status=COMPLETED, response_status=status_code, response_body=content)
+    )
+    db.commit()
+    return Response(content=content, status_code=status_code, media_type="application/json")
+
+def _claim(db: Session, account_id: int, key: str, endpoint: str, fingerprint: str) -> models.IdempotencyKey | None:
+    """Takes the key for this request (returns None), or returns the completed record to replay."""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        db.add(models.IdempotencyKey(account_id=account_id, key=key, endpoint=endpoint,
+                                     request_hash=fingerprint, status=IN_PROGRESS, created_at=_utcnow()))
+        try:
+            db.commit()
+            return None
+        except IntegrityError:
+            db.rollback()
+
+        record = db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.account_id == account_id, models.IdempotencyKey.key == key).first()
+        if record is None:
+            continue  # the original failed and released the key in between: try to take it
+        if record.endpoint != endpoint or record.request_hash != fingerprint:
+            db.rollback()
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        expired = record.created_at < _utcnow() - datetime.timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+        abandoned = record.status == IN_PROGRESS and record.created_at < _utcnow() - datetime.timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+        if record.status == COMPLETED and not expired:
+            db.expunge(record)
+            db.rollback()
+            return record
+        if expired or abandoned:
+            # Take over with a conditional UPDATE, so only one waiting duplicate wins
+            taken = db.execute(
+                update(models.IdempotencyKey)
+                .where(models.IdempotencyKey.id == record.id, models.IdempotencyKey.created_at == record.created_at)
+                .values(status=IN_PROGRESS, response_status=None, response_body=None, created_at=_utcnow())
+            ).rowcount
+            db.commit()
+            if taken:
+                return None
+            continue
+        # Still running elsewhere: end the transaction and wait
+        db.rollback()
+        if time.monotonic() > deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        time.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+def purge_expired(db: Session):
+    cutoff = _utcnow() - datetime.timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+    db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.created_at < cutoff))
@@ -0,0 +1,254 @@
+"""
+Persistent background job queue backed by the `jobs` table of the main database.
+
+No external broker is needed: the API enqueues rows, and workers claim them with a
+conditional UPDATE (so two workers never run the same job), execute the registered
+handler and store its status, progress and optional result blob.
+
+Workers run either as a separate process (`python worker.py --concurrency 4`) or as
+threads inside the API process (JOB_EMBEDDED_WORKERS=N).
+"""
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+import idempotency, models, ratelimit
+from database import SessionLocal, WriteSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_RETRY_MAX_SECONDS = int(os.getenv("JOB_RETRY_MAX_SECONDS", "3600"))
+JOB_RESULT_TTL_HOURS = int(os.getenv("JOB_RESULT_TTL_HOURS", "24"))
+JOB_EMBEDDED_WORKERS = int(os.getenv("JOB_EMBEDDED_WORKERS", "0"))
+MAINTENANCE_INTERVAL_SECONDS = 60
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+# --- Handler Registry ---
+
+_handlers: dict[str, Callable] = {}
+
+def handler(kind: str):
+    """Registers a function as the handler for jobs of `kind`. Handlers receive a JobContext."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+@dataclass
+class JobResult:
+    content: bytes
+    media_type: str
+    filename: str | None = None
+
+class PermanentJobError(Exception):
+    """Raised by handlers for failures that retrying cannot fix (e.g. the target row is gone)."""
+
+class JobContext:
+    def __init__(self, db: Session, job: models.Job):
+        self.db = db
+        self.job_id = job.id
+        self.account_id = job.account_id
+        self.payload = json.loads(job.payload or "{}")
+        # A failure now is final: handlers that track per-item state can settle it
+        self.last_attempt = job.attempts >= job.max_attempts
+
+    def progress(self, done: int, total: int, message: str | None = None):
+        """Records progress (and refreshes the lease) in its own short transaction."""
+        fraction = min(done / total, 1.0) if total else 0.0
+        with WriteSessionLocal() as session:
+            session.execute(
+                update(models.Job)
+                .where(models.Job.id == self.job_id)
+                .values(progress=fraction, progress_message=message, locked_at=_utcnow())
+            )
+            session.commit()
+
+# --- Queue Operations ---
+
+def enqueue(db: Session, kind: str, payload: dict | None = None, account_id: int | None = None,
+            max_attempts: int = 3, delay_seconds: int = 0) -> models.Job:
+    job = models.Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        account_id=account_id,
+        max_attempts=max_attempts,
+        run_at=_utcnow() + datetime.timedelta(seconds=delay_seconds),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def enqueue_coalesced(db: Session, kind: str, payloads: list[dict], account_id: int | None = None,
+                      max_attempts: int = 3, delay_seconds: int = 0) -> int:
+    """
+    Enqueues one job per payload unless an identical job is still queued (not yet running),
+    so repeated triggers for the same target collapse into one run. Returns the number enqueued.
+    """
+    encoded = list(dict.fromkeys(json.dumps(payload, sort_keys=True) for payload in payloads))
+    pending = {
+        payload for (payload,) in db.query(models.Job.payload).filter(
+            models.Job.kind == kind, models.Job.status == QUEUED, models.Job.payload.in_(encoded)
+        )
+    }
+    run_at = _utcnow() + datetime.timedelta(seconds=delay_seconds)
+    new_jobs = [
+        models.Job(kind=kind, payload=payload, account_id=account_id, max_attempts=max_attempts, run_at=run_at)
+        for payload in encoded if payload not in pending
+    ]
+    if new_jobs:
+        db.add_all(new_jobs)
+        db.commit()
+    return len(new_jobs)
+
+def claim_next(worker_id: str) -> int | None:
+    """Atomically moves the next due job to `running` and returns its id."""
+    now = _utcnow()
+    # Polling only reads, so idle workers never take the write lock (primary: replicas may not see new jobs yet)
+    with SessionLocal(info={"use_primary": True}) as db:
+        candidates = (
+            db.query(models.Job.id)
+            .filter(models.Job.status == QUEUED, models.Job.run_at <= now)
+            .order_by(models.Job.run_at, models.Job.id)
+            .limit(5)
+            .all()
+        )
+    if not candidates:
+        return None
+    with WriteSessionLocal() as db:
+        for (job_id,) in candidates:
+            claimed = db.execute(
+                update(models.Job)
+                .where(models.Job.id == job_id, models.Job.status == QUEUED)
+                .values(status=RUNNING, locked_by=worker_id, locked_at=now, attempts=models.Job.attempts + 1)
+            ).rowcount
+            db.commit()
+            if claimed:
+                return job_id
+    return None
+
+def run_job(job_id: int):
+    # Handlers get a writer session: it reads from the primary (a job usually follows the write that
+    # enqueued it) and only takes the writer engine at its first write, so a render holds no write lock.
+    # Status updates below are short transactions of their own.
+    with WriteSessionLocal() as db:
+        job = db.get(models.Job, job_id)
+        attempts, max_attempts = job.attempts, job.max_attempts
+        job_handler = _handlers.get(job.kind)
+        try:
+            if job_handler is None:
+                raise PermanentJobError(f"No handler registered for job kind '{job.kind}'")
+            result = job_handler(JobContext(db, job))
+        except Exception as exc:
+            db.rollback()
+            logger.exception("Job %s (%s) failed on attempt %s", job_id, job.kind, attempts)
+            _record_failure(job_id, exc, retry=not isinstance(exc, PermanentJobError) and attempts < max_attempts, attempts=attempts)
+            return
+
+    values = dict(status=SUCCEEDED, progress=1.0, finished_at=_utcnow(), locked_by=None, error=None)
+    if result is not None:
+        values.update(result=result.content, result_media_type=result.media_type, result_filename=result.filename)
+    with WriteSessionLocal() as db:
+        db.execute(update(models.Job).where(models.Job.id == job_id).values(**values))
+        db.commit()
+
+def _record_failure(job_id: int, exc: Exception, retry: bool, attempts: int):
+    error = "".join(traceback.format_exception_only(type(exc), exc)).strip()
+    if retry:
+        delay = min(JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), JOB_RETRY_MAX_SECONDS)
+        values = dict(status=QUEUED, error=error, locked_by=None, locked_at=None,
+                      run_at=_utcnow() + datetime.timedelta(seconds=delay))
+    else:
+        values = dict(status=FAILED, error=error, locked_by=None, finished_at=_utcnow())
+    with WriteSessionLocal() as db:
+        db.execute(update(models.Job).where(models.Job.id == job_id).values(**values))
+        db.commit()
+
+def run_maintenance(db: Session):
+    """Re-queues jobs whose worker died (expired lease) and purges old finished jobs, idempotency keys
+    and idle rate limit buckets."""
+    now = _utcnow()
+    stale = now - datetime.timedelta(seconds=JOB_LEASE_SECONDS)
+    running = (models.Job.status == RUNNING, models.Job.locked_at < stale)
+    db.execute(
+        update(models.Job).where(*running, models.Job.attempts >= models.Job.max_attempts)
+        .values(status=FAILED, error="Worker lease expired", locked_by=None, finished_at=now)
+    )
+    db.execute(
+        update(models.Job).where(*running).values(status=QUEUED, locked_by=None, locked_at=None, run_at=now)
+    )
+    expired = now - datetime.timedelta(hours=JOB_RESULT_TTL_HOURS)
+    db.query(models.Job).filter(
+        models.Job.status.in_((SUCCEEDED, FAILED)), models.Job.finished_at < expired
+    ).delete(synchronize_session=False)
+    idempotency.purge_expired(db)
+    ratelimit.purge_idle_buckets(db)
+    db.commit()
+
+# --- Workers ---
+
+def work(stop_event: threading.Event | None = None, poll_interval: float = JOB_POLL_INTERVAL, burst: bool = False):
+    """Worker loop: claims and runs jobs until stopped (or, with `burst`, until the queue is empty)."""
+    import tasks  # noqa: F401  (registers the job handlers)
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    last_maintenance = 0.0
+    while not (stop_event and stop_event.is_set()):
+        if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL_SECONDS:
+            with WriteSessionLocal() as db:
+                run_maintenance(db)
+            last_maintenance = time.monotonic()
+
+        job_id = claim_next(worker_id)
+        if job_id is None:
+            if burst:
+                return
+            if stop_event:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            continue
+        run_job(job_id)
+
+def start_embedded_workers(count: int = JOB_EMBEDDED_WORKERS) -> threading.Event:
+    """Starts `count` daemon worker threads in the current process. Set the returned event to stop them."""
+    stop_event = threading.Event()
+    for index in range(count):
+        threading.Thread(target=work, kwargs={"stop_event": stop_event}, name=f"job-worker-{index}", daemon=True).start()
+    return stop_event
+
+def run_worker(concurrency: int = 1, burst: bool = False):
+    """Entry point for the worker process; concurrency > 1 spawns one child process per slot."""
+    if concurrency <= 1:
+        work(burst=burst)
+        return
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=work, kwargs={"burst": burst}, name=f"job-worker-{index}") for index in range(concurrency)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
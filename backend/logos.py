@@ -0,0 +1,136 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image, UnidentifiedImageError
+
+import storage
+
+# --- Configuration ---
+
+# Local directory of the "uploads" storage namespace (see storage.py); served under /uploads
+UPLOAD_DIRECTORY = os.getenv("UPLOAD_DIRECTORY", "./uploads")
+
+MAX_LOGO_BYTES = int(os.getenv("MAX_LOGO_BYTES", str(5 * 1024 * 1024)))
+# Checked from the header before anything is decoded: a small, highly compressible file can
+# declare an enormous image, and the variants below never need more than a fraction of it
+MAX_LOGO_PIXELS = int(os.getenv("MAX_LOGO_PIXELS", str(25_000_000)))
+CHUNK_SIZE = 64 * 1024
+
+# Bounding boxes (width, height) for the pre-scaled variants.
+# The PDF header shows the logo at most 250x120 CSS px, so 2x keeps it sharp in print.
+LOGO_VARIANTS = {
+    "pdf": (500, 240),
+    "web": (690, 280),
+}
+
+_HASHED_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z]+$")
+_HASHED_VARIANT_NAME = re.compile(r"^[0-9a-f]{64}_[a-z]+\.png$")
+
+def upload_storage() -> storage.Storage:
+    return storage.get_storage("uploads", UPLOAD_DIRECTORY)
+
+# --- Naming Helpers ---
+
+def variant_filename(digest: str, variant: str) -> str:
+    return f"{digest}_{variant}.png"
+
+def variant_url(logo_path: str | None, variant: str) -> str | None:
+    """Returns the URL of a pre-scaled variant, or the original path for legacy uploads."""
+    if not logo_path:
+        return logo_path
+    directory, name = logo_path.rsplit("/", 1)
+    if not _HASHED_NAME.match(name):
+        return logo_path
+    digest = name.split(".", 1)[0]
+    return f"{directory}/{variant_filename(digest, variant)}"
+
+def is_content_addressed(filename: str) -> bool:
+    """True for files whose name is derived from their content, so they never change."""
+    return bool(_HASHED_NAME.match(filename) or _HASHED_VARIANT_NAME.match(filename))
+
+# --- Upload Pipeline ---
+
+def _spool_upload(file: UploadFile, max_bytes: int) -> tuple[str, str]:
+    """Streams the upload into a temp file, enforcing the byte cap. Returns (temp_path, sha256)."""
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El logo excede el tamaño máximo de {max_bytes // 1024} KB.",
+        )
+
+    digest = hashlib.sha256()
+    written = 0
+    fd, temp_path = tempfile.mkstemp(prefix="logo_", suffix=".upload")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while chunk := file.file.read(CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"El logo excede el tamaño máximo de {max_bytes // 1024} KB.",
+                    )
+                digest.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, digest.hexdigest()
+
+def _write_variant(image: Image.Image, size: tuple[int, int], store: storage.Storage, key: str):
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+    if variant.mode not in ("RGB", "RGBA"):
+        variant = variant.convert("RGBA")
+    encoded = io.BytesIO()
+    variant.save(encoded, format="PNG", optimize=True)
+    encoded.seek(0)
+    store.write(key, encoded)
+
+def save_logo(file: UploadFile, store: storage.Storage, max_bytes: int = MAX_LOGO_BYTES) -> str:
+    """
+    Stores an uploaded logo under its content hash and generates the scaled variants.
+    Returns the public URL path of the original file.
+    """
+    temp_path, digest = _spool_upload(file, max_bytes)
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"El logo excede el máximo de {MAX_LOGO_PIXELS // 1_000_000} megapíxeles.",
+    )
+    try:
+        try:
+            with Image.open(temp_path) as probe:
+                if probe.width * probe.height > MAX_LOGO_PIXELS:
+                    raise too_large
+                probe.verify()
+            image = Image.open(temp_path)
+            if image.format == "JPEG":
+                # Decode at the smallest DCT scale that still covers the largest variant
+                image.draft(None, tuple(max(sizes) for sizes in zip(*LOGO_VARIANTS.values())))
+            image.load()
+        except Image.DecompressionBombError:
+            raise too_large
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            raise HTTPException(status_code=400, detail="El archivo no es una imagen válida.")
+
+        extension = (image.format or "png").lower().replace("jpeg", "jpg")
+        filename = f"{digest}.{extension}"
+
+        # Identical content maps to the same name, so an existing file is already complete.
+        # The original is stored last, so its presence implies the variants are there too.
+        with image:
+            if store.exists(filename):
+                return f"/uploads/{filename}"
+            for variant, size in LOGO_VARIANTS.items():
+                _write_variant(image, size, store, variant_filename(digest, variant))
+        with open(temp_path, "rb") as source:
+            store.write(filename, source)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return f"/uploads/{filename}"
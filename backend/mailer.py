@@ -0,0 +1,141 @@
+"""
+Outgoing email over SMTP.
+
+Each worker thread keeps one SMTP connection open and reuses it for every message it sends,
+across jobs, instead of paying the TCP/TLS handshake and login per email. A connection idle
+for longer than SMTP_IDLE_CHECK_SECONDS is probed with NOOP before reuse, and it is replaced
+after SMTP_MAX_MESSAGES_PER_CONNECTION messages (many servers cap messages per session).
+
+Any SMTP server works, including a local stand-in for development and tests:
+    python -m aiosmtpd -n -l localhost:8025   (with SMTP_PORT=8025 SMTP_SECURITY=none)
+"""
+import os
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from email.utils import formataddr, getaddresses
+
+# --- Configuration ---
+
+SMTP_HOST = os.getenv("SMTP_HOST")  # unset: sending is disabled
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_SECURITY = os.getenv("SMTP_SECURITY", "starttls")  # starttls, ssl, none
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_FROM = os.getenv("SMTP_FROM", "cotizaciones@localhost")
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+SMTP_IDLE_CHECK_SECONDS = 30
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+
+def is_configured() -> bool:
+    return bool(SMTP_HOST)
+
+class PermanentDeliveryError(Exception):
+    """The server rejected the message itself (5xx): sending it again will fail the same way."""
+
+# --- Connection Pool ---
+
+class _PooledConnection:
+    def __init__(self):
+        if SMTP_SECURITY == "ssl":
+            self.smtp = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS)
+        else:
+            self.smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS)
+            if SMTP_SECURITY == "starttls":
+                self.smtp.starttls()
+        if SMTP_USERNAME:
+            self.smtp.login(SMTP_USERNAME, SMTP_PASSWORD or "")
+        self.messages = 0
+        self.last_used = time.monotonic()
+
+    def is_usable(self) -> bool:
+        if self.messages >= SMTP_MAX_MESSAGES_PER_CONNECTION:
+            return False
+        if time.monotonic() - self.last_used < SMTP_IDLE_CHECK_SECONDS:
+            return True
+        try:
+            return self.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+
+_local = threading.local()
+
+def _connection() -> _PooledConnection:
+    connection = getattr(_local, "connection", None)
+    if connection is not None and not connection.is_usable():
+        connection.close()
+        connection = None
+    if connection is None:
+        connection = _local.connection = _PooledConnection()
+    return connection
+
+def _discard_connection():
+    connection = getattr(_local, "connection", None)
+    _local.connection = None
+    if connection is not None:
+        connection.smtp.close()
+
+# --- Sending ---
+
+def send(message: EmailMessage) -> list[str]:
+    """
+    Sends the message on this thread's pooled connection. A connection the server dropped is
+    replaced once. Returns the Cc/Bcc addresses the server refused while accepting the message for
+    the others. Raises PermanentDeliveryError for rejections (including any To address refused),
+    other SMTP/socket errors otherwise.
+    """
+    for attempt in range(2):
+        connection = _connection()
+        try:
+            refused = connection.smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            _discard_connection()
+            if attempt:
+                raise
+            continue
+        except smtplib.SMTPRecipientsRefused as exc:
+            connection.last_used = time.monotonic()
+            raise PermanentDeliveryError(f"Destinatarios rechazados: {', '.join(exc.recipients)}") from exc
+        except smtplib.SMTPResponseException as exc:
+            if exc.smtp_code >= 500:
+                connection.last_used = time.monotonic()
+                raise PermanentDeliveryError(f"{exc.smtp_code} {exc.smtp_error.decode(errors='replace')}") from exc
+            _discard_connection()  # 4xx: transient, and the session may be in an unknown state
+            raise
+        except (smtplib.SMTPException, OSError):
+            _discard_connection()
+            raise
+        connection.messages += 1
+        connection.last_used = time.monotonic()
+        # Delivered to the other recipients: that only fails the message if a main recipient was refused
+        to = {address.lower() for _, address in getaddresses(message.get_all("To", []))}
+        refused_to = [address for address in refused if address.lower() in to]
+        if refused_to:
+            raise PermanentDeliveryError(f"Destinatarios rechazados: {', '.join(refused_to)}")
+        return list(refused)
+
+def quotation_message(quotation, company, pdf_bytes: bytes, filename: str) -> EmailMessage:
+    """The email carrying a quotation PDF to its client, CC'ing the advisor (who also gets replies)."""
+    message = EmailMessage()
+    message["Subject"] = " - ".join(filter(None, (f"Cotización {quotation.quotation_number}", company.company_name)))
+    message["From"] = formataddr((company.company_name, SMTP_FROM))
+    message["To"] = formataddr((quotation.client.contact_person or quotation.client.name, quotation.client.email))
+    if quotation.user is not None and quotation.user.email:
+        message["Cc"] = formataddr((quotation.user.full_name or "", quotation.user.email))
+        message["Reply-To"] = message["Cc"]
+    advisor = quotation.user.full_name if quotation.user is not None and quotation.user.full_name else company.company_name
+    message.set_content(
+        f"Estimado(a) {quotation.client.contact_person or quotation.client.name}:\n\n"
+        f"Adjuntamos la cotización {quotation.quotation_number} por un total de ${quotation.total:.2f}.\n\n"
+        f"Quedamos a sus órdenes para cualquier duda.\n\n"
+        f"{advisor}\n{company.company_name}\n{company.phone}\n"
+    )
+    message.add_attachment(pdf_bytes, maintype="application", subtype="pdf", filename=filename)
+    return message
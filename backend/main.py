@@ -1,32 +1,38 @@
-from fastapi import Depends, FastAPI, HTTPException, status, File, UploadFile
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, status, File, UploadFile
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import timedelta
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import StreamingResponse
-from weasyprint import HTML
-from jinja2 import Environment, FileSystemLoader
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+from contextlib import asynccontextmanager
 import io
-import shutil
-import os
 
-import crud, models, schemas, auth
-from database import SessionLocal, engine
+import crud, models, schemas, auth, events, idempotency, logos, mailer, middleware, migrations, jobs, pdf, ratelimit
+from responses import ORJSONResponse, etag_response, fingerprint_response, orm_list_response
+from database import SessionLocal, replica_router
 
-# --- Create database tables ---
-# This will create the tables based on the models in models.py
-models.Base.metadata.create_all(bind=engine)
+# --- Create or upgrade database tables ---
+# Creates the tables based on the models in models.py and migrates older databases (see migrations.py)
+migrations.upgrade()
 
 # --- Constants & Setup ---
-UPLOAD_DIRECTORY = "./uploads"
-if not os.path.exists(UPLOAD_DIRECTORY):
-    os.makedirs(UPLOAD_DIRECTORY)
 
-env = Environment(loader=FileSystemLoader('.'))
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Optionally run background job workers inside the API process (see jobs.py)
+    stop_workers = jobs.start_embedded_workers() if jobs.JOB_EMBEDDED_WORKERS > 0 else None
+    yield
+    if stop_workers is not None:
+        stop_workers.set()
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# --- Rate Limiting ---
+# Added before CORS so it runs inside it: 429 responses still carry the CORS headers
+if ratelimit.RATE_LIMIT_ENABLED:
+    app.add_middleware(ratelimit.RateLimitMiddleware)
 
 # --- CORS Middleware ---
 app.add_middleware(
@@ -35,10 +41,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Primary-Until"], # Read by the frontend: back off after 429/503, read-your-writes
 )
 
-# Mount static files directory
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIRECTORY), name="uploads")
+# --- Read Replicas ---
+if replica_router.enabled:
+    app.add_middleware(middleware.PrimaryUntilMiddleware)
+
+# --- Compression Middleware ---
+if middleware.COMPRESSION_ENABLED:
+    app.add_middleware(middleware.CompressionMiddleware)
+
+# Mount static files directory (with Cache-Control policies)
+app.mount("/uploads", middleware.StorageStaticFiles(logos.upload_storage()), name="uploads")
 
 # --- Authentication Endpoints ---
 
@@ -50,7 +65,7 @@ def create_account(account: schemas.AccountCreate, db: Session = Depends(auth.ge
     return crud.create_account(db=db, account=account)
 
 @app.post("/token", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(auth.get_db)):
+def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(auth.get_read_db)):
     account = crud.get_account_by_username(db, username=form_data.username)
     if not account or not crud.verify_password(form_data.password, account.hashed_password):
         raise HTTPException(
@@ -114,6 +129,7 @@ def delete_account_with_password_endpoint(
         account_id=account_id,
         admin_account=current_admin,
         password=request_body.password,
+        background=request_body.background,
     )
 
     if not success:
@@ -124,6 +140,8 @@ def delete_account_with_password_endpoint(
             detail="Contraseña incorrecta o cuenta inválida",
         )
 
+    if isinstance(success, models.Job):
+        return {"message": "La eliminación de la cuenta se está procesando", "job_id": success.id}
     return {"message": "Cuenta y todos los datos asociados eliminados con éxito"}
 
 # --- User (Asesor) Endpoints ---
@@ -132,17 +150,21 @@ def delete_account_with_password_endpoint(
 def create_user(
     user: schemas.UserCreate, 
     db: Session = Depends(auth.get_db), 
-    current_account: models.Account = Depends(auth.get_current_active_account)
+    current_account: models.Account = Depends(auth.get_current_active_account),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     # Optional: Check if email is already used within the same account
-    return crud.create_account_user(db=db, user=user, account_id=current_account.id)
+    return idempotency.run(
+        db, current_account.id, idempotency_key, "POST /users/", user, schemas.User, status.HTTP_201_CREATED,
+        lambda: crud.create_account_user(db=db, user=user, account_id=current_account.id),
+    )
 
 @app.get("/users/", response_model=List[schemas.User])
 def read_users(
     db: Session = Depends(auth.get_db), 
     current_account: models.Account = Depends(auth.get_current_active_account)
 ):
-    return crud.get_users_by_account(db, account_id=current_account.id)
+    return orm_list_response(schemas.User, crud.get_users_by_account(db, account_id=current_account.id))
 
 @app.put("/users/{user_id}", response_model=schemas.User)
 def update_user(
@@ -174,16 +196,20 @@ def delete_user(
 def create_client(
     client: schemas.ClientCreate, 
     db: Session = Depends(auth.get_db), 
-    current_account: models.Account = Depends(auth.get_current_active_account)
+    current_account: models.Account = Depends(auth.get_current_active_account),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    return crud.create_client(db=db, client=client, account_id=current_account.id)
+    return idempotency.run(
+        db, current_account.id, idempotency_key, "POST /clients/", client, schemas.Client, status.HTTP_201_CREATED,
+        lambda: crud.create_client(db=db, client=client, account_id=current_account.id),
+    )
 
 @app.get("/clients/", response_model=List[schemas.Client])
 def read_clients(
     db: Session = Depends(auth.get_db), 
     current_account: models.Account = Depends(auth.get_current_active_account)
 ):
-    return crud.get_clients(db, account_id=current_account.id)
+    return orm_list_response(schemas.Client, crud.get_clients(db, account_id=current_account.id))
 
 @app.get("/clients/{client_id}", response_model=schemas.Client)
 def read_client(
@@ -225,16 +251,20 @@ def delete_client(
 def create_product(
     product: schemas.ProductCreate, 
     db: Session = Depends(auth.get_db), 
-    current_account: models.Account = Depends(auth.get_current_active_account)
+    current_account: models.Account = Depends(auth.get_current_active_account),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    return crud.create_product(db=db, product=product, account_id=current_account.id)
+    return idempotency.run(
+        db, current_account.id, idempotency_key, "POST /products/", product, schemas.Product, status.HTTP_201_CREATED,
+        lambda: crud.create_product(db=db, product=product, account_id=current_account.id),
+    )
 
 @app.get("/products/", response_model=List[schemas.Product])
 def read_products(
     db: Session = Depends(auth.get_db), 
     current_account: models.Account = Depends(auth.get_current_active_account)
 ):
-    return crud.get_products(db, account_id=current_account.id)
+    return orm_list_response(schemas.Product, crud.get_products(db, account_id=current_account.id))
 
 @app.put("/products/{product_id}", response_model=schemas.Product)
 def update_product_endpoint(
@@ -259,20 +289,47 @@ def update_product_endpoint(
 def create_quotation(
     quotation: schemas.QuotationCreate, 
     db: Session = Depends(auth.get_db), 
-    current_account: models.Account = Depends(auth.get_current_active_account)
+    current_account: models.Account = Depends(auth.get_current_active_account),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     # Security check: Ensure the user (advisor) belongs to the current account
     user = db.query(models.User).filter(models.User.id == quotation.user_id, models.User.account_id == current_account.id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User (advisor) not found in this account")
-    return crud.create_quotation(db=db, quotation=quotation, user_id=user.id, account_id=current_account.id)
+    # Retries of the same submission (same Idempotency-Key) get the first response back
+    return idempotency.run(
+        db, current_account.id, idempotency_key, "POST /quotations/", quotation, schemas.Quotation, status.HTTP_201_CREATED,
+        lambda: crud.create_quotation(db=db, quotation=quotation, user_id=user.id, account_id=current_account.id),
+    )
+
+@app.post("/quotations/{quotation_id}/clone", response_model=schemas.Quotation, status_code=status.HTTP_201_CREATED)
+def clone_quotation(
+    quotation_id: int,
+    clone_in: Optional[schemas.QuotationClone] = None,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    clone_in = clone_in or schemas.QuotationClone()
+    # Security check: overrides must reference rows of the current account
+    if clone_in.user_id is not None and not crud.get_user(db, user_id=clone_in.user_id, account_id=current_account.id):
+        raise HTTPException(status_code=404, detail="User (advisor) not found in this account")
+    if clone_in.client_id is not None and not crud.get_client(db, client_id=clone_in.client_id, account_id=current_account.id):
+        raise HTTPException(status_code=404, detail="Client not found")
+    db_quotation = crud.clone_quotation(db, quotation_id=quotation_id, account_id=current_account.id, clone_in=clone_in)
+    if db_quotation is None:
+        raise HTTPException(status_code=404, detail="Quotation not found")
+    return db_quotation
 
 @app.get("/quotations/", response_model=List[schemas.Quotation])
 def read_quotations(
+    archived: bool = False,
     db: Session = Depends(auth.get_db), 
     current_account: models.Account = Depends(auth.get_current_active_account)
 ):
-    return crud.get_quotations(db, account_id=current_account.id)
+    """Active quotations, or with `archived=true` the ones moved to the archive (see archive.py)."""
+    if archived:
+        return orm_list_response(schemas.Quotation, crud.get_archived_quotations(db, account_id=current_account.id))
+    return orm_list_response(schemas.Quotation, crud.get_quotations(db, account_id=current_account.id))
 
 @app.get("/quotations/{quotation_id}", response_model=schemas.Quotation)
 def read_quotation(
@@ -302,6 +359,51 @@ def update_quotation_endpoint(
         raise HTTPException(status_code=404, detail="Quotation not found")
     return db_quotation
 
+@app.patch("/quotations/status")
+def update_quotations_status(
+    status_in: schemas.QuotationStatusUpdate,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    """Bulk status transition; ids that do not belong to the account are ignored."""
+    if not status_in.quotation_ids:
+        raise HTTPException(status_code=400, detail="No quotation ids given")
+    updated = crud.update_quotations_status(db, quotation_ids=status_in.quotation_ids, status=status_in.status, account_id=current_account.id)
+    return {"updated": updated}
+
+@app.post("/quotations/send", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+def send_quotations(
+    request_body: schemas.QuotationIdList,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Email the PDFs to the clients (CC the advisors) in the background; see GET /jobs/{id}/deliveries."""
+    if not mailer.is_configured():
+        raise HTTPException(status_code=503, detail="El envío de correo no está configurado")
+    # A retried submission must not email the clients twice
+    return idempotency.run(
+        db, current_account.id, idempotency_key, "POST /quotations/send", request_body, schemas.Job, status.HTTP_202_ACCEPTED,
+        lambda: _enqueue_quotation_job(db, "send_quotations", request_body, current_account.id),
+    )
+
+@app.patch("/quotations/{quotation_id}", response_model=schemas.Quotation)
+def patch_quotation(
+    quotation_id: int,
+    patch_in: schemas.QuotationPatch,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    # Security check: new references must point to rows of the current account
+    if patch_in.user_id is not None and not crud.get_user(db, user_id=patch_in.user_id, account_id=current_account.id):
+        raise HTTPException(status_code=404, detail="User (advisor) not found in this account")
+    if patch_in.client_id is not None and not crud.get_client(db, client_id=patch_in.client_id, account_id=current_account.id):
+        raise HTTPException(status_code=404, detail="Client not found")
+    db_quotation = crud.patch_quotation(db, quotation_id=quotation_id, patch_in=patch_in, account_id=current_account.id)
+    if db_quotation is None:
+        raise HTTPException(status_code=404, detail="Quotation not found")
+    return db_quotation
+
 @app.delete("/quotations/{quotation_id}", status_code=status.HTTP_200_OK)
 def delete_quotation(
     quotation_id: int, 
@@ -316,6 +418,7 @@ def delete_quotation(
 @app.get("/quotations/{quotation_id}/pdf")
 def generate_quotation_pdf(
     quotation_id: int, 
+    renderer: Optional[schemas.PdfRenderer] = None,
     db: Session = Depends(auth.get_db),
     current_account: models.Account = Depends(auth.get_current_active_account)
 ):
@@ -323,23 +426,160 @@ def generate_quotation_pdf(
     if not db_quotation:
         raise HTTPException(status_code=404, detail="Quotation not found")
 
-    company_profile = crud.get_company_profile(db)
-    terms_conditions = crud.get_or_create_terms_conditions(db, account_id=current_account.id)
-    
-    template = env.get_template("quotation_template.html")
-    html_out = template.render(
-        q=db_quotation, 
-        company=company_profile, 
-        terms=terms_conditions,
-        base_url=f"http://127.0.0.1:8000"
-    )
-
-    pdf_bytes = HTML(string=html_out, base_url=f"http://127.0.0.1:8000").write_pdf()
+    try:
+        pdf_bytes = pdf.get_or_render_quotation_pdf(db, db_quotation, current_account, renderer)
+    except pdf.PdfRenderLimitExceeded as exc:
+        # Retrying would hit the same limit (the job queue treats it as permanent too)
+        raise HTTPException(status_code=422, detail=str(exc))
 
     return StreamingResponse(
         io.BytesIO(pdf_bytes),
         media_type="application/pdf",
-        headers={"Content-Disposition": f"inline; filename=cotizacion_{db_quotation.quotation_number}.pdf"}
+        headers={"Content-Disposition": f"inline; filename={pdf.pdf_filename(db_quotation)}"}
+    )
+
+@app.get("/quotations/{quotation_id}/preview.png")
+def quotation_preview(
+    quotation_id: int,
+    request: Request,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    db_quotation = crud.get_quotation(db, quotation_id=quotation_id, account_id=current_account.id)
+    if not db_quotation:
+        raise HTTPException(status_code=404, detail="Quotation not found")
+    # The ETag is the fingerprint of the render inputs, so revalidation neither loads nor renders the image
+    fingerprint = pdf.preview_fingerprint(db, db_quotation, current_account)
+    return fingerprint_response(
+        request, fingerprint,
+        lambda: pdf.get_or_render_quotation_preview(db, db_quotation, current_account, fingerprint),
+        "image/png",
+    )
+
+# --- Quotation Revision History ---
+
+@app.get("/quotations/{quotation_id}/revisions", response_model=List[schemas.QuotationRevisionSummary])
+def list_quotation_revisions(
+    quotation_id: int,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    result = crud.get_quotation_revisions(db, quotation_id=quotation_id, account_id=current_account.id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Quotation not found")
+    return result
+
+@app.get("/quotations/{quotation_id}/revisions/diff", response_model=schemas.QuotationRevisionDiff)
+def diff_quotation_revisions(
+    quotation_id: int,
+    from_revision: int = Query(..., alias="from"),
+    to_revision: int = Query(..., alias="to"),
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    result = crud.diff_quotation_revisions(db, quotation_id, from_revision, to_revision, account_id=current_account.id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return result
+
+@app.get("/quotations/{quotation_id}/revisions/{revision}", response_model=schemas.QuotationRevision)
+def read_quotation_revision(
+    quotation_id: int,
+    revision: int,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    result = crud.get_quotation_revision(db, quotation_id, revision, account_id=current_account.id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return result
+
+# --- Bootstrap Endpoints ---
+
+@app.get("/bootstrap/quotation-editor", response_model=schemas.QuotationEditorBootstrap)
+def bootstrap_quotation_editor(
+    request: Request,
+    quotation_id: Optional[int] = None,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    """Clients, products, users, terms, company profile and optionally a quotation, in one response with an ETag."""
+    bootstrap = crud.get_quotation_editor_bootstrap(db, account=current_account, quotation_id=quotation_id)
+    if bootstrap is None:
+        raise HTTPException(status_code=404, detail="Quotation not found")
+    return etag_response(request, bootstrap.model_dump_json().encode())
+
+# --- Background Job Endpoints ---
+
+def _enqueue_quotation_job(db: Session, kind: str, request_body: schemas.QuotationIdList, account_id: int):
+    if not request_body.quotation_ids:
+        raise HTTPException(status_code=400, detail="No se indicaron cotizaciones")
+    return jobs.enqueue(db, kind, {"quotation_ids": request_body.quotation_ids}, account_id=account_id)
+
+@app.post("/jobs/quotations-pdf", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+def enqueue_quotations_pdf(
+    request_body: schemas.QuotationIdList,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    """Render one quotation (PDF result) or several (ZIP result) in the background."""
+    return _enqueue_quotation_job(db, "quotations_pdf", request_body, current_account.id)
+
+@app.post("/jobs/reprice-quotations", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+def enqueue_reprice_quotations(
+    request_body: schemas.QuotationIdList,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    """Re-price the items of the given quotations from the current product prices in the background."""
+    return _enqueue_quotation_job(db, "reprice_quotations", request_body, current_account.id)
+
+@app.get("/jobs/", response_model=List[schemas.Job])
+def read_jobs(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    return orm_list_response(schemas.Job, crud.get_jobs(db, account_id=current_account.id, skip=skip, limit=limit))
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+def read_job(
+    job_id: int,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    db_job = crud.get_job(db, job_id=job_id, account_id=current_account.id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return db_job
+
+@app.get("/jobs/{job_id}/deliveries", response_model=List[schemas.QuotationDelivery])
+def read_job_deliveries(
+    job_id: int,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    """Per-message status of a POST /quotations/send job."""
+    if crud.get_job(db, job_id=job_id, account_id=current_account.id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return orm_list_response(schemas.QuotationDelivery, crud.get_quotation_deliveries(db, job_id=job_id, account_id=current_account.id))
+
+@app.get("/jobs/{job_id}/result")
+def read_job_result(
+    job_id: int,
+    db: Session = Depends(auth.get_db),
+    current_account: models.Account = Depends(auth.get_current_active_account)
+):
+    db_job = crud.get_job(db, job_id=job_id, account_id=current_account.id, with_result=True)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if db_job.status != jobs.SUCCEEDED or db_job.result is None:
+        raise HTTPException(status_code=409, detail=f"Job has no result (status: {db_job.status})")
+    return Response(
+        content=db_job.result,
+        media_type=db_job.result_media_type,
+        headers={"Content-Disposition": f"attachment; filename={db_job.result_filename or f'job_{db_job.id}'}"}
     )
 
 # --- Company Profile Endpoints (Now Protected) ---
@@ -349,7 +589,7 @@ def get_company_profile_protected(
     db: Session = Depends(auth.get_db), 
     current_account: models.Account = Depends(auth.get_current_active_account)
 ):
-    return crud.get_company_profile(db)
+    return crud.get_company_profile(db, account=current_account)
 
 @app.put("/company-profile/", response_model=schemas.CompanyProfile)
 def update_company_profile_protected(
@@ -357,7 +597,7 @@ def update_company_profile_protected(
     db: Session = Depends(auth.get_db),
     current_account: models.Account = Depends(auth.get_current_active_account)
 ):
-    return crud.update_company_profile(db, profile_in)
+    return crud.update_company_profile(db, account_id=current_account.id, profile_in=profile_in)
 
 @app.post("/company-profile/logo", response_model=schemas.CompanyProfile)
 def upload_logo_protected(
@@ -365,12 +605,8 @@ def upload_logo_protected(
     db: Session = Depends(auth.get_db),
     current_account: models.Account = Depends(auth.get_current_active_account)
 ):
-    file_path = os.path.join(UPLOAD_DIRECTORY, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    logo_url_path = f"/uploads/{file.filename}"
-    return crud.update_logo_path(db, logo_path=logo_url_path)
+    logo_url_path = logos.save_logo(file, logos.upload_storage())
+    return crud.update_logo_path(db, account_id=current_account.id, logo_path=logo_url_path)
 
 # --- Terms and Conditions Endpoints ---
 
@@ -380,7 +616,7 @@ def get_terms_conditions(
     current_account: models.Account = Depends(auth.get_current_active_account)
 ):
     """Retrieve the terms and conditions for the current user's account."""
-    return crud.get_or_create_terms_conditions(db, account_id=current_account.id)
+    return crud.get_terms_conditions(db, account=current_account)
 
 @app.put("/terms-conditions/", response_model=schemas.TermsConditions)
 def update_terms_conditions_endpoint(
@@ -390,3 +626,39 @@ def update_terms_conditions_endpoint(
 ):
     """Update the terms and conditions for the current user's account."""
     return crud.update_terms_conditions(db, account_id=current_account.id, terms_in=terms_in)
+
+# --- Live Change Feed ---
+
+def _stream_account_id(token: Optional[str]) -> int:
+    # Short-lived session: the stream itself must not hold a connection open
+    with SessionLocal() as db:
+        return auth.account_from_token(db, token).id
+
+@app.get("/events")
+async def stream_events(
+    request: Request,
+    token: Optional[str] = None,
+    header_token: Optional[str] = Depends(auth.optional_oauth2_scheme),
+):
+    """
+    Server-Sent Events stream of the account's changes ("change" events with entity, id, action
+    and version, "resync" when the client fell behind). EventSource cannot set headers, so the
+    access token may also be given as `?token=`.
+    """
+    account_id = await run_in_threadpool(_stream_account_id, header_token or token)
+    subscriber = events.subscribe(account_id)
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                message = await subscriber.get(timeout=events.EVENTS_HEARTBEAT_SECONDS)
+                yield ": heartbeat\n\n" if message is None else events.format_sse(message)
+        finally:
+            events.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,218 @@
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.staticfiles import StaticFiles
+
+import logos
+import replicas
+import storage
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# --- Configuration ---
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Only text-like payloads are compressed; PDFs and raster images already are.
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+UPLOADS_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+UPLOADS_CACHE_MAX_AGE = int(os.getenv("UPLOADS_CACHE_MAX_AGE", "3600"))
+
+# --- Compressors ---
+
+class _GzipStream:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        output = self._compressor.compress(data)
+        return output + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class _BrotliStream:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        output = self._compressor.process(data)
+        return output + (self._compressor.finish() if final else self._compressor.flush())
+
+# --- Compression Middleware ---
+
+class CompressionMiddleware:
+    """
+    Negotiates brotli/gzip from Accept-Encoding and compresses compressible responses.
+    Complete bodies are compressed only above `minimum_size`; streamed bodies are
+    compressed chunk by chunk with a flush after each one, so clients still see data early.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+                 gzip_level: int = COMPRESSION_GZIP_LEVEL, brotli_quality: int = COMPRESSION_BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self._negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    @staticmethod
+    def _negotiate(accept_encoding: str) -> str | None:
+        accepted = set()
+        for token in accept_encoding.lower().split(","):
+            name, _, params = token.strip().partition(";")
+            if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                continue
+            accepted.add(name.strip())
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def make_stream(self, encoding: str):
+        if encoding == "br":
+            return _BrotliStream(self.brotli_quality)
+        return _GzipStream(self.gzip_level)
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start_message = None
+        self.passthrough = False
+        self.stream = None
+
+    async def send(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start_message = message
+            self.passthrough = not self._should_compress(Headers(raw=message["headers"]), message["status"])
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self._flush_start()
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.stream is None:
+            if not more_body:
+                # Whole body in one message: compress only if it is worth it
+                if len(body) < self.middleware.minimum_size:
+                    await self._flush_start()
+                    await self.downstream(message)
+                    return
+                body = self.middleware.make_stream(self.encoding).compress(body, final=True)
+                self._set_encoding_headers(content_length=len(body))
+                await self._flush_start()
+                await self.downstream({"type": "http.response.body", "body": body, "more_body": False})
+                return
+            self.stream = self.middleware.make_stream(self.encoding)
+            self._set_encoding_headers(content_length=None)
+            await self._flush_start()
+
+        chunk = self.stream.compress(body, final=not more_body)
+        await self.downstream({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def _should_compress(self, headers: Headers, status_code: int) -> bool:
+        if status_code in (204, 206, 304) or "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").lower()
+        # Server-Sent Events must reach the client as soon as they are written
+        if content_type.startswith("text/event-stream") or not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        content_length = headers.get("content-length")
+        if content_length is not None and int(content_length) < self.middleware.minimum_size:
+            return False
+        return True
+
+    def _set_encoding_headers(self, content_length: int | None):
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if content_length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+
+    async def _flush_start(self):
+        if self.start_message is not None:
+            await self.downstream(self.start_message)
+            self.start_message = None
+
+# --- Read-Your-Writes Header ---
+
+class PrimaryUntilMiddleware:
+    """Adds X-Primary-Until to responses of requests whose writer session committed (see replicas.py)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                primary_until = scope.get("state", {}).get("primary_until")
+                if primary_until is not None:
+                    MutableHeaders(scope=message).append(replicas.PRIMARY_UNTIL_HEADER, primary_until)
+            await send(message)
+
+        await self.app(scope, receive, send_with_header)
+
+# --- Static Uploads ---
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with Cache-Control: content-hashed uploads are immutable, the rest revalidate hourly."""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if logos.is_content_addressed(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = UPLOADS_IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers["Cache-Control"] = f"public, max-age={UPLOADS_CACHE_MAX_AGE}"
+        return response
+
+class StorageStaticFiles(CachedStaticFiles):
+    """
+    CachedStaticFiles over a storage.Storage instead of a directory: files are served from the
+    local copy the storage provides (the file itself, or the node's cached copy of an S3 object).
+    """
+
+    def __init__(self, store: storage.Storage):
+        super().__init__(directory=None, check_dir=False)
+        self.store = store
+
+    def lookup_path(self, path: str):
+        try:
+            full_path = self.store.local_path(path)
+            return full_path, os.stat(full_path)
+        except (FileNotFoundError, ValueError):
+            return "", None
@@ -0,0 +1,243 @@
+"""
+Schema migrations.
+
+`Base.metadata.create_all` creates missing tables but never changes an existing one, so a database
+created by an earlier version keeps its old columns, foreign keys and indexes. `upgrade()` runs at
+startup (API, worker and maintenance scripts) and:
+
+1. creates the missing tables;
+2. applies the MIGRATIONS not yet recorded in `schema_migrations`, in order, each in its own
+   transaction. A brand-new database already has the current schema, so they are only recorded;
+3. creates declared indexes that existing tables lack.
+
+Migrations check before they alter, so they are also safe on a database that create_all built from
+a newer model before this module existed. SQLite cannot change a foreign key or add AUTOINCREMENT
+in place: those tables are rebuilt from their current model (see _rebuild_table), with foreign keys
+off so dropping the old table does not cascade.
+"""
+import logging
+from contextlib import contextmanager
+from typing import Callable
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, delete, insert, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+import models
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+_schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+)
+
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = []
+
+def migration(version: int, name: str):
+    def register(function: Callable[[Connection], None]):
+        MIGRATIONS.append((version, name, function))
+        return function
+    return register
+
+# --- Running ---
+
+def upgrade(bind: Engine = engine):
+    """Brings the database to the current schema. Takes the regular (not the writer) engine."""
+    fresh = not inspect(bind).has_table(models.Account.__tablename__)
+    models.Base.metadata.create_all(bind=bind)
+    _schema_migrations.create(bind, checkfirst=True)
+    with bind.connect() as connection:
+        applied = set(connection.execute(select(_schema_migrations.c.version)).scalars())
+
+    for version, name, function in sorted(MIGRATIONS, key=lambda entry: entry[0]):
+        if version in applied:
+            continue
+        with _transaction(bind) as connection:
+            if connection.execute(select(_schema_migrations.c.version).where(_schema_migrations.c.version == version)).first():
+                continue  # applied by another process in the meantime
+            if not fresh:
+                logger.info("Applying migration %s: %s", version, name)
+                function(connection)
+            connection.execute(insert(_schema_migrations).values(version=version, name=name))
+
+    _create_missing_indexes(bind)
+
+@contextmanager
+def _transaction(bind: Engine):
+    """A transaction that also covers DDL and excludes other migrating processes."""
+    with bind.connect() as connection:
+        if bind.dialect.name != "sqlite":
+            with connection.begin():
+                connection.execute(text(f"LOCK TABLE {_schema_migrations.name} IN EXCLUSIVE MODE"))
+                yield connection
+            return
+
+        driver_connection = connection.connection.driver_connection
+        isolation_level = driver_connection.isolation_level
+        # pysqlite commits before every DDL statement unless it leaves transactions to us
+        driver_connection.isolation_level = None
+        # Ignored inside a transaction, so it goes first
+        driver_connection.execute("PRAGMA foreign_keys=OFF")
+        try:
+            driver_connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                driver_connection.execute("COMMIT")
+            except BaseException:
+                if driver_connection.in_transaction:
+                    driver_connection.execute("ROLLBACK")
+                raise
+        finally:
+            driver_connection.execute("PRAGMA foreign_keys=ON")
+            driver_connection.isolation_level = isolation_level
+
+def _create_missing_indexes(bind: Engine):
+    inspector = inspect(bind)
+    for table in models.Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info("Creating index %s", index.name)
+                index.create(bind, checkfirst=True)
+
+# --- Helpers ---
+
+def _is_sqlite(connection: Connection) -> bool:
+    return connection.dialect.name == "sqlite"
+
+def _column_names(connection: Connection, table_name: str) -> set[str]:
+    return {column["name"] for column in inspect(connection).get_columns(table_name)}
+
+def _add_column(connection: Connection, table: Table, column_name: str):
+    """ALTER TABLE ... ADD COLUMN from the model's definition (including its server default)."""
+    if column_name in _column_names(connection, table.name):
+        return
+    column_ddl = CreateColumn(table.c[column_name]).compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+
+def _rebuild_table(connection: Connection, table: Table):
+    """
+    SQLite only: recreates `table` from its current model definition, keeping its rows and ids.
+    Columns the old table lacks get their server default. Does nothing if it already matches.
+    """
+    create_ddl = str(CreateTable(table).compile(dialect=connection.dialect)).strip()
+    current_ddl = connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+    ).scalar()
+    # A table renamed into place is stored with its name quoted
+    current_ddl = current_ddl.replace(f'"{table.name}"', table.name, 1)
+    if " ".join(current_ddl.split()) == " ".join(create_ddl.split()):
+        return
+
+    new_name = f"_{table.name}_new"
+    old_columns = _column_names(connection, table.name)
+    columns = ", ".join(column.name for column in table.columns if column.name in old_columns)
+    connection.execute(text(create_ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {new_name} ", 1)))
+    connection.execute(text(f"INSERT INTO {new_name} ({columns}) SELECT {columns} FROM {table.name}"))
+    connection.execute(text(f"DROP TABLE {table.name}"))
+    connection.execute(text(f"ALTER TABLE {new_name} RENAME TO {table.name}"))
+    for index in table.indexes:
+        index.create(connection)
+
+def _foreign_key(connection: Connection, table: Table, column_name: str) -> dict | None:
+    for foreign_key in inspect(connection).get_foreign_keys(table.name):
+        if foreign_key["constrained_columns"] == [column_name]:
+            return foreign_key
+    return None
+
+def _set_on_delete(connection: Connection, table: Table, column_name: str, ondelete: str):
+    """PostgreSQL: replaces the foreign key on `column_name` with one using the given ON DELETE."""
+    foreign_key = _foreign_key(connection, table, column_name)
+    if foreign_key is None or (foreign_key["options"].get("ondelete") or "").upper() == ondelete:
+        return
+    referred = f'{foreign_key["referred_table"]} ({", ".join(foreign_key["referred_columns"])})'
+    connection.execute(text(
+        f'ALTER TABLE {table.name} DROP CONSTRAINT "{foreign_key["name"]}", '
+        f"ADD FOREIGN KEY ({column_name}) REFERENCES {referred} ON DELETE {ondelete}"
+    ))
+
+def _drop_foreign_key(connection: Connection, table: Table, column_name: str):
+    """PostgreSQL: drops the foreign key on `column_name`, if any."""
+    foreign_key = _foreign_key(connection, table, column_name)
+    if foreign_key is not None:
+        connection.execute(text(f'ALTER TABLE {table.name} DROP CONSTRAINT "{foreign_key["name"]}"'))
+
+# --- Migrations ---
+
+@migration(1, "Per-account company profiles and settings_version")
+def _per_account_company_profiles(connection: Connection):
+    accounts = models.Account.__table__
+    profiles = models.CompanyProfile.__table__
+    _add_column(connection, accounts, "settings_version")
+    if _is_sqlite(connection):
+        _rebuild_table(connection, accounts)  # AUTOINCREMENT
+        _rebuild_table(connection, profiles)  # SQLite cannot ADD a UNIQUE column
+    elif "account_id" not in _column_names(connection, profiles.name):
+        connection.execute(text(
+            "ALTER TABLE company_profiles ADD COLUMN account_id INTEGER UNIQUE "
+            "REFERENCES accounts (id) ON DELETE CASCADE"
+        ))
+
+    # The profile used to be a single row shared by everyone: each account starts from a copy of it
+    fields = (profiles.c.company_name, profiles.c.address, profiles.c.phone, profiles.c.website, profiles.c.logo_path)
+    legacy = connection.execute(
+        select(*fields).where(profiles.c.account_id.is_(None)).order_by(profiles.c.id)
+    ).mappings().first()
+    if legacy is None:
+        return
+    without_profile = connection.execute(
+        select(accounts.c.id).where(~select(profiles.c.id).where(profiles.c.account_id == accounts.c.id).exists())
+    ).scalars().all()
+    if without_profile:
+        connection.execute(insert(profiles), [{**legacy, "account_id": account_id} for account_id in without_profile])
+    connection.execute(delete(profiles).where(profiles.c.account_id.is_(None)))
+
+@migration(2, "ON DELETE CASCADE from quotations to their items")
+def _cascade_quotation_items(connection: Connection):
+    items = models.QuotationItem.__table__
+    # Items of quotations deleted before: the cascade would have removed them
+    orphaned = connection.execute(text(
+        "DELETE FROM quotation_items WHERE quotation_id IS NOT NULL "
+        "AND quotation_id NOT IN (SELECT id FROM quotations)"
+    )).rowcount
+    if orphaned:
+        logger.info("Removed %s quotation items without a quotation", orphaned)
+    if _is_sqlite(connection):
+        _rebuild_table(connection, items)
+    else:
+        _set_on_delete(connection, items, "quotation_id", "CASCADE")
+
+@migration(3, "Per-account PDF renderer choice")
+def _company_profile_pdf_renderer(connection: Connection):
+    _add_column(connection, models.CompanyProfile.__table__, "pdf_renderer")
+
+@migration(4, "Never reuse the ids of archived quotations")
+def _archived_ids_never_reused(connection: Connection):
+    if not _is_sqlite(connection):
+        return  # PostgreSQL sequences never go back
+    for table, archive_table in (
+        (models.Quotation.__table__, models.ArchivedQuotation.__table__),
+        (models.QuotationItem.__table__, models.ArchivedQuotationItem.__table__),
+        (models.QuotationRevision.__table__, models.ArchivedQuotationRevision.__table__),
+    ):
+        _rebuild_table(connection, table)
+        # Without AUTOINCREMENT, ids archived so far above the working table's maximum were free again
+        archived_max = connection.execute(text(f"SELECT max(id) FROM {archive_table.name}")).scalar()
+        if archived_max is None:
+            continue
+        sequence = connection.execute(text("SELECT seq FROM sqlite_sequence WHERE name = :name"), {"name": table.name}).scalar()
+        if sequence is None:
+            connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), {"name": table.name, "seq": archived_max})
+        elif sequence < archived_max:
+            connection.execute(text("UPDATE sqlite_sequence SET seq = :seq WHERE name = :name"), {"name": table.name, "seq": archived_max})
+
+@migration(5, "Keep quotation deliveries when their quotation is archived or deleted")
+def _detach_quotation_deliveries(connection: Connection):
+    deliveries = models.QuotationDelivery.__table__
+    if _is_sqlite(connection):
+        _rebuild_table(connection, deliveries)
+    else:
+        _drop_foreign_key(connection, deliveries, "quotation_id")
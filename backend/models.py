@@ -1,8 +1,9 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, UniqueConstraint, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, UniqueConstraint, Text, LargeBinary, Index
+from sqlalchemy.orm import relationship, deferred
 import datetime
 
 from database import Base
+import logos
 
 # The Account model represents the primary user/business owner (Titular).
 # This is the user that will log in and own all the data.
@@ -14,13 +15,21 @@ class Account(Base):
     full_name = Column(String)
     hashed_password = Column(String)
     role = Column(String, default="user") # e.g., 'admin', 'user'
+    # Bumped whenever the company profile or terms change; used to validate cached copies across workers
+    settings_version = Column(Integer, default=0, server_default="0", nullable=False)
 
     # Relationships: An account owns users (advisors), clients, products, and quotations.
-    users = relationship("User", back_populates="account", cascade="all, delete-orphan")
-    clients = relationship("Client", back_populates="account", cascade="all, delete-orphan")
-    products = relationship("Product", back_populates="account", cascade="all, delete-orphan")
-    quotations = relationship("Quotation", back_populates="account", cascade="all, delete-orphan")
-    terms_conditions = relationship("TermsConditions", back_populates="account", uselist=False, cascade="all, delete-orphan")
+    # Deletes cascade in the database (ON DELETE CASCADE); passive_deletes stops the ORM
+    # from loading every child row just to delete it one by one.
+    users = relationship("User", back_populates="account", cascade="all, delete-orphan", passive_deletes=True)
+    clients = relationship("Client", back_populates="account", cascade="all, delete-orphan", passive_deletes=True)
+    products = relationship("Product", back_populates="account", cascade="all, delete-orphan", passive_deletes=True)
+    quotations = relationship("Quotation", back_populates="account", cascade="all, delete-orphan", passive_deletes=True)
+    terms_conditions = relationship("TermsConditions", back_populates="account", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+    company_profile = relationship("CompanyProfile", back_populates="account", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+
+    # Never reuse the id of a deleted account on SQLite (per-account caches are keyed by id)
+    __table_args__ = {"sqlite_autoincrement": True}
 
 class CompanyProfile(Base):
     __tablename__ = "company_profiles"
@@ -31,9 +40,19 @@ class CompanyProfile(Base):
     phone = Column(String, default="[871]-1882233")
     website = Column(String, default="FB Multiserv Galag")
     logo_path = Column(String, nullable=True)
-    # In a multi-tenant setup, this could also be linked to an Account
-    # account_id = Column(Integer, ForeignKey("accounts.id"))
-    # account = relationship("Account")
+    pdf_renderer = Column(String, nullable=True)  # None: the server default (see pdf.py)
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), unique=True)
+
+    account = relationship("Account", back_populates="company_profile")
+
+    # Pre-scaled variants generated at upload time (see logos.py)
+    @property
+    def logo_pdf_path(self):
+        return logos.variant_url(self.logo_path, "pdf")
+
+    @property
+    def logo_web_path(self):
+        return logos.variant_url(self.logo_path, "web")
 
 # The User model now represents a Sales Advisor (Asesor) belonging to an Account.
 class User(Base):
@@ -45,7 +64,7 @@ class User(Base):
     phone = Column(String, nullable=True) # Asesor's phone
     hashed_password = Column(String) # Password for the advisor, if they get login rights in the future.
     is_active = Column(Boolean, default=True)
-    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"))
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), index=True)
 
     account = relationship("Account", back_populates="users")
 
@@ -61,7 +80,7 @@ class Client(Base):
     contact_person = Column(String, nullable=True)
     email = Column(String, nullable=True)
     phone = Column(String, nullable=True)
-    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"))
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), index=True)
 
     account = relationship("Account", back_populates="clients")
 
@@ -73,7 +92,7 @@ class Product(Base):
     name = Column(String, index=True)
     description = Column(String, nullable=True)
     price = Column(Float)
-    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"))
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), index=True)
 
     account = relationship("Account", back_populates="products")
 
@@ -84,7 +103,7 @@ class Quotation(Base):
     quotation_number = Column(String, index=True) # No longer globally unique
     client_id = Column(Integer, ForeignKey("clients.id"))
     user_id = Column(Integer, ForeignKey("users.id")) # The advisor who created it
-    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE")) # The account it belongs to
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), index=True) # The account it belongs to
     created_date = Column(DateTime, default=datetime.datetime.utcnow)
     valid_until_date = Column(DateTime)
     subtotal = Column(Float)
@@ -92,20 +111,28 @@ class Quotation(Base):
     total_tax = Column(Float)
     other_charges = Column(Float, default=0)
     total = Column(Float)
-    status = Column(String, default="draft") # e.g., draft, sent, accepted, rejected
+    status = Column(String, default="draft") # e.g., draft, sent, accepted, rejected, expired (set by sweeper.py)
 
     client = relationship("Client")
     user = relationship("User")
     account = relationship("Account", back_populates="quotations")
-    items = relationship("QuotationItem", back_populates="quotation")
+    items = relationship("QuotationItem", back_populates="quotation", cascade="all, delete-orphan", passive_deletes=True)
+
+    archived = False  # see ArchivedQuotation
 
-    __table_args__ = (UniqueConstraint('account_id', 'quotation_number', name='_account_quotation_uc'),)
+    __table_args__ = (
+        UniqueConstraint('account_id', 'quotation_number', name='_account_quotation_uc'),
+        # Serves per-account status/validity filters and the expiry sweep
+        Index("ix_quotations_account_status_valid_until", "account_id", "status", "valid_until_date"),
+        # Ids move to the archive tables with their rows: SQLite must never hand them out again
+        {"sqlite_autoincrement": True},
+    )
 
 class QuotationItem(Base):
     __tablename__ = "quotation_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    quotation_id = Column(Integer, ForeignKey("quotations.id"))
+    quotation_id = Column(Integer, ForeignKey("quotations.id", ondelete="CASCADE"), index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
     description = Column(String)
     unit_price = Column(Float)
@@ -116,6 +143,8 @@ class QuotationItem(Base):
     quotation = relationship("Quotation", back_populates="items")
     product = relationship("Product")
 
+    __table_args__ = {"sqlite_autoincrement": True}  # see Quotation
+
 class TermsConditions(Base):
     __tablename__ = "terms_conditions"
 
@@ -123,4 +152,144 @@ class TermsConditions(Base):
     content = Column(Text, nullable=False)
     account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), unique=True)
 
-    account = relationship("Account", back_populates="terms_conditions")
\ No newline at end of file
+    account = relationship("Account", back_populates="terms_conditions")
+
+# A background job, stored in the main database so no external broker is needed (see jobs.py).
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    payload = Column(Text, nullable=False, default="{}") # JSON-encoded handler arguments
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=True, index=True)
+    status = Column(String, nullable=False, default="queued") # queued, running, succeeded, failed
+    progress = Column(Float, nullable=False, default=0.0) # 0.0 - 1.0
+    progress_message = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    error = Column(Text, nullable=True)
+    run_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow) # Not claimed before this time (backoff)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True) # Heartbeat; stale running jobs are re-queued
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    # Result blob (e.g. a rendered PDF or ZIP); deferred so listing jobs never loads it
+    result = deferred(Column(LargeBinary, nullable=True))
+    result_media_type = Column(String, nullable=True)
+    result_filename = Column(String, nullable=True)
+
+    __table_args__ = (Index("ix_jobs_status_run_at", "status", "run_at"),)
+
+# A stored response for an Idempotency-Key, so a retried create is answered without running twice (see idempotency.py).
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String(255), nullable=False)
+    endpoint = Column(String, nullable=False) # e.g. "POST /quotations/"
+    request_hash = Column(String(32), nullable=False) # A reused key with a different body is rejected
+    status = Column(String, nullable=False, default="in_progress") # in_progress, completed
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow, index=True) # For the TTL purge
+
+    __table_args__ = (UniqueConstraint("account_id", "key", name="_account_idempotency_key_uc"),)
+
+# A token bucket of the shared rate limiter (RATE_LIMIT_BACKEND=database, see ratelimit.py).
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String, primary_key=True) # "<request class>:account:<username>" or "<request class>:ip:<address>"
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False, index=True) # Unix time of the last refill
+
+# One saved version of a quotation: a full snapshot, or a delta against the previous revision (see revisions.py).
+class QuotationRevision(Base):
+    __tablename__ = "quotation_revisions"
+
+    id = Column(Integer, primary_key=True)
+    quotation_id = Column(Integer, ForeignKey("quotations.id", ondelete="CASCADE"), nullable=False)
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False, index=True)
+    revision = Column(Integer, nullable=False) # 1, 2, ... per quotation
+    kind = Column(String, nullable=False) # snapshot, delta
+    data = deferred(Column(Text, nullable=False)) # JSON state (snapshot) or changes (delta)
+    summary = Column(Text, nullable=False) # JSON: changed fields and item counts, for listings
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    # Also serves the per-quotation lookups, and the ON DELETE CASCADE from quotations
+    __table_args__ = (UniqueConstraint("quotation_id", "revision", name="_quotation_revision_uc"), {"sqlite_autoincrement": True})
+
+# One email of a quotation sending job, with its delivery status (see tasks.send_quotations).
+class QuotationDelivery(Base):
+    __tablename__ = "quotation_deliveries"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    # No foreign key: the job's delivery history outlives the quotation's archival or deletion
+    quotation_id = Column(Integer, nullable=False, index=True)
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False, index=True)
+    recipient = Column(String, nullable=True) # The client's email when it was sent
+    cc = Column(String, nullable=True) # The advisor's email
+    status = Column(String, nullable=False, default="pending") # pending, sent, failed
+    error = Column(Text, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (UniqueConstraint("job_id", "quotation_id", name="_job_quotation_delivery_uc"),)
+
+# --- Archive (see archive.py) ---
+# Closed quotations past QUOTATION_ARCHIVE_AFTER_DAYS are moved here, with their items and
+# revisions, so the working tables only hold the active set. Same columns and ids as the
+# working tables; crud.get_quotation falls back to these.
+
+class ArchivedQuotation(Base):
+    __tablename__ = "quotations_archive"
+
+    id = Column(Integer, primary_key=True) # The id it had in `quotations`
+    quotation_number = Column(String)
+    client_id = Column(Integer, ForeignKey("clients.id"))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), index=True)
+    created_date = Column(DateTime)
+    valid_until_date = Column(DateTime)
+    subtotal = Column(Float)
+    tax_percentage = Column(Float)
+    total_tax = Column(Float)
+    other_charges = Column(Float)
+    total = Column(Float)
+    status = Column(String)
+
+    client = relationship("Client")
+    user = relationship("User")
+    items = relationship("ArchivedQuotationItem", back_populates="quotation", passive_deletes=True)
+
+    archived = True
+
+class ArchivedQuotationItem(Base):
+    __tablename__ = "quotation_items_archive"
+
+    id = Column(Integer, primary_key=True)
+    quotation_id = Column(Integer, ForeignKey("quotations_archive.id", ondelete="CASCADE"), index=True)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    description = Column(String)
+    unit_price = Column(Float)
+    quantity = Column(Integer)
+    is_taxable = Column(Boolean)
+    total = Column(Float)
+
+    quotation = relationship("ArchivedQuotation", back_populates="items")
+    product = relationship("Product")
+
+class ArchivedQuotationRevision(Base):
+    __tablename__ = "quotation_revisions_archive"
+
+    id = Column(Integer, primary_key=True)
+    quotation_id = Column(Integer, ForeignKey("quotations_archive.id", ondelete="CASCADE"), nullable=False)
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False, index=True)
+    revision = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False)
+    data = deferred(Column(Text, nullable=False))
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (UniqueConstraint("quotation_id", "revision", name="_archived_quotation_revision_uc"),)
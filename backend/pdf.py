@@ -0,0 +1,223 @@
+import collections
+import functools
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator
+
+import pypdfium2
+from jinja2 import Environment, FileSystemLoader
+from sqlalchemy.orm import Session
+
+import crud, models, pdf_canvas, pdf_chunks, pdf_store, schemas
+
+# --- Configuration ---
+
+# Renderer used when neither the request nor the account's company profile chooses one
+PDF_DEFAULT_RENDERER = os.getenv("PDF_DEFAULT_RENDERER", "weasyprint")
+
+# Base URL of the template's resource links; /uploads links under it are read from storage directly
+PDF_BASE_URL = os.getenv("PDF_BASE_URL", "http://127.0.0.1:8000")
+
+# Large-document mode: quotations with more items are rendered PDF_CHUNK_ITEMS at a time in a child
+# process and the chunk PDFs merged, so WeasyPrint never lays out thousands of rows at once.
+PDF_LARGE_DOCUMENT_ITEMS = int(os.getenv("PDF_LARGE_DOCUMENT_ITEMS", "300"))
+PDF_CHUNK_ITEMS = int(os.getenv("PDF_CHUNK_ITEMS", "200"))
+PDF_MIN_CHUNK_ITEMS = 25
+# Memory one large render may use, enforced on its child process (see pdf_chunks.py); a chunk that
+# exceeds it is retried smaller, down to PDF_MIN_CHUNK_ITEMS, then the render aborts
+PDF_RENDER_MEMORY_CAP_MB = int(os.getenv("PDF_RENDER_MEMORY_CAP_MB", "512"))
+
+# Renders running ahead of the consumer in bulk operations (see render_quotation_pdfs)
+PDF_RENDER_CONCURRENCY = int(os.getenv("PDF_RENDER_CONCURRENCY", "2"))
+
+# First-page previews for the quotation list
+PDF_PREVIEW_WIDTH = int(os.getenv("PDF_PREVIEW_WIDTH", "320"))  # pixels
+PDF_PREVIEW_ITEMS = 40  # more rows than fit on the first page
+
+TEMPLATE_NAME = "quotation_template.html"
+
+env = Environment(loader=FileSystemLoader('.'))
+
+# --- Rendering ---
+
+def pdf_filename(quotation: models.Quotation) -> str:
+    return f"cotizacion_{quotation.quotation_number}.pdf"
+
+class PdfRenderLimitExceeded(Exception):
+    """The render needed more memory than PDF_RENDER_MEMORY_CAP_MB even with the smallest chunks."""
+
+# --- Renderer Backends ---
+# Each backend takes the render context (q, company, terms, base_url) and returns PDF bytes.
+
+_renderers: dict = {}
+
+def renderer(name: str):
+    """Registers a function as the PDF backend `name` (see schemas.PdfRenderer for the public names)."""
+    def decorator(func):
+        _renderers[name] = func
+        return func
+    return decorator
+
+def resolve_renderer(requested: str | None, company: schemas.CompanyProfile) -> str:
+    name = requested or company.pdf_renderer or PDF_DEFAULT_RENDERER
+    if name not in _renderers:
+        raise ValueError(f"Unknown PDF renderer '{name}'")
+    return name
+
+def _render_context(db: Session, quotation: models.Quotation, account: models.Account, first_page_only: bool = False) -> dict:
+    return dict(
+        q=quotation,
+        company=crud.get_company_profile(db, account=account),
+        terms=crud.get_terms_conditions(db, account=account),
+        base_url=PDF_BASE_URL,
+        first_page_only=first_page_only,
+    )
+
+def render_quotation_pdf(db: Session, quotation: models.Quotation, account: models.Account, renderer_name: str | None = None) -> bytes:
+    """Renders a fully loaded quotation (see crud.get_quotation) to PDF bytes."""
+    context = _render_context(db, quotation, account)
+    return _renderers[resolve_renderer(renderer_name, context["company"])](context)
+
+@renderer("canvas")
+def _render_canvas(context: dict) -> bytes:
+    return pdf_canvas.render(context["q"], context["company"], context["terms"], context["first_page_only"])
+
+@renderer("weasyprint")
+def _render_weasyprint(context: dict) -> bytes:
+    items = context["q"].items
+    if context["first_page_only"]:
+        # Only the first page is kept, so the items that cannot reach it are left out
+        return _render_html(context, items[:PDF_PREVIEW_ITEMS], show_header=True, show_summary=len(items) <= PDF_PREVIEW_ITEMS)
+    if len(items) <= PDF_LARGE_DOCUMENT_ITEMS:
+        return _render_html(context, items, show_header=True, show_summary=True)
+    return _render_in_chunks(context, items)
+
+def _render_html(context: dict, items, show_header: bool, show_summary: bool) -> bytes:
+    from weasyprint import HTML  # imported on first use: it is slow to load and the canvas backend does not need it
+
+    html_out = _template_html(context, items, show_header, show_summary)
+    return HTML(string=html_out, base_url=PDF_BASE_URL, url_fetcher=functools.partial(pdf_chunks.fetch_resource, PDF_BASE_URL)).write_pdf()
+
+def _template_html(context: dict, items, show_header: bool, show_summary: bool) -> str:
+    return env.get_template(TEMPLATE_NAME).render(**context, items=items, show_header=show_header, show_summary=show_summary)
+
+def _render_in_chunks(context: dict, items) -> bytes:
+    limit_exceeded = PdfRenderLimitExceeded(f"Rendering {len(items)} items exceeds {PDF_RENDER_MEMORY_CAP_MB} MB")
+    with pdf_chunks.ChunkedDocument(PDF_RENDER_MEMORY_CAP_MB * 1024 * 1024, PDF_BASE_URL) as document:
+        chunk_size = PDF_CHUNK_ITEMS
+        start = 0
+        while start < len(items):
+            end = min(start + chunk_size, len(items))
+            try:
+                document.add(_template_html(context, items[start:end], show_header=start == 0, show_summary=end == len(items)))
+            except pdf_chunks.ChunkOutOfMemory as exc:
+                if chunk_size <= PDF_MIN_CHUNK_ITEMS:
+                    raise limit_exceeded from exc
+                chunk_size = max(chunk_size // 2, PDF_MIN_CHUNK_ITEMS)
+                continue
+            start = end
+        try:
+            return document.merge()
+        except pdf_chunks.ChunkOutOfMemory as exc:
+            raise limit_exceeded from exc
+
+# --- Pre-rendered PDFs ---
+
+def render_fingerprint(quotation: models.Quotation, account: models.Account, renderer_name: str) -> str:
+    """Hash of every input of the render: the quotation (with client, advisor and items), the
+    products its items print, the account's profile/terms version, the renderer and the template itself."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(schemas.Quotation.model_validate(quotation).model_dump_json().encode())
+    # The schema's items only carry product_id: renaming a product must change the fingerprint too
+    products = sorted({(item.product_id, item.product.name, item.product.description)
+                       for item in quotation.items if item.product is not None}, key=lambda product: product[0])
+    digest.update(repr(products).encode())
+    digest.update(f"|{account.settings_version}|{renderer_name}|{os.path.getmtime(TEMPLATE_NAME)}".encode())
+    return digest.hexdigest()
+
+def get_or_render_quotation_pdf(db: Session, quotation: models.Quotation, account: models.Account, renderer_name: str | None = None) -> bytes:
+    """Serves the pre-rendered PDF when it is still fresh; otherwise renders synchronously."""
+    if not pdf_store.PDF_PRERENDER_ENABLED:
+        return render_quotation_pdf(db, quotation, account, renderer_name)
+    renderer_name = resolve_renderer(renderer_name, crud.get_company_profile(db, account=account))
+    fingerprint = render_fingerprint(quotation, account, renderer_name)
+    content = pdf_store.load(quotation.id, fingerprint)
+    if content is None:
+        content = render_quotation_pdf(db, quotation, account, renderer_name)
+        pdf_store.save(quotation.id, fingerprint, content)
+    return content
+
+def render_quotation_pdfs(db: Session, quotations: list[models.Quotation], account: models.Account,
+                          concurrency: int = PDF_RENDER_CONCURRENCY) -> Iterator[tuple[models.Quotation, Future]]:
+    """
+    Renders fully loaded quotations on `concurrency` threads, yielding (quotation, future of its PDF
+    bytes) in order. At most 2 * `concurrency` renders run ahead of the consumer, so a large batch
+    never holds every PDF in memory. Fresh pre-rendered PDFs are reused. The session is only used
+    here, on the calling thread; the render threads get detached profile/terms snapshots.
+    """
+    company = crud.get_company_profile(db, account=account)
+    terms = crud.get_terms_conditions(db, account=account)
+    renderer_name = resolve_renderer(None, company)
+    fingerprints = {
+        quotation.id: render_fingerprint(quotation, account, renderer_name) for quotation in quotations
+    } if pdf_store.PDF_PRERENDER_ENABLED else {}
+
+    def render(quotation: models.Quotation) -> bytes:
+        fingerprint = fingerprints.get(quotation.id)
+        content = pdf_store.load(quotation.id, fingerprint) if fingerprint else None
+        if content is None:
+            context = dict(q=quotation, company=company, terms=terms, base_url=PDF_BASE_URL, first_page_only=False)
+            content = _renderers[renderer_name](context)
+            if fingerprint:
+                pdf_store.save(quotation.id, fingerprint, content)
+        return content
+
+    remaining = iter(quotations)
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="pdf-render") as pool:
+        try:
+            for quotation in remaining:
+                pending.append((quotation, pool.submit(render, quotation)))
+                if len(pending) >= 2 * concurrency:
+                    yield pending.popleft()
+            while pending:
+                yield pending.popleft()
+        finally:
+            for _, future in pending:
+                future.cancel()  # the consumer stopped early
+
+# --- First-page Previews ---
+
+_pdfium_lock = threading.Lock()  # PDFium is not thread-safe
+
+def preview_fingerprint(db: Session, quotation: models.Quotation, account: models.Account) -> str:
+    """Fingerprint of the preview's inputs (see render_fingerprint); also its ETag."""
+    renderer_name = resolve_renderer(None, crud.get_company_profile(db, account=account))
+    source = f"{render_fingerprint(quotation, account, renderer_name)}|{PDF_PREVIEW_WIDTH}"
+    return hashlib.blake2b(source.encode(), digest_size=16).hexdigest()
+
+def render_quotation_preview(db: Session, quotation: models.Quotation, account: models.Account) -> bytes:
+    """Renders the first page of the quotation with its default renderer and rasterizes it to a PNG."""
+    context = _render_context(db, quotation, account, first_page_only=True)
+    document_bytes = _renderers[resolve_renderer(None, context["company"])](context)
+    with _pdfium_lock:
+        document = pypdfium2.PdfDocument(document_bytes)
+        try:
+            page = document[0]
+            image = page.render(scale=PDF_PREVIEW_WIDTH / page.get_width()).to_pil()
+        finally:
+            document.close()
+    output = io.BytesIO()
+    image.convert("RGB").save(output, format="PNG", optimize=True)
+    return output.getvalue()
+
+def get_or_render_quotation_preview(db: Session, quotation: models.Quotation, account: models.Account, fingerprint: str) -> bytes:
+    """Serves the stored preview for `fingerprint` (see preview_fingerprint), rendering and storing it on a miss."""
+    content = pdf_store.load(quotation.id, fingerprint, "png")
+    if content is None:
+        content = render_quotation_preview(db, quotation, account)
+        pdf_store.save(quotation.id, fingerprint, content, "png")
+    return content
@@ -0,0 +1,308 @@
+"""
+Fast PDF renderer: draws the standard quotation layout of quotation_template.html directly
+on a ReportLab canvas, without HTML parsing or CSS layout. Selected with renderer "canvas"
+(see pdf.py). Output streams page by page, so memory stays flat even for huge quotations.
+"""
+import io
+import os
+
+from reportlab.lib.colors import HexColor, black, red, white
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfgen import canvas
+
+import logos
+
+# --- Layout Constants (points; mirror the template's CSS) ---
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 36  # 0.5in
+CONTENT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+FOOTER_HEIGHT = 48
+FONT, FONT_BOLD = "Helvetica", "Helvetica-Bold"
+FONT_SIZE = 8.25  # 11px
+LEADING = FONT_SIZE * 1.25
+CELL_PADDING = 4.5
+BORDER = HexColor("#cccccc")
+TEXT = HexColor("#333333")
+COMPANY_BLUE = HexColor("#003366")
+# Item table columns: description, quantity, unit price, total
+COLUMN_WIDTHS = (CONTENT_WIDTH * 0.60, CONTENT_WIDTH * 0.10, CONTENT_WIDTH * 0.15, CONTENT_WIDTH * 0.15)
+HEADERS = ("DESCRIPCIÓN", "CANTIDAD", "PRECIO UNITARIO", "TOTAL")
+
+def _money(value: float) -> str:
+    return f"${value:.2f}"
+
+class _FirstPageDone(Exception):
+    pass
+
+class _QuotationCanvas:
+    def __init__(self, quotation, company, terms, first_page_only: bool = False):
+        self.q = quotation
+        self.company = company
+        self.terms = terms
+        self.buffer = io.BytesIO()
+        self.canvas = canvas.Canvas(self.buffer, pagesize=letter, pageCompression=1)
+        self.canvas.setTitle(f"Cotización {quotation.quotation_number}")
+        self.y = PAGE_HEIGHT - MARGIN
+        self.first_page_only = first_page_only
+
+    def render(self) -> bytes:
+        try:
+            self._header()
+            self._client_bar()
+            self._items_table()
+            self._totals()
+            self._terms_and_acceptance()
+            self._footer()
+        except _FirstPageDone:
+            pass  # the first page is complete, footer included
+        self.canvas.save()
+        return self.buffer.getvalue()
+
+    # --- Page Handling ---
+
+    def _new_page(self):
+        self._footer()
+        if self.first_page_only:
+            raise _FirstPageDone()
+        self.canvas.showPage()
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def _ensure_space(self, height: float) -> bool:
+        """Starts a new page if `height` does not fit; returns True when it did."""
+        if self.y - height < MARGIN + FOOTER_HEIGHT:
+            self._new_page()
+            return True
+        return False
+
+    def _footer(self):
+        c = self.canvas
+        user = self.q.user
+        c.setStrokeColor(BORDER)
+        c.line(MARGIN, MARGIN + FOOTER_HEIGHT - 12, PAGE_WIDTH - MARGIN, MARGIN + FOOTER_HEIGHT - 12)
+        c.setFillColor(TEXT)
+        c.setFont(FONT, 6.75)
+        lines = (
+            "Si usted tiene alguna pregunta sobre esta cotización, por favor, póngase en contacto con nosotros",
+            f"Asesor: {user.full_name or ''}, Teléfono: {user.phone or 'N/A'}, Correo: {user.email}",
+        )
+        y = MARGIN + FOOTER_HEIGHT - 22
+        for line in lines:
+            c.drawCentredString(PAGE_WIDTH / 2, y, line)
+            y -= 8.5
+        c.setFont(FONT_BOLD, 8)
+        c.drawCentredString(PAGE_WIDTH / 2, y, "¡Gracias por hacer negocios con nosotros!")
+
+    # --- Sections ---
+
+    def _header(self):
+        c, q, company = self.canvas, self.q, self.company
+        top = self.y
+        left_width = CONTENT_WIDTH * 0.6 - 15
+        x = MARGIN
+        logo = self._logo()
+        if logo is not None:
+            width, height = logo.getSize()
+            scale = min(187.5 / width, 90 / height, 1.0)
+            c.drawImage(logo, x, top - height * scale, width * scale, height * scale, mask="auto")
+            x += width * scale + 11
+            name_y = top - height * scale / 2 - 8
+        else:
+            name_y = top - 22
+        c.setFillColor(COMPANY_BLUE)
+        c.setFont(FONT_BOLD, 20.6)
+        c.drawString(x, name_y, company.company_name)
+        y = min(name_y, top - 30) - 20
+        c.setFillColor(TEXT)
+        c.setFont(FONT, FONT_SIZE)
+        for line in (company.address, f"Sitio Web: {company.website}", f"Teléfono: {company.phone}",
+                     f"Asesor de venta: {q.user.full_name or ''}"):
+            for wrapped in simpleSplit(line, FONT, FONT_SIZE, left_width):
+                c.drawString(MARGIN, y, wrapped)
+                y -= LEADING
+
+        # Quotation details box
+        box_x = MARGIN + CONTENT_WIDTH * 0.6
+        box_width = CONTENT_WIDTH * 0.4
+        rows = (  # label, value, value color, bold value
+            ("FECHA:", q.created_date.strftime("%d/%m/%Y"), TEXT, False),
+            ("COTIZACIÓN N°:", q.quotation_number, red, True),
+            ("CLIENTE ID:", q.client.client_id_number or "N/A", TEXT, False),
+            ("VALIDO HASTA:", q.valid_until_date.strftime("%d/%m/%Y"), TEXT, True),
+        )
+        box_height = 38 + len(rows) * 12
+        c.setStrokeColor(BORDER)
+        c.rect(box_x, top - box_height, box_width, box_height)
+        c.setFont(FONT_BOLD, 14.85)
+        c.drawCentredString(box_x + box_width / 2, top - 24, "COTIZACIÓN")
+        row_y = top - 42
+        for label, value, value_color, bold in rows:
+            c.setFillColor(TEXT)
+            c.setFont(FONT_BOLD, FONT_SIZE)
+            c.drawString(box_x + 7.5, row_y, label)
+            c.setFillColor(value_color)
+            c.setFont(FONT_BOLD if bold else FONT, FONT_SIZE)
+            c.drawString(box_x + 7.5 + (box_width - 15) * 0.45, row_y, value)
+            row_y -= 12
+        c.setFillColor(TEXT)
+        self.y = min(y, top - box_height) - 15
+
+    def _client_bar(self):
+        c = self.canvas
+        self.y -= 15
+        height = FONT_SIZE + 15
+        c.setFillColor(black)
+        c.rect(MARGIN, self.y - height, CONTENT_WIDTH, height, stroke=0, fill=1)
+        c.setFillColor(white)
+        c.setFont(FONT_BOLD, FONT_SIZE)
+        c.drawString(MARGIN + 7.5, self.y - height + 7.5, "CLIENTE:")
+        c.setFont(FONT, FONT_SIZE)
+        c.drawString(MARGIN + 7.5 + c.stringWidth("CLIENTE: ", FONT_BOLD, FONT_SIZE), self.y - height + 7.5, self.q.client.name)
+        c.setFillColor(TEXT)
+        self.y -= height + 15
+
+    def _table_header(self):
+        c = self.canvas
+        height = LEADING + 2 * CELL_PADDING
+        c.setFillColor(black)
+        c.rect(MARGIN, self.y - height, CONTENT_WIDTH, height, stroke=0, fill=1)
+        c.setFillColor(white)
+        c.setFont(FONT_BOLD, FONT_SIZE)
+        x = MARGIN
+        for index, (header, width) in enumerate(zip(HEADERS, COLUMN_WIDTHS)):
+            self._cell_text(header, x, width, self.y - CELL_PADDING - FONT_SIZE, align=("left", "center", "right", "right")[index])
+            x += width
+        c.setFillColor(TEXT)
+        self.y -= height
+
+    def _items_table(self):
+        self._table_header()
+        for item in self.q.items:
+            description_lines = []
+            if item.product is not None:
+                description_lines.append((FONT_BOLD, item.product.name))
+            description_lines += [(FONT, line) for line in simpleSplit(item.description or "", FONT, FONT_SIZE, COLUMN_WIDTHS[0] - 2 * CELL_PADDING)]
+            height = max(len(description_lines), 1) * LEADING + 2 * CELL_PADDING
+            if self._ensure_space(height):
+                self._table_header()
+            self._item_row(item, description_lines, height)
+        self.y -= 15
+
+    def _item_row(self, item, description_lines, height):
+        c = self.canvas
+        c.setStrokeColor(BORDER)
+        x = MARGIN
+        for width in COLUMN_WIDTHS:
+            c.rect(x, self.y - height, width, height)
+            x += width
+        baseline = self.y - CELL_PADDING - FONT_SIZE
+        c.setFillColor(TEXT)
+        for font, line in description_lines:
+            c.setFont(font, FONT_SIZE)
+            c.drawString(MARGIN + CELL_PADDING, baseline, line)
+            baseline -= LEADING
+        c.setFont(FONT, FONT_SIZE)
+        first_line = self.y - CELL_PADDING - FONT_SIZE
+        x = MARGIN + COLUMN_WIDTHS[0]
+        for value, width, align in ((str(item.quantity), COLUMN_WIDTHS[1], "center"),
+                                    (_money(item.unit_price), COLUMN_WIDTHS[2], "right"),
+                                    (_money(item.total), COLUMN_WIDTHS[3], "right")):
+            self._cell_text(value, x, width, first_line, align)
+            x += width
+        self.y -= height
+
+    def _totals(self):
+        q = self.q
+        rows = [("Subtotal", _money(q.subtotal)), (f"Impuesto ({q.tax_percentage:.0f}%)", _money(q.total_tax))]
+        if q.other_charges != 0:
+            rows.append(("Otros", _money(q.other_charges)))
+        rows.append(("TOTAL", _money(q.total)))
+        row_height = LEADING + 2 * CELL_PADDING
+        self._ensure_space(row_height * len(rows) + 15)
+        c = self.canvas
+        width = CONTENT_WIDTH * 0.45
+        x = PAGE_WIDTH - MARGIN - width
+        c.setStrokeColor(BORDER)
+        for index, (label, value) in enumerate(rows):
+            size = FONT_SIZE * 1.2 if index == len(rows) - 1 else FONT_SIZE
+            c.rect(x, self.y - row_height, width / 2, row_height)
+            c.rect(x + width / 2, self.y - row_height, width / 2, row_height)
+            c.setFont(FONT_BOLD, size)
+            c.drawString(x + CELL_PADDING, self.y - CELL_PADDING - size, label)
+            c.setFont(FONT_BOLD if index == len(rows) - 1 else FONT, size)
+            c.drawRightString(x + width - CELL_PADDING, self.y - CELL_PADDING - size, value)
+            self.y -= row_height
+        self.y -= 15
+
+    def _terms_and_acceptance(self):
+        c = self.canvas
+        inner_width = CONTENT_WIDTH - 15
+        terms_lines = []
+        for paragraph in (self.terms.content or "").splitlines() or [""]:
+            terms_lines += simpleSplit(paragraph, FONT, 7.5, inner_width) or [""]
+        self.y -= 15
+        # Terms may span pages; each page gets its own box segment
+        heading_drawn = False
+        while terms_lines or not heading_drawn:
+            available = self.y - (MARGIN + FOOTER_HEIGHT) - 15
+            capacity = int((available - (18 if not heading_drawn else 0)) // 9.5)
+            if capacity < 1:
+                self._new_page()
+                continue
+            chunk, terms_lines = terms_lines[:capacity], terms_lines[capacity:]
+            height = len(chunk) * 9.5 + 15 + (18 if not heading_drawn else 0)
+            c.setStrokeColor(TEXT)
+            c.rect(MARGIN, self.y - height, CONTENT_WIDTH, height)
+            y = self.y - 7.5
+            if not heading_drawn:
+                c.setFillColor(black)
+                c.rect(MARGIN + 7.5, y - 14, inner_width, 14, stroke=0, fill=1)
+                c.setFillColor(white)
+                c.setFont(FONT_BOLD, FONT_SIZE)
+                c.drawString(MARGIN + 11, y - 10, "TÉRMINOS Y CONDICIONES")
+                y -= 22
+                heading_drawn = True
+            c.setFillColor(TEXT)
+            c.setFont(FONT, 7.5)
+            for line in chunk:
+                y -= 9.5
+                c.drawString(MARGIN + 7.5, y + 2, line)
+            self.y -= height
+            if terms_lines:
+                self._new_page()
+
+        self._ensure_space(80)
+        self.y -= 15
+        c.setFont(FONT, FONT_SIZE)
+        c.drawCentredString(PAGE_WIDTH / 2, self.y, "Firma de aceptación del cliente:")
+        self.y -= 40
+        c.setStrokeColor(TEXT)
+        c.line(PAGE_WIDTH / 2 - 112.5, self.y, PAGE_WIDTH / 2 + 112.5, self.y)
+        self.y -= 14
+        c.drawCentredString(PAGE_WIDTH / 2, self.y, self.q.client.name)
+
+    # --- Helpers ---
+
+    def _cell_text(self, text: str, x: float, width: float, y: float, align: str):
+        c = self.canvas
+        if align == "center":
+            c.drawCentredString(x + width / 2, y, text)
+        elif align == "right":
+            c.drawRightString(x + width - CELL_PADDING, y, text)
+        else:
+            c.drawString(x + CELL_PADDING, y, text)
+
+    def _logo(self):
+        if not self.company.logo_path:
+            return None
+        # "/uploads/<name>" is the object <name> of the uploads storage
+        name = os.path.basename(self.company.logo_pdf_path or self.company.logo_path)
+        try:
+            return ImageReader(logos.upload_storage().local_path(name))
+        except (OSError, IOError, ValueError):
+            return None
+
+def render(quotation, company, terms, first_page_only: bool = False) -> bytes:
+    """`first_page_only` stops at the first page break (for previews)."""
+    return _QuotationCanvas(quotation, company, terms, first_page_only).render()
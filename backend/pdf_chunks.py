@@ -0,0 +1,132 @@
+"""
+Large-document rendering in a memory-capped child process (see pdf._render_in_chunks).
+
+A large quotation is laid out in chunks. The chunks are rendered, one at a time, in a child process
+whose address space is limited (RLIMIT_AS) to what it used at start plus the cap. The cap therefore
+applies to this render alone: other renders, requests and workers of the parent process do not count
+against it. Each chunk's PDF is spooled to a temporary directory instead of being kept in memory, and
+the final merge reads them back, in the same capped process. A chunk that runs out of memory raises
+ChunkOutOfMemory and the child is replaced, so the next attempt starts from a clean heap.
+
+The parent runs threads, so it is never forked itself: children come from a forkserver that has
+already imported WeasyPrint, which keeps starting one per render cheap.
+"""
+import functools
+import mimetypes
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+if "forkserver" in multiprocessing.get_all_start_methods():
+    _context = multiprocessing.get_context("forkserver")
+    _context.set_forkserver_preload([__name__, "weasyprint"])
+else:
+    _context = multiprocessing.get_context("spawn")
+
+class ChunkOutOfMemory(Exception):
+    """The child process reached its memory cap (or died) while rendering a chunk or merging."""
+
+class ChunkedDocument:
+    """
+    Renders HTML chunks to PDF in a capped child process and merges them into one document:
+        with ChunkedDocument(cap_bytes, base_url) as document:
+            document.add(html) ...
+            content = document.merge()
+    """
+
+    def __init__(self, cap_bytes: int, base_url: str):
+        self.cap_bytes = cap_bytes
+        self.base_url = base_url
+        self.directory = tempfile.mkdtemp(prefix="pdf-chunks-")
+        self.parts: list[str] = []
+        self._executor: ProcessPoolExecutor | None = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, html: str):
+        """Renders the next chunk. On ChunkOutOfMemory nothing was added and it may be retried smaller."""
+        path = os.path.join(self.directory, f"{len(self.parts):05d}.pdf")
+        self._run(_write_chunk, html, self.base_url, path)
+        self.parts.append(path)
+
+    def merge(self) -> bytes:
+        path = os.path.join(self.directory, "document.pdf")
+        self._run(_merge, self.parts, path)
+        with open(path, "rb") as merged:
+            return merged.read()
+
+    def close(self):
+        self._shutdown()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _run(self, function, *args):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=_context, initializer=_limit_memory, initargs=(self.cap_bytes,)
+            )
+        try:
+            return self._executor.submit(function, *args).result()
+        except (MemoryError, BrokenProcessPool) as exc:
+            # A C library may abort instead of failing the allocation: both mean the cap was reached
+            self._shutdown()
+            raise ChunkOutOfMemory(str(exc) or type(exc).__name__) from exc
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+# --- Child Process ---
+
+def _limit_memory(cap_bytes: int):
+    try:
+        import weasyprint  # noqa: F401  (already loaded under the forkserver; not part of the render)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as statm:
+            baseline = int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:  # not Linux: the address space is not a usable measure there, so no cap
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = baseline + cap_bytes
+    resource.setrlimit(resource.RLIMIT_AS, (limit if hard == resource.RLIM_INFINITY else min(limit, hard), hard))
+
+def _write_chunk(html: str, base_url: str, path: str):
+    from weasyprint import HTML
+
+    with open(path, "wb") as output:
+        HTML(string=html, base_url=base_url, url_fetcher=functools.partial(fetch_resource, base_url)).write_pdf(output)
+
+def _merge(paths: list[str], path: str):
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for part in paths:
+        writer.append(part)
+    # Every chunk embeds its own copy of the fonts; identical objects are shared in the output
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    writer.write(path)
+
+def fetch_resource(base_url: str, url: str) -> dict:
+    """WeasyPrint URL fetcher: loads uploads (the logo) from storage instead of over HTTP from the API itself."""
+    from weasyprint import default_url_fetcher
+    import logos
+
+    uploads_prefix = f"{base_url}/uploads/"
+    if not url.startswith(uploads_prefix):
+        return default_url_fetcher(url)
+    name = url[len(uploads_prefix):]
+    return dict(
+        string=logos.upload_storage().read(name),
+        mime_type=mimetypes.guess_type(name)[0] or "application/octet-stream",
+        redirected_url=url,
+    )
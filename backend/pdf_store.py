@@ -0,0 +1,54 @@
+"""
+Persistent store of pre-rendered quotation PDFs.
+
+With PDF_PRERENDER=true, saving a quotation (or sending it) schedules a background render
+(tasks.prerender_quotation_pdf) whose output is kept here, named after the quotation id and the
+fingerprint of everything the render depends on (see pdf.render_fingerprint). The PDF endpoint
+serves a stored file only if its fingerprint still matches, so a stale PDF is never returned.
+First-page PNG previews (see pdf.get_or_render_quotation_preview) are stored alongside, always.
+Files live in the "pdfs" storage namespace (see storage.py), so every API node sees them, with a
+subdirectory (key prefix) per quotation: replacing or discarding its renders never lists the others.
+"""
+import os
+
+import storage
+
+# --- Configuration ---
+
+PDF_PRERENDER_ENABLED = os.getenv("PDF_PRERENDER", "false").lower() == "true"
+# Renders are delayed a little so a burst of edits is covered by a single (coalesced) job
+PDF_PRERENDER_DELAY_SECONDS = int(os.getenv("PDF_PRERENDER_DELAY_SECONDS", "2"))
+PDF_STORE_DIRECTORY = os.getenv("PDF_STORE_DIRECTORY", "./pdf_store")  # with the local storage backend
+
+def _storage(quotation_id: int) -> storage.Storage:
+    return storage.get_storage("pdfs", PDF_STORE_DIRECTORY).subspace(str(quotation_id))
+
+def _key(fingerprint: str, kind: str) -> str:
+    return f"{fingerprint}.{kind}"
+
+# --- Store Operations ---
+
+# `kind` is the file type: "pdf" for documents, "png" for previews
+
+def load(quotation_id: int, fingerprint: str, kind: str = "pdf") -> bytes | None:
+    try:
+        return _storage(quotation_id).read(_key(fingerprint, kind))
+    except FileNotFoundError:
+        return None
+
+def exists(quotation_id: int, fingerprint: str, kind: str = "pdf") -> bool:
+    return _storage(quotation_id).exists(_key(fingerprint, kind))
+
+def save(quotation_id: int, fingerprint: str, content: bytes, kind: str = "pdf"):
+    """Stores the file atomically and removes older renders of the same quotation and kind."""
+    store = _storage(quotation_id)
+    target = _key(fingerprint, kind)
+    store.write_bytes(target, content)
+    for stale in store.keys():
+        if stale != target and stale.endswith(f".{kind}"):
+            store.delete(stale)
+
+def discard(quotation_id: int):
+    store = _storage(quotation_id)
+    for stored in store.keys():
+        store.delete(stored)
@@ -0,0 +1,254 @@
+"""
+Per-account admission control, so one tenant cannot saturate the API for everyone.
+
+Every request is classified (see classify) and charged to a token bucket per account and
+class; a request without a valid token is charged to its client IP instead. A class whose
+bucket is empty gets 429 with Retry-After.
+
+- "read": GETs of ordinary resources (large, fast-refilling buckets).
+- "write": creates, updates and deletes.
+- "expensive": PDF renders, job submissions (including email sends), job result downloads,
+  logo processing, bulk updates. These are also capped at RATE_LIMIT_EXPENSIVE_CONCURRENCY
+  in flight per account.
+- "auth": login and sign-up, per client IP.
+
+When the process as a whole is overloaded (RATE_LIMIT_OVERLOAD_REQUESTS in flight), expensive
+requests are refused with 503 so cheap reads and writes keep flowing.
+
+Bucket backends (RATE_LIMIT_BACKEND):
+- "local" (default): in-process, for a single API process.
+- "database": a row per bucket in the main database, shared by every worker process. PostgreSQL
+  only: charging a token is a write, and on SQLite every request (reads included) would queue
+  on the process write lock.
+The concurrency cap and the overload check are always per process.
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+
+from jose import JWTError, jwt
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+import auth, models
+from database import WriteSessionLocal, is_sqlite
+
+# --- Configuration ---
+
+def _limit(name: str, default: str) -> tuple[float, float]:
+    """Reads a "<tokens per second>,<burst>" setting."""
+    rate, burst = os.getenv(name, default).split(",")
+    return float(rate), float(burst)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local")
+RATE_LIMITS = {
+    "read": _limit("RATE_LIMIT_READ", "20,100"),
+    "write": _limit("RATE_LIMIT_WRITE", "5,30"),
+    "expensive": _limit("RATE_LIMIT_EXPENSIVE", "0.5,10"),
+    "auth": _limit("RATE_LIMIT_AUTH", "0.2,10"),
+}
+RATE_LIMIT_EXPENSIVE_CONCURRENCY = int(os.getenv("RATE_LIMIT_EXPENSIVE_CONCURRENCY", "2"))
+RATE_LIMIT_OVERLOAD_REQUESTS = int(os.getenv("RATE_LIMIT_OVERLOAD_REQUESTS", "64"))
+# Database buckets untouched for this long are full again and can be deleted
+RATE_LIMIT_BUCKET_TTL_SECONDS = 3600
+
+# --- Classification ---
+
+EXPENSIVE_ROUTES = (
+    ("GET", re.compile(r"^/quotations/\d+/pdf$")),
+    ("GET", re.compile(r"^/quotations/\d+/preview\.png$")),
+    ("GET", re.compile(r"^/jobs/\d+/result$")),
+    ("POST", re.compile(r"^/jobs/")),
+    ("POST", re.compile(r"^/quotations/send$")),
+    ("POST", re.compile(r"^/company-profile/logo$")),
+    ("PATCH", re.compile(r"^/quotations/status$")),
+)
+AUTH_ROUTES = (("POST", "/token"), ("POST", "/accounts/"))
+# Long-lived streams: charged once when they connect, but never counted as in flight
+STREAMING_PATHS = ("/events",)
+
+def classify(method: str, path: str) -> str:
+    if (method, path) in AUTH_ROUTES:
+        return "auth"
+    for route_method, pattern in EXPENSIVE_ROUTES:
+        if method == route_method and pattern.match(path):
+            return "expensive"
+    return "read" if method in auth.READ_ONLY_METHODS else "write"
+
+def client_key(scope) -> str:
+    """The account (token subject) the request acts for, or its client IP without a valid token."""
+    headers = Headers(scope=scope)
+    token = None
+    scheme, _, credentials = headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer":
+        token = credentials
+    elif scope["path"] in STREAMING_PATHS:
+        # EventSource passes the token in the query string (see GET /events)
+        match = re.search(r"(?:^|&)token=([^&]+)", scope.get("query_string", b"").decode("latin-1"))
+        token = match.group(1) if match else None
+    if token:
+        try:
+            subject = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM]).get("sub")
+        except JWTError:
+            subject = None
+        if subject:
+            return f"account:{subject}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+# --- Bucket Backends ---
+# take() charges one token and returns 0, or returns the seconds until a token is available.
+
+class LocalBuckets:
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}  # key -> (tokens, monotonic time)
+        self._lock = threading.Lock()
+        self._next_prune = time.monotonic() + RATE_LIMIT_BUCKET_TTL_SECONDS
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, now)
+            if now >= self._next_prune:
+                self._prune(now)
+            return 0.0
+
+    def _prune(self, now: float):
+        # An idle bucket has refilled completely, which is the same as having no entry
+        cutoff = now - RATE_LIMIT_BUCKET_TTL_SECONDS
+        self._buckets = {key: entry for key, entry in self._buckets.items() if entry[1] >= cutoff}
+        self._next_prune = now + RATE_LIMIT_BUCKET_TTL_SECONDS
+
+class DatabaseBuckets:
+    """Buckets in the rate_limit_buckets table; the refill and charge is one conditional UPDATE."""
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        with WriteSessionLocal() as db:
+            wait = self._charge(db, key, rate, burst)
+            if wait is not None:
+                return wait
+            db.add(models.RateLimitBucket(key=key, tokens=burst - 1, updated_at=time.time()))
+            try:
+                db.commit()
+                return 0.0
+            except IntegrityError:
+                db.rollback()
+            # Another worker created it first: charge that row instead. It is not idle, so the sweep
+            # cannot have purged it in between.
+            wait = self._charge(db, key, rate, burst)
+            assert wait is not None
+            return wait
+
+    def _charge(self, db, key: str, rate: float, burst: float) -> float | None:
+        """Takes a token from an existing bucket: 0, or the wait until one is available. None without a bucket."""
+        bucket = models.RateLimitBucket
+        now = time.time()
+        refilled = bucket.tokens + (now - bucket.updated_at) * rate
+        charged = db.execute(
+            update(bucket)
+            .where(bucket.key == key, refilled >= 1)
+            .values(tokens=_capped(refilled, burst) - 1, updated_at=now)
+        ).rowcount
+        if charged:
+            db.commit()
+            return 0.0
+        current = db.execute(select(bucket.tokens, bucket.updated_at).where(bucket.key == key)).first()
+        db.rollback()
+        if current is None:
+            return None
+        tokens = min(burst, current.tokens + (now - current.updated_at) * rate)
+        return max((1 - tokens) / rate, 0.0)
+
+def _capped(expression, burst: float):
+    return case((expression > burst, burst), else_=expression)
+
+def purge_idle_buckets(db) -> int:
+    """Deletes database buckets idle long enough to be full again (called from jobs.run_maintenance)."""
+    cutoff = time.time() - RATE_LIMIT_BUCKET_TTL_SECONDS
+    deleted = db.execute(delete(models.RateLimitBucket).where(models.RateLimitBucket.updated_at < cutoff)).rowcount
+    db.commit()
+    return deleted
+
+# --- Middleware ---
+
+class RateLimitMiddleware:
+    def __init__(self, app, backend: str = RATE_LIMIT_BACKEND):
+        self.app = app
+        if backend == "local":
+            self.buckets = LocalBuckets()
+        elif backend == "database":
+            if is_sqlite:
+                raise ValueError("RATE_LIMIT_BACKEND=database requires PostgreSQL; use 'local' with SQLite")
+            self.buckets = DatabaseBuckets()
+        else:
+            raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{backend}'")
+        self.backend = backend
+        # Only touched from the event loop, so plain counters are enough
+        self.in_flight = 0
+        self.expensive_in_flight: dict[str, int] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"].startswith("/uploads/"):
+            await self.app(scope, receive, send)
+            return
+
+        request_class = classify(scope["method"], scope["path"])
+        key = client_key(scope)
+
+        if request_class == "expensive":
+            if self.in_flight >= RATE_LIMIT_OVERLOAD_REQUESTS:
+                await _reject(send, 503, 1, "The server is busy; please retry shortly.")
+                return
+            if self.expensive_in_flight.get(key, 0) >= RATE_LIMIT_EXPENSIVE_CONCURRENCY:
+                await _reject(send, 429, 1, "Too many concurrent PDF/export requests for this account.")
+                return
+
+        rate, burst = RATE_LIMITS[request_class]
+        if self.backend == "local":
+            wait = self.buckets.take(f"{request_class}:{key}", rate, burst)
+        else:
+            wait = await run_in_threadpool(self.buckets.take, f"{request_class}:{key}", rate, burst)
+        if wait > 0:
+            await _reject(send, 429, wait, "Too many requests; please retry later.")
+            return
+
+        if scope["path"] in STREAMING_PATHS:
+            await self.app(scope, receive, send)
+            return
+        self.in_flight += 1
+        if request_class == "expensive":
+            self.expensive_in_flight[key] = self.expensive_in_flight.get(key, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            if request_class == "expensive":
+                remaining = self.expensive_in_flight[key] - 1
+                if remaining:
+                    self.expensive_in_flight[key] = remaining
+                else:
+                    del self.expensive_in_flight[key]
+
+async def _reject(send, status_code: int, retry_after: float, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,184 @@
+"""
+Read-replica routing.
+
+Sessions created by `database.SessionLocal` (used for GET/HEAD requests) send their queries to a
+healthy replica; writer sessions always use the primary. A replica is skipped while it is down
+or lags more than REPLICA_MAX_LAG_SECONDS, and a query that fails on a replica is retried on the
+primary.
+
+Users always read their own writes: a response to a request that wrote carries X-Primary-Until
+(Unix time, REPLICA_STICKY_SECONDS ahead), and reads that send it back go to the primary until
+then, whichever API process serves them. Each process also pins an account to the primary
+after a write it served itself, for clients that do not echo the header.
+
+To try it locally with two SQLite files:
+    DATABASE_URL=sqlite:///./primary.db DATABASE_REPLICA_URLS=sqlite:///./replica.db
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_HEALTH_CHECK_INTERVAL = float(os.getenv("REPLICA_HEALTH_CHECK_INTERVAL", "5"))
+
+PRIMARY_UNTIL_HEADER = "X-Primary-Until"
+
+# Seconds since the last replayed transaction, or 0 when the standby has replayed everything it received
+_POSTGRES_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+# --- Replica Health ---
+
+class _Replica:
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.healthy = True
+        self.checked_at = 0.0
+        self._check_lock = threading.Lock()
+        event.listen(engine, "handle_error", self._on_error)
+
+    def is_usable(self) -> bool:
+        # Only one thread re-checks; the others keep using the last known state
+        if time.monotonic() - self.checked_at > REPLICA_HEALTH_CHECK_INTERVAL and self._check_lock.acquire(blocking=False):
+            try:
+                self._check()
+            finally:
+                self.checked_at = time.monotonic()
+                self._check_lock.release()
+        return self.healthy
+
+    def _check(self):
+        try:
+            with self.engine.connect() as conn:
+                if self.engine.dialect.name == "postgresql":
+                    lag = float(conn.execute(_POSTGRES_LAG_SQL).scalar() or 0)
+                else:
+                    conn.execute(text("SELECT 1"))
+                    lag = 0.0
+        except Exception as exc:
+            if self.healthy:
+                logger.warning("Replica %s is unavailable: %s", self.engine.url, exc)
+            self.healthy = False
+            return
+        if lag > REPLICA_MAX_LAG_SECONDS:
+            logger.warning("Replica %s lags %.1fs; reading from the primary", self.engine.url, lag)
+        self.healthy = lag <= REPLICA_MAX_LAG_SECONDS
+
+    def _on_error(self, context):
+        if context.is_disconnect:
+            self.mark_down()
+
+    def mark_down(self):
+        # Skipped until the next health check
+        self.healthy = False
+        self.checked_at = time.monotonic()
+
+class ReplicaRouter:
+    def __init__(self, primary: Engine, replicas: list[Engine]):
+        self.primary = primary
+        self._replicas = [_Replica(engine) for engine in replicas]
+        self._last_write: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._replicas)
+
+    def choose(self) -> Engine:
+        usable = [replica for replica in self._replicas if replica.is_usable()]
+        return random.choice(usable).engine if usable else self.primary
+
+    def report_failure(self, engine: Engine):
+        for replica in self._replicas:
+            if replica.engine is engine:
+                replica.mark_down()
+
+    # --- Read-your-writes stickiness ---
+
+    def mark_written(self, account_key: str):
+        now = time.monotonic()
+        with self._lock:
+            self._last_write[account_key] = now
+            if len(self._last_write) > 10_000:
+                cutoff = now - REPLICA_STICKY_SECONDS
+                self._last_write = {key: at for key, at in self._last_write.items() if at > cutoff}
+
+    def is_sticky(self, account_key: str) -> bool:
+        written_at = self._last_write.get(account_key)
+        return written_at is not None and time.monotonic() - written_at < REPLICA_STICKY_SECONDS
+
+def primary_until() -> str:
+    """The X-Primary-Until value for a response to a request that wrote."""
+    return f"{time.time() + REPLICA_STICKY_SECONDS:.3f}"
+
+def wants_primary(headers) -> bool:
+    """Whether the client sent an X-Primary-Until still in the future."""
+    try:
+        return float(headers.get(PRIMARY_UNTIL_HEADER, 0)) > time.time()
+    except ValueError:
+        return False
+
+# --- Routing Session ---
+
+class RoutingSession(Session):
+    """Session that reads from a replica unless it flushes, writes, or is pinned to the primary."""
+
+    def __init__(self, *args, router: ReplicaRouter | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.router = router
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.router is None or not self.router.enabled:
+            return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+        if self.info.get("use_primary") or self._flushing or isinstance(clause, UpdateBase):
+            return self.router.primary
+        # One replica per session, so a request sees a single consistent source
+        bind = self.info.get("replica_bind")
+        if bind is None:
+            bind = self.info["replica_bind"] = self.router.choose()
+        return bind
+
+    # --- Fallback to the primary ---
+    # A replica that fails mid-request (down, restarting, statement cancelled by replay) is marked
+    # down, and the session finishes on the primary: the failed query runs again there.
+
+    def execute(self, statement, *args, **kwargs):
+        return self._with_fallback(super().execute, statement, *args, **kwargs)
+
+    def scalar(self, statement, *args, **kwargs):
+        return self._with_fallback(super().scalar, statement, *args, **kwargs)
+
+    def scalars(self, statement, *args, **kwargs):
+        return self._with_fallback(super().scalars, statement, *args, **kwargs)
+
+    def _with_fallback(self, method, statement, *args, **kwargs):
+        try:
+            return method(statement, *args, **kwargs)
+        except (OperationalError, InterfaceError) as exc:
+            replica = self.info.get("replica_bind")
+            ran_on_replica = (
+                replica is not None and replica is not self.router.primary
+                and not self.info.get("use_primary") and not isinstance(statement, UpdateBase)
+            )
+            if not ran_on_replica:
+                raise
+            logger.warning("Query on replica %s failed (%s); retrying on the primary", replica.url, exc.orig)
+            self.router.report_failure(replica)
+            self.rollback()  # drops the replica connection
+            self.info["replica_bind"] = self.router.primary
+            return method(statement, *args, **kwargs)
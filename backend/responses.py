@@ -0,0 +1,54 @@
+import hashlib
+from functools import lru_cache
+from typing import Any, Callable, List
+
+import orjson
+from pydantic import TypeAdapter
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+# --- Default Response Class ---
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, which handles datetimes natively and is much faster than json."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+# --- Precompiled List Serializers ---
+
+@lru_cache(maxsize=None)
+def list_adapter(schema: type) -> TypeAdapter:
+    """Builds (once per schema) the pydantic-core validator/serializer for a list of `schema`."""
+    return TypeAdapter(List[schema])
+
+def orm_list_response(schema: type, rows) -> Response:
+    """
+    Serializes ORM rows straight to JSON bytes through the cached adapter,
+    bypassing FastAPI's per-request response_model validation and encoding.
+    """
+    adapter = list_adapter(schema)
+    content = adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+    return Response(content=content, media_type="application/json")
+
+# --- Conditional Responses ---
+
+def etag_response(request: Request, content: bytes, media_type: str = "application/json") -> Response:
+    """
+    Sends `content` with a strong ETag derived from its bytes, or an empty 304 when the
+    client's If-None-Match already matches. "no-cache" makes browsers revalidate every time.
+    """
+    etag = hashlib.blake2b(content, digest_size=16).hexdigest()
+    return fingerprint_response(request, etag, lambda: content, media_type)
+
+def fingerprint_response(request: Request, fingerprint: str, produce: Callable[[], bytes], media_type: str) -> Response:
+    """
+    Like etag_response, but the ETag is a fingerprint of the content's inputs, known before the
+    content exists: `produce` is only called when the client's copy does not match.
+    """
+    etag = f'"{fingerprint}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(content=produce(), media_type=media_type, headers=headers)
@@ -0,0 +1,211 @@
+"""
+Quotation revision history, stored compactly.
+
+Every save of a quotation appends a QuotationRevision in the same transaction. Most revisions are
+deltas against the previous one: the header fields that changed plus runs of item operations
+(keep, remove, add, modify). The first revision recorded for a quotation, and every
+QUOTATION_SNAPSHOT_INTERVAL-th one after it, is a full snapshot instead, so rebuilding any
+revision reads one snapshot and at most QUOTATION_SNAPSHOT_INTERVAL - 1 deltas (see state_at).
+
+Items are re-created on every full save, so rows are identified by their position, not their id.
+"""
+import datetime
+import difflib
+import os
+
+import orjson
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+import models
+
+# --- Configuration ---
+
+QUOTATION_SNAPSHOT_INTERVAL = int(os.getenv("QUOTATION_SNAPSHOT_INTERVAL", "10"))
+
+HEADER_FIELDS = (
+    "client_id", "user_id", "valid_until_date", "tax_percentage", "other_charges", "status",
+    "subtotal", "total_tax", "total",
+)
+ITEM_FIELDS = ("product_id", "description", "unit_price", "quantity", "is_taxable", "total")
+SNAPSHOT, DELTA = "snapshot", "delta"
+
+# The state before a quotation exists; the first revision is the difference from it
+EMPTY_STATE = {"header": {}, "items": []}
+
+# --- States and Deltas ---
+# A state is {"header": {field: value}, "items": [[value per ITEM_FIELDS], ...]}, JSON-ready.
+# A delta is {"header": {field: new value}, "items": [op, ...]} with each op one of
+# ["=", n] keep n rows, ["-", n] drop n rows, ["+", rows] insert rows, ["~", rows] replace len(rows) rows.
+
+def encode_header_value(field: str, value):
+    if field == "valid_until_date" and isinstance(value, datetime.date):
+        # Stored as DateTime, written as a date: compare and keep only the date
+        return (value.date() if isinstance(value, datetime.datetime) else value).isoformat()
+    return value
+
+def state_of(quotation: models.Quotation, items=None) -> dict:
+    """The state of a loaded quotation; `items` overrides its (possibly stale) items collection."""
+    items = sorted(quotation.items if items is None else items, key=lambda item: item.id)
+    return {
+        "header": {field: encode_header_value(field, getattr(quotation, field)) for field in HEADER_FIELDS},
+        "items": [[getattr(item, field) for field in ITEM_FIELDS] for item in items],
+    }
+
+def diff(old: dict, new: dict) -> dict:
+    delta = {}
+    header = {field: value for field, value in new["header"].items() if old["header"].get(field) != value}
+    if header:
+        delta["header"] = header
+    operations = _item_operations(old["items"], new["items"])
+    if operations:
+        delta["items"] = operations
+    return delta
+
+def _item_operations(old_rows: list, new_rows: list) -> list:
+    if old_rows == new_rows:
+        return []
+    matcher = difflib.SequenceMatcher(None, [tuple(row) for row in old_rows], [tuple(row) for row in new_rows], autojunk=False)
+    operations = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            operations.append(["=", i2 - i1])
+        elif tag == "delete":
+            operations.append(["-", i2 - i1])
+        elif tag == "insert":
+            operations.append(["+", new_rows[j1:j2]])
+        else:
+            # Paired rows are modifications; any surplus on either side is a removal or an addition
+            paired = min(i2 - i1, j2 - j1)
+            operations.append(["~", new_rows[j1:j1 + paired]])
+            if i2 - i1 > paired:
+                operations.append(["-", i2 - i1 - paired])
+            if j2 - j1 > paired:
+                operations.append(["+", new_rows[j1 + paired:j2]])
+    while operations and operations[-1][0] == "=":
+        operations.pop()  # trailing rows are kept implicitly
+    return operations
+
+def apply(state: dict, delta: dict) -> dict:
+    header = {**state["header"], **delta.get("header", {})}
+    operations = delta.get("items")
+    if not operations:
+        return {"header": header, "items": state["items"]}
+    old_rows, rows, position = state["items"], [], 0
+    for operation, argument in operations:
+        if operation == "=":
+            rows.extend(old_rows[position:position + argument])
+            position += argument
+        elif operation == "-":
+            position += argument
+        elif operation == "+":
+            rows.extend(argument)
+        else:
+            rows.extend(argument)
+            position += len(argument)
+    rows.extend(old_rows[position:])
+    return {"header": header, "items": rows}
+
+def summarize(delta: dict) -> dict:
+    """What a revision changed, for listings (computed from the delta alone)."""
+    counts = {"+": 0, "-": 0, "~": 0}
+    for operation, argument in delta.get("items", []):
+        if operation in counts:
+            counts[operation] += argument if operation == "-" else len(argument)
+    return {
+        "changed_fields": sorted(delta.get("header", {})),
+        "items_added": counts["+"], "items_removed": counts["-"], "items_modified": counts["~"],
+    }
+
+def compare(old: dict, new: dict) -> dict:
+    """Field-by-field comparison of two states: changed header fields and added, removed and modified rows."""
+    def row(values, position):
+        return {**dict(zip(ITEM_FIELDS, values)), "position": position}
+
+    added, removed, modified = [], [], []
+    old_position = new_position = 0
+    for operation, argument in _item_operations(old["items"], new["items"]):
+        if operation == "=":
+            old_position += argument
+            new_position += argument
+        elif operation == "-":
+            removed.extend(row(old["items"][old_position + n], old_position + n) for n in range(argument))
+            old_position += argument
+        elif operation == "+":
+            added.extend(row(values, new_position + n) for n, values in enumerate(argument))
+            new_position += len(argument)
+        else:
+            modified.extend(
+                {"before": row(old["items"][old_position + n], old_position + n), "after": row(values, new_position + n)}
+                for n, values in enumerate(argument)
+            )
+            old_position += len(argument)
+            new_position += len(argument)
+    fields = {
+        field: {"before": old["header"].get(field), "after": value}
+        for field, value in new["header"].items() if old["header"].get(field) != value
+    }
+    return {"fields": fields, "items_added": added, "items_removed": removed, "items_modified": modified}
+
+# --- Recording ---
+
+def _is_snapshot(revision: int) -> bool:
+    return (revision - 1) % QUOTATION_SNAPSHOT_INTERVAL == 0
+
+def record(db: Session, account_id: int, deltas: dict[int, dict], load_states):
+    """
+    Appends one revision per quotation in `deltas` ({quotation_id: delta of this save}) to the
+    caller's transaction; empty deltas are skipped. `load_states(ids)` returns {id: state after
+    the save} and is only called for the revisions that must be snapshots.
+    The caller must hold the quotations' row locks (any UPDATE of them does), so revision
+    numbers are assigned one save at a time.
+    """
+    deltas = {quotation_id: delta for quotation_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    R = models.QuotationRevision
+    latest = dict(db.execute(
+        select(R.quotation_id, func.max(R.revision)).where(R.quotation_id.in_(deltas)).group_by(R.quotation_id)
+    ).all())
+    numbers = {quotation_id: latest.get(quotation_id, 0) + 1 for quotation_id in deltas}
+    snapshot_ids = [quotation_id for quotation_id, number in numbers.items() if _is_snapshot(number)]
+    states = load_states(snapshot_ids) if snapshot_ids else {}
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    db.execute(insert(R), [
+        dict(
+            quotation_id=quotation_id, account_id=account_id, revision=numbers[quotation_id],
+            kind=SNAPSHOT if quotation_id in states else DELTA,
+            data=orjson.dumps(states.get(quotation_id, delta)).decode(),
+            summary=orjson.dumps(summarize(delta)).decode(),
+            created_at=now,
+        )
+        for quotation_id, delta in deltas.items()
+    ])
+
+def lock(db: Session, quotation_ids: list[int]):
+    """Row-locks quotations before reading the state a delta will be computed from (no-op on SQLite,
+    whose writer transactions are already serialized)."""
+    db.execute(select(models.Quotation.id).where(models.Quotation.id.in_(quotation_ids)).with_for_update())
+
+# --- Reading ---
+
+def state_at(db: Session, quotation_id: int, revision: int, model=models.QuotationRevision) -> dict | None:
+    """Rebuilds a revision from the nearest snapshot at or before it plus the deltas after that.
+    `model` is QuotationRevision, or ArchivedQuotationRevision for archived quotations."""
+    R = model
+    base = db.execute(
+        select(func.max(R.revision)).where(R.quotation_id == quotation_id, R.kind == SNAPSHOT, R.revision <= revision)
+    ).scalar()
+    if base is None:
+        return None
+    rows = db.execute(
+        select(R.revision, R.data)
+        .where(R.quotation_id == quotation_id, R.revision >= base, R.revision <= revision)
+        .order_by(R.revision)
+    ).all()
+    if rows[-1].revision != revision:
+        return None
+    state = orjson.loads(rows[0].data)
+    for row in rows[1:]:
+        state = apply(state, orjson.loads(row.data))
+    return state
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, field_validator
+from typing import Any, Dict, List, Literal, Optional
 import datetime
 
 # --- Base Schemas ---
@@ -28,19 +28,26 @@ class UserBase(BaseModel):
     full_name: Optional[str] = None
     phone: Optional[str] = None
 
+# Quotation statuses a client may set
+QuotationStatus = Literal["draft", "sent", "accepted", "rejected", "expired"]
+
 class QuotationBase(BaseModel):
     client_id: int
     user_id: int
     valid_until_date: datetime.date
     tax_percentage: float = 16.0
     other_charges: float = 0.0
-    status: str = 'draft'
+    status: QuotationStatus = 'draft'
+
+# PDF renderer backends (see pdf.py)
+PdfRenderer = Literal["weasyprint", "canvas"]
 
 class CompanyProfileBase(BaseModel):
     company_name: str
     address: str
     phone: str
     website: str
+    pdf_renderer: Optional[PdfRenderer] = None
 
 class TermsConditionsBase(BaseModel):
     content: str
@@ -62,6 +69,13 @@ class UserCreate(UserBase):
 class QuotationCreate(QuotationBase):
     items: List[QuotationItemCreate]
 
+class QuotationClone(BaseModel):
+    client_id: Optional[int] = None
+    user_id: Optional[int] = None
+    valid_until_date: Optional[datetime.date] = None
+    status: QuotationStatus = 'draft'
+    refresh_prices: bool = False  # Re-price items from the current Product.price
+
 class CompanyProfileCreate(CompanyProfileBase):
     pass
 
@@ -82,15 +96,31 @@ class ClientUpdate(BaseModel):
     email: Optional[str] = None
     phone: Optional[str] = None
 
-class QuotationUpdate(BaseModel):
+class QuotationPatch(BaseModel):
+    # Header fields only; the items are left untouched. Omitted fields keep their value
     client_id: Optional[int] = None
     user_id: Optional[int] = None
     valid_until_date: Optional[datetime.date] = None
     tax_percentage: Optional[float] = None
     other_charges: Optional[float] = None
-    status: Optional[str] = None
+    status: Optional[QuotationStatus] = None
+
+    @field_validator("*")
+    @classmethod
+    def reject_null(cls, value):
+        # Every header field is required on a quotation, so an explicit null is an error (422)
+        if value is None:
+            raise ValueError("must not be null")
+        return value
+
+class QuotationUpdate(QuotationPatch):
+    # Omitted fields keep their value; given items replace all of them (an empty list removes them)
     items: Optional[List[QuotationItemCreate]] = None
 
+class QuotationStatusUpdate(BaseModel):
+    quotation_ids: List[int]
+    status: QuotationStatus
+
 class UserUpdate(BaseModel):
     email: Optional[str] = None
     full_name: Optional[str] = None
@@ -106,30 +136,26 @@ class Product(ProductBase):
     id: int
     account_id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class Client(ClientBase):
     id: int
     account_id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class QuotationItem(QuotationItemBase):
     id: int
     total: float
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class User(UserBase):
     id: int
     is_active: bool
     account_id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class Quotation(QuotationBase):
     id: int
@@ -142,23 +168,112 @@ class Quotation(QuotationBase):
     items: List[QuotationItem] = []
     client: Client
     user: User
+    archived: bool = False  # moved to the archive (read-only, see archive.py)
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class CompanyProfile(CompanyProfileBase):
-    id: int
+    id: Optional[int] = None  # None for accounts created before profiles were per-account
+    account_id: Optional[int] = None
     logo_path: Optional[str] = None
+    logo_web_path: Optional[str] = None
+    logo_pdf_path: Optional[str] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class TermsConditions(TermsConditionsBase):
-    id: int
+    id: Optional[int] = None  # None until the account saves its own terms
     account_id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
+
+# --- Revision History Schemas ---
+
+class QuotationRevisionSummary(BaseModel):
+    revision: int
+    kind: str  # snapshot, delta (storage detail; every revision can be fetched and diffed)
+    created_at: datetime.datetime
+    changed_fields: List[str]
+    items_added: int
+    items_removed: int
+    items_modified: int
+
+class QuotationRevisionItem(QuotationItemBase):
+    position: int
+    total: float
+
+class QuotationRevision(BaseModel):
+    revision: int
+    created_at: datetime.datetime
+    client_id: int
+    user_id: int
+    valid_until_date: datetime.date
+    tax_percentage: float
+    other_charges: float
+    status: str
+    subtotal: float
+    total_tax: float
+    total: float
+    items: List[QuotationRevisionItem]
+
+class QuotationFieldChange(BaseModel):
+    before: Optional[Any] = None
+    after: Optional[Any] = None
+
+class QuotationItemChange(BaseModel):
+    before: QuotationRevisionItem
+    after: QuotationRevisionItem
+
+class QuotationRevisionDiff(BaseModel):
+    from_revision: int
+    to_revision: int
+    fields: Dict[str, QuotationFieldChange]
+    items_added: List[QuotationRevisionItem]
+    items_removed: List[QuotationRevisionItem]
+    items_modified: List[QuotationItemChange]
+
+# --- Bootstrap Schemas ---
+
+class QuotationEditorBootstrap(BaseModel):
+    clients: List[Client]
+    products: List[Product]
+    users: List[User]
+    terms_conditions: TermsConditions
+    company_profile: CompanyProfile
+    quotation: Optional[Quotation] = None  # Only when editing an existing quotation
+
+# --- Background Job Schemas ---
+
+class QuotationIdList(BaseModel):
+    quotation_ids: List[int]
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress: float
+    progress_message: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None
+    created_at: datetime.datetime
+    finished_at: Optional[datetime.datetime] = None
+    result_media_type: Optional[str] = None
+    result_filename: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class QuotationDelivery(BaseModel):
+    id: int
+    job_id: int
+    quotation_id: int
+    recipient: Optional[str] = None
+    cc: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+    sent_at: Optional[datetime.datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
 
 # --- Account Schemas (New) ---
 
@@ -175,6 +290,7 @@ class AccountUpdate(BaseModel):
 
 class AccountDeleteWithPassword(BaseModel):
     password: str
+    background: bool = False # Delete in chunks from a background job (for large accounts)
 
 class Account(AccountBase):
     id: int
@@ -183,8 +299,7 @@ class Account(AccountBase):
     clients: List[Client] = []
     products: List[Product] = []
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # --- Token Schemas (for authentication) ---
 
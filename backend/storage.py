@@ -0,0 +1,315 @@
+"""
+Object storage for uploaded files and rendered artifacts.
+
+Everything that used to live on one API node's disk (logos under /uploads, pre-rendered PDFs)
+goes through a Storage, so several nodes behind a load balancer share it without sticky
+sessions or NFS. Backends:
+
+- "local" (default): a directory on the local filesystem.
+- "s3": an S3-compatible bucket (AWS S3, MinIO, ...). Credentials come from the usual AWS
+  environment variables / config files.
+
+Each area is a namespace (see get_storage): a local directory, or a key prefix in the bucket.
+A namespace can be split further with Storage.subspace (a subdirectory, or a longer prefix).
+Remote objects are read through a small per-node cache on local disk. Stored names are
+content-addressed or fingerprinted, so an object never changes under the same key and cached
+copies need no invalidation across nodes.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import BinaryIO
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # boto3 is only needed for STORAGE_BACKEND=s3
+    boto3 = None
+
+# --- Configuration ---
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")  # local, s3
+STORAGE_S3_BUCKET = os.getenv("STORAGE_S3_BUCKET")
+STORAGE_S3_ENDPOINT_URL = os.getenv("STORAGE_S3_ENDPOINT_URL")  # e.g. http://minio:9000
+STORAGE_S3_REGION = os.getenv("STORAGE_S3_REGION")
+STORAGE_S3_PREFIX = os.getenv("STORAGE_S3_PREFIX", "")  # prepended to every namespace
+STORAGE_CACHE_DIRECTORY = os.getenv("STORAGE_CACHE_DIRECTORY", "./storage_cache")
+STORAGE_CACHE_MAX_MB = int(os.getenv("STORAGE_CACHE_MAX_MB", "256"))
+
+CHUNK_SIZE = 64 * 1024
+
+def _checked(key: str) -> str:
+    # Keys are flat file names; anything else could escape the namespace
+    if not key or key in (".", "..") or "/" in key or "\\" in key or "\x00" in key:
+        raise ValueError(f"Invalid storage key '{key}'")
+    return key
+
+# --- Backends ---
+
+class Storage(ABC):
+    """A flat namespace of binary objects. Missing objects raise FileNotFoundError."""
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Opens the object for streaming reads."""
+
+    @abstractmethod
+    def write(self, key: str, source: BinaryIO):
+        """Stores the object atomically, streaming it from `source`."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether the object is stored."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Removes the object; a missing object is not an error."""
+
+    @abstractmethod
+    def keys(self, prefix: str = "") -> list[str]:
+        """Names of the stored objects starting with `prefix`."""
+
+    @abstractmethod
+    def local_path(self, key: str) -> str:
+        """Path of a local copy of the object, for consumers that need a real file."""
+
+    @abstractmethod
+    def subspace(self, name: str) -> "Storage":
+        """The objects under `name` as a storage of their own; listing it never reads the rest."""
+
+    def read(self, key: str) -> bytes:
+        with self.open(key) as stored:
+            return stored.read()
+
+    def write_bytes(self, key: str, data: bytes):
+        with tempfile.SpooledTemporaryFile(max_size=len(data) + 1) as source:
+            source.write(data)
+            source.seek(0)
+            self.write(key, source)
+
+class LocalStorage(Storage):
+    def __init__(self, directory: str, create: bool = True):
+        self.directory = directory
+        if create:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, _checked(key))
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def write(self, key: str, source: BinaryIO):
+        target = self._path(key)
+        os.makedirs(self.directory, exist_ok=True)  # a subspace is only created by its first write
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as tmp:
+            try:
+                shutil.copyfileobj(source, tmp, CHUNK_SIZE)
+            except BaseException:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+        os.replace(tmp.name, target)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self, prefix: str = "") -> list[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:  # a subspace nothing was written to
+            return []
+        return [
+            name for name in names
+            if name.startswith(prefix) and not name.endswith(".tmp") and os.path.isfile(os.path.join(self.directory, name))
+        ]
+
+    def local_path(self, key: str) -> str:
+        path = self._path(key)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        return path
+
+    def subspace(self, name: str) -> Storage:
+        return LocalStorage(os.path.join(self.directory, _checked(name)), create=False)
+
+class S3Storage(Storage):
+    """Objects under `prefix` in an S3-compatible bucket; reads go through the node's ReadCache."""
+
+    def __init__(self, client, bucket: str, prefix: str, cache: "ReadCache"):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache = cache
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{_checked(key)}"
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.local_path(key), "rb")
+
+    def write(self, key: str, source: BinaryIO):
+        # upload_fileobj streams the source, switching to a multipart upload for large objects
+        self.client.upload_fileobj(source, self.bucket, self._key(key))
+        self.cache.discard(self._key(key))
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as error:
+            if _is_missing(error):
+                return False
+            raise
+        return True
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        self.cache.discard(self._key(key))
+
+    def keys(self, prefix: str = "") -> list[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        names = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix) if prefix else self.prefix):
+            names.extend(entry["Key"][len(self.prefix):] for entry in page.get("Contents", []))
+        return [name for name in names if "/" not in name]
+
+    def local_path(self, key: str) -> str:
+        return self.cache.fetch(self._key(key), self._download)
+
+    def subspace(self, name: str) -> Storage:
+        return S3Storage(self.client, self.bucket, f"{self._key(name)}/", self.cache)
+
+    def _download(self, object_key: str, destination: BinaryIO) -> float:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=object_key)
+        except ClientError as error:
+            if _is_missing(error):
+                raise FileNotFoundError(object_key) from error
+            raise
+        with response["Body"] as body:
+            shutil.copyfileobj(body, destination, CHUNK_SIZE)
+        return response["LastModified"].timestamp()
+
+def _is_missing(error: "ClientError") -> bool:
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+# --- Read-through Cache ---
+
+class ReadCache:
+    """
+    Local copies of remote objects, bounded to `max_bytes` by evicting the least recently used.
+    A copy keeps the object's remote modification time (so Last-Modified/ETag headers derived
+    from it agree across nodes); its access time records the last use.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, object_key: str) -> str:
+        # Mirrors the object keys, so a cached file keeps the object's name
+        return os.path.join(self.directory, *object_key.split("/"))
+
+    def fetch(self, object_key: str, download) -> str:
+        path = self._path(object_key)
+        try:
+            modified = os.stat(path).st_mtime
+        except FileNotFoundError:
+            pass
+        else:
+            os.utime(path, (time.time(), modified))
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False) as tmp:
+            try:
+                modified = download(object_key, tmp)
+            except BaseException:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+        os.utime(tmp.name, (time.time(), modified))
+        os.replace(tmp.name, path)
+        self._evict(keep=path)
+        return path
+
+    def discard(self, object_key: str):
+        try:
+            os.remove(self._path(object_key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep: str):
+        if not self._evict_lock.acquire(blocking=False):
+            return  # another thread is already trimming the cache
+        try:
+            entries = []
+            total = 0
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    path = os.path.join(root, name)
+                    if name.endswith(".tmp") or path == keep:  # keep: the copy about to be used
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_atime, stat.st_size, path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            # Trim to 90% so the next few misses do not rescan the directory
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        finally:
+            self._evict_lock.release()
+
+# --- Namespaces ---
+
+_storages: dict[str, Storage] = {}
+_storages_lock = threading.Lock()
+_s3_client = None
+_read_cache = None
+
+def get_storage(namespace: str, local_directory: str) -> Storage:
+    """
+    Storage for one area of the application, e.g. get_storage("uploads", "./uploads").
+    With the local backend it is `local_directory`; with S3, the "<namespace>/" key prefix.
+    """
+    with _storages_lock:
+        if namespace not in _storages:
+            _storages[namespace] = _create(namespace, local_directory)
+        return _storages[namespace]
+
+def _create(namespace: str, local_directory: str) -> Storage:
+    global _s3_client, _read_cache
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(local_directory)
+    if STORAGE_BACKEND != "s3":
+        raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}'")
+    if boto3 is None:
+        raise RuntimeError("STORAGE_BACKEND=s3 requires the boto3 package")
+    if not STORAGE_S3_BUCKET:
+        raise RuntimeError("STORAGE_BACKEND=s3 requires STORAGE_S3_BUCKET")
+    if _s3_client is None:
+        # boto3 clients are thread-safe, so one client serves every namespace and thread
+        _s3_client = boto3.client("s3", endpoint_url=STORAGE_S3_ENDPOINT_URL, region_name=STORAGE_S3_REGION)
+        _read_cache = ReadCache(STORAGE_CACHE_DIRECTORY, STORAGE_CACHE_MAX_MB * 1024 * 1024)
+    return S3Storage(_s3_client, STORAGE_S3_BUCKET, f"{STORAGE_S3_PREFIX}{namespace}/", _read_cache)
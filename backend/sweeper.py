@@ -0,0 +1,37 @@
+# sweeper.py
+# Moves draft/sent quotations whose validity has ended to "expired". Run it from cron
+# (e.g. daily, from the backend directory):
+#   python sweeper.py
+# or keep it running with --interval SECONDS.
+
+import argparse
+import logging
+import time
+
+import crud, migrations
+from database import WriteSessionLocal
+
+logger = logging.getLogger("sweeper")
+
+def sweep(chunk_size: int) -> int:
+    total = 0
+    with WriteSessionLocal() as db:
+        for account_id, expired in crud.expire_overdue_quotations(db, chunk_size=chunk_size):
+            logger.info("Account %s: %s quotations expired", account_id, expired)
+            total += expired
+    logger.info("Sweep finished: %s quotations expired", total)
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expires draft/sent quotations past their valid-until date.")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Quotations updated per transaction")
+    parser.add_argument("--interval", type=int, default=0, help="Repeat every N seconds instead of running once")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    migrations.upgrade()
+    while True:
+        sweep(args.chunk_size)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,145 @@
+"""Job handlers executed by the background workers (see jobs.py)."""
+import io
+import zipfile
+from contextlib import closing
+
+import crud, jobs, mailer, pdf, pdf_store
+from database import WriteSessionLocal
+
+# --- PDF Rendering and Export ---
+
+def _render(ctx: jobs.JobContext, db_quotation, account) -> bytes:
+    try:
+        return pdf.render_quotation_pdf(ctx.db, db_quotation, account)
+    except pdf.PdfRenderLimitExceeded as exc:
+        raise jobs.PermanentJobError(str(exc)) from exc  # retrying would hit the same limit
+
+@jobs.handler("quotations_pdf")
+def render_quotations_pdf(ctx: jobs.JobContext):
+    """Renders one quotation to a PDF, or several into a ZIP archive."""
+    account = crud.get_account(ctx.db, account_id=ctx.account_id)
+    if account is None:
+        raise jobs.PermanentJobError("Account not found")
+    quotation_ids = ctx.payload["quotation_ids"]
+
+    if len(quotation_ids) == 1:
+        db_quotation = crud.get_quotation(ctx.db, quotation_id=quotation_ids[0], account_id=account.id)
+        if db_quotation is None:
+            raise jobs.PermanentJobError("Quotation not found")
+        return jobs.JobResult(_render(ctx, db_quotation, account), "application/pdf", pdf.pdf_filename(db_quotation))
+
+    buffer = io.BytesIO()
+    # PDFs are already compressed, so the archive only stores them
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for index, quotation_id in enumerate(quotation_ids, start=1):
+            db_quotation = crud.get_quotation(ctx.db, quotation_id=quotation_id, account_id=account.id)
+            if db_quotation is not None:
+                archive.writestr(pdf.pdf_filename(db_quotation), _render(ctx, db_quotation, account))
+                ctx.db.expunge_all()  # keep the session small on long exports
+            ctx.progress(index, len(quotation_ids), f"{index}/{len(quotation_ids)} cotizaciones")
+    return jobs.JobResult(buffer.getvalue(), "application/zip", "cotizaciones.zip")
+
+@jobs.handler("prerender_quotation_pdf")
+def prerender_quotation_pdf(ctx: jobs.JobContext):
+    """Renders a quotation and its preview into the PDF store (see pdf_store.py) unless fresh renders are already there."""
+    account = crud.get_account(ctx.db, account_id=ctx.account_id)
+    db_quotation = crud.get_quotation(ctx.db, quotation_id=ctx.payload["quotation_id"], account_id=ctx.account_id) if account else None
+    if db_quotation is None:
+        return  # deleted since it was scheduled
+    renderer_name = pdf.resolve_renderer(None, crud.get_company_profile(ctx.db, account=account))
+    fingerprint = pdf.render_fingerprint(db_quotation, account, renderer_name)
+    if not pdf_store.exists(db_quotation.id, fingerprint):
+        pdf_store.save(db_quotation.id, fingerprint, _render(ctx, db_quotation, account))
+    preview_fingerprint = pdf.preview_fingerprint(ctx.db, db_quotation, account)
+    if not pdf_store.exists(db_quotation.id, preview_fingerprint, "png"):
+        pdf_store.save(db_quotation.id, preview_fingerprint, pdf.render_quotation_preview(ctx.db, db_quotation, account), "png")
+
+# --- Email Delivery ---
+
+@jobs.handler("send_quotations")
+def send_quotations(ctx: jobs.JobContext):
+    """
+    Emails each quotation's PDF to its client, CC'ing the advisor, then moves the drafts among the
+    sent ones to "sent" in one UPDATE. Every message has a QuotationDelivery row; a retry only sends
+    the ones still pending, so a client never gets the same email twice from one job.
+    """
+    account = crud.get_account(ctx.db, account_id=ctx.account_id)
+    if account is None:
+        raise jobs.PermanentJobError("Account not found")
+    if not mailer.is_configured():
+        raise jobs.PermanentJobError("Email delivery is not configured (SMTP_HOST)")
+    pending = [
+        (delivery.id, delivery.quotation_id)
+        for delivery in crud.prepare_quotation_deliveries(ctx.db, ctx.job_id, account.id, ctx.payload["quotation_ids"])
+    ]
+    delivery_ids, quotations = {}, []
+    for delivery_id, quotation_id in pending:
+        db_quotation = crud.get_quotation(ctx.db, quotation_id=quotation_id, account_id=account.id)
+        if db_quotation is None:
+            _record_delivery(delivery_id, "failed", "La cotización fue eliminada")
+            continue
+        if not db_quotation.client.email:
+            _record_delivery(delivery_id, "failed", "El cliente no tiene correo electrónico")
+            continue
+        delivery_ids[db_quotation.id] = delivery_id
+        quotations.append(db_quotation)
+
+    company = crud.get_company_profile(ctx.db, account=account)
+    try:
+        # Closed before the finally below, so the renders still queued are cancelled first
+        with closing(pdf.render_quotation_pdfs(ctx.db, quotations, account)) as renders:
+            for done, (db_quotation, rendered) in enumerate(renders, start=1):
+                recipient = db_quotation.client.email
+                cc = db_quotation.user.email if db_quotation.user is not None else None
+                try:
+                    refused = mailer.send(mailer.quotation_message(db_quotation, company, rendered.result(), pdf.pdf_filename(db_quotation)))
+                except (pdf.PdfRenderLimitExceeded, mailer.PermanentDeliveryError) as exc:
+                    _record_delivery(delivery_ids[db_quotation.id], "failed", str(exc), recipient, cc)
+                else:
+                    # The client got it; a refused copy to the advisor is only noted
+                    error = f"Copia rechazada: {', '.join(refused)}" if refused else None
+                    _record_delivery(delivery_ids[db_quotation.id], "sent", error, recipient, cc)
+                ctx.progress(done, len(quotations), f"{done}/{len(quotations)} correos")
+    except Exception as exc:
+        # Connection problems and temporary (4xx) rejections: the job is retried with backoff,
+        # unless this was its last attempt
+        if ctx.last_attempt:
+            with WriteSessionLocal() as db:
+                crud.fail_pending_quotation_deliveries(db, ctx.job_id, str(exc))
+        raise
+    finally:
+        sent_ids = crud.get_sent_quotation_ids(ctx.db, ctx.job_id)
+        if sent_ids:
+            crud.update_quotations_status(ctx.db, sent_ids, "sent", account.id, from_statuses=("draft",))
+
+def _record_delivery(delivery_id: int, status: str, error: str | None = None, recipient: str | None = None, cc: str | None = None):
+    # Own short transaction (like JobContext.progress), so the job's session and its loaded quotations stay untouched
+    with WriteSessionLocal() as db:
+        crud.update_quotation_delivery(db, delivery_id, status, error, recipient, cc)
+
+# --- Repricing ---
+
+REPRICE_CHUNK_SIZE = 200
+
+@jobs.handler("reprice_quotations")
+def reprice_quotations(ctx: jobs.JobContext):
+    """Re-prices quotation items from the current catalog, one committed chunk at a time."""
+    quotation_ids = ctx.payload["quotation_ids"]
+    for start in range(0, len(quotation_ids), REPRICE_CHUNK_SIZE):
+        chunk = quotation_ids[start:start + REPRICE_CHUNK_SIZE]
+        crud.reprice_quotations(ctx.db, quotation_ids=chunk, account_id=ctx.account_id)
+        ctx.progress(start + len(chunk), len(quotation_ids))
+
+# --- Account Deletion ---
+
+ACCOUNT_DELETE_CHUNK_SIZE = 1000
+
+@jobs.handler("delete_account")
+def delete_account(ctx: jobs.JobContext):
+    """Deletes a (possibly very large) account in short chunked transactions."""
+    account_id = ctx.payload["account_id"]
+    total = crud.count_account_rows(ctx.db, account_id=account_id)
+    deleted = 0
+    while chunk := crud.delete_account_chunk(ctx.db, account_id=account_id, chunk_size=ACCOUNT_DELETE_CHUNK_SIZE):
+        deleted += chunk
+        ctx.progress(deleted, total, f"{deleted}/{total} registros eliminados")
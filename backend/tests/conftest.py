@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+import uuid
+
+# The app reads its settings at import time: point it at a throwaway database and storage first
+_TEST_DIRECTORY = tempfile.mkdtemp(prefix="cotizaciones-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEST_DIRECTORY, 'test.db')}"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["PDF_DEFAULT_RENDERER"] = "canvas"
+os.environ["PDF_STORE_DIRECTORY"] = os.path.join(_TEST_DIRECTORY, "pdf_store")
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(_TEST_DIRECTORY, "uploads")
+os.environ["STORAGE_CACHE_DIRECTORY"] = os.path.join(_TEST_DIRECTORY, "storage_cache")
+
+BACKEND_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIRECTORY)
+os.chdir(BACKEND_DIRECTORY)  # the PDF template is loaded relative to it
+
+import pytest
+from fastapi.testclient import TestClient
+
+import auth, mailer, main, models
+from database import WriteSessionLocal
+
+@pytest.fixture(scope="session")
+def client():
+    return TestClient(main.app)
+
+@pytest.fixture
+def account():
+    """A new account of its own for each test."""
+    with WriteSessionLocal() as db:
+        db_account = models.Account(username=f"test-{uuid.uuid4().hex[:12]}", full_name="Test", hashed_password="x")
+        db.add(db_account)
+        db.commit()
+        db.refresh(db_account)
+        db.expunge(db_account)
+    return db_account
+
+@pytest.fixture
+def headers(account):
+    return {"Authorization": f"Bearer {auth.create_access_token({'sub': account.username})}"}
+
+@pytest.fixture
+def make_quotation(client, headers):
+    """Creates a quotation through the API (one client, advisor and product per test) and returns it."""
+    created = {}
+
+    def make(items: int = 1, client_email: str | None = "cliente@example.com", **fields):
+        if not created:
+            created["user"] = client.post("/users/", json={"email": "asesor@example.com", "full_name": "Asesor"}, headers=headers).json()
+            created["client"] = client.post("/clients/", json={"name": "Cliente", "email": client_email}, headers=headers).json()
+            created["product"] = client.post("/products/", json={"name": "Producto", "price": 10}, headers=headers).json()
+        body = {
+            "client_id": created["client"]["id"],
+            "user_id": created["user"]["id"],
+            "valid_until_date": "2030-01-01",
+            "items": [
+                {"product_id": created["product"]["id"], "description": f"Partida {n}", "unit_price": 10, "quantity": 1}
+                for n in range(items)
+            ],
+            **fields,
+        }
+        response = client.post("/quotations/", json=body, headers=headers)
+        assert response.status_code == 201, response.text
+        return response.json()
+
+    return make
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """Messages "sent" by the worker; `failures` maps a subject to the errors its next attempts raise."""
+    sent, failures = [], {}
+
+    def send(message):
+        if failures.get(message["Subject"]):
+            raise failures[message["Subject"]].pop(0)
+        sent.append(message["Subject"])
+        return []  # no refused copies
+
+    monkeypatch.setattr(mailer, "SMTP_HOST", "smtp.example.com")
+    monkeypatch.setattr(mailer, "send", send)
+    return sent, failures
@@ -0,0 +1,63 @@
+import datetime
+
+import crud, jobs
+from database import WriteSessionLocal
+
+def archive(account, quotations) -> int:
+    """Closes the quotations and archives everything closed in the account, whatever its age."""
+    with WriteSessionLocal() as db:
+        for quotation in quotations:
+            crud.update_quotations_status(db, [quotation["id"]], "accepted", account.id)
+        cutoff = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) + datetime.timedelta(days=1)
+        return crud.archive_account_quotations_chunk(db, account.id, cutoff=cutoff)
+
+def test_archived_quotation_is_still_found(client, headers, account, make_quotation):
+    archived, active = make_quotation(items=2), make_quotation()
+    client.patch(f"/quotations/{archived['id']}", json={"other_charges": 3}, headers=headers)
+
+    assert archive(account, [archived]) == 1
+
+    found = client.get(f"/quotations/{archived['id']}", headers=headers).json()
+    assert found["archived"] is True
+    assert found["quotation_number"] == archived["quotation_number"]
+    assert len(found["items"]) == 2
+    assert [q["id"] for q in client.get("/quotations/", headers=headers).json()] == [active["id"]]
+    assert [q["id"] for q in client.get("/quotations/", params={"archived": True}, headers=headers).json()] == [archived["id"]]
+    assert client.get(f"/quotations/{archived['id']}/pdf", headers=headers).status_code == 200
+    # The history moved with it: created, patched, closed
+    assert [r["revision"] for r in client.get(f"/quotations/{archived['id']}/revisions", headers=headers).json()] == [3, 2, 1]
+    assert client.get(f"/quotations/{archived['id']}/revisions/1", headers=headers).json()["other_charges"] == 0
+
+def test_numbering_continues_after_the_newest_is_archived(client, headers, account, make_quotation):
+    make_quotation()
+    newest = make_quotation()
+    archive(account, [newest])
+
+    created = make_quotation()
+
+    assert created["id"] > newest["id"]
+    assert int(created["quotation_number"]) == int(newest["quotation_number"]) + 1
+
+def test_ids_of_deleted_archived_quotations_are_not_reused(client, headers, account, make_quotation):
+    make_quotation()
+    newest = make_quotation()
+    archive(account, [newest])
+    assert client.delete(f"/quotations/{newest['id']}", headers=headers).status_code == 200
+
+    created = make_quotation()
+
+    assert created["id"] > newest["id"]
+    assert client.get(f"/quotations/{newest['id']}", headers=headers).status_code == 404
+
+def test_deliveries_outlive_their_quotation(client, headers, account, make_quotation, outbox):
+    quotation = make_quotation()
+    job = client.post("/quotations/send", json={"quotation_ids": [quotation["id"]]}, headers=headers).json()
+    jobs.work(burst=True)
+
+    archive(account, [quotation])
+    assert client.get(f"/jobs/{job['id']}/deliveries", headers=headers).json()[0]["status"] == "sent"
+    client.delete(f"/quotations/{quotation['id']}", headers=headers)
+
+    [delivery] = client.get(f"/jobs/{job['id']}/deliveries", headers=headers).json()
+    assert delivery["quotation_id"] == quotation["id"]
+    assert delivery["status"] == "sent"
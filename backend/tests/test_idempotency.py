@@ -0,0 +1,36 @@
+import datetime
+
+import idempotency, models, schemas
+from database import WriteSessionLocal
+
+def in_progress_since(account, key: str, body, seconds_ago: float):
+    """An unfinished request with this key, as left by a request still running (or one that died)."""
+    with WriteSessionLocal() as db:
+        db.add(models.IdempotencyKey(
+            account_id=account.id, key=key, endpoint="POST /clients/", request_hash=idempotency.request_hash(body),
+            status=idempotency.IN_PROGRESS, created_at=idempotency._utcnow() - datetime.timedelta(seconds=seconds_ago),
+        ))
+        db.commit()
+
+def test_duplicate_of_a_slow_request_is_not_run_again(client, headers, account, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.3)
+    body = {"name": "Cliente lento"}
+    # Running for longer than a duplicate waits, but well within the lease
+    in_progress_since(account, "slow", schemas.ClientCreate(**body), seconds_ago=60)
+
+    response = client.post("/clients/", json=body, headers={**headers, "Idempotency-Key": "slow"})
+
+    assert response.status_code == 409
+    assert client.get("/clients/", headers=headers).json() == []
+
+def test_abandoned_request_is_taken_over(client, headers, account):
+    body = {"name": "Cliente abandonado"}
+    in_progress_since(account, "abandoned", schemas.ClientCreate(**body), seconds_ago=idempotency.IDEMPOTENCY_LEASE_SECONDS + 1)
+
+    response = client.post("/clients/", json=body, headers={**headers, "Idempotency-Key": "abandoned"})
+    replayed = client.post("/clients/", json=body, headers={**headers, "Idempotency-Key": "abandoned"})
+
+    assert response.status_code == 201
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert replayed.json() == response.json()
+    assert len(client.get("/clients/", headers=headers).json()) == 1
@@ -0,0 +1,24 @@
+from sqlalchemy import update
+
+import database, jobs, models
+from database import WriteSessionLocal
+
+def test_handler_writes_hold_the_write_lock(account, monkeypatch):
+    observed = {}
+
+    def handler(ctx: jobs.JobContext):
+        observed["before"] = database._sqlite_write_lock.locked()
+        ctx.db.execute(update(models.Account).where(models.Account.id == ctx.account_id).values(full_name="Renombrada"))
+        observed["writing"] = database._sqlite_write_lock.locked()
+        ctx.db.commit()
+        observed["after"] = database._sqlite_write_lock.locked()
+
+    monkeypatch.setitem(jobs._handlers, "test_write", handler)
+    with WriteSessionLocal() as db:
+        job = jobs.enqueue(db, "test_write", account_id=account.id)
+    jobs.work(burst=True)
+
+    assert observed == {"before": False, "writing": True, "after": False}
+    with WriteSessionLocal() as db:
+        assert db.get(models.Job, job.id).status == jobs.SUCCEEDED
+        assert db.get(models.Account, account.id).full_name == "Renombrada"
@@ -0,0 +1,31 @@
+import io
+
+import pytest
+from PIL import Image
+
+import logos
+
+def upload(client, headers, image: Image.Image, format: str):
+    encoded = io.BytesIO()
+    image.save(encoded, format=format)
+    return client.post("/company-profile/logo", files={"file": (f"logo.{format.lower()}", encoded.getvalue())}, headers=headers)
+
+@pytest.mark.parametrize("size", [(6000, 6000), (14000, 14000)], ids=["above the cap", "decompression bomb"])
+def test_huge_image_is_rejected_before_decoding(client, headers, size):
+    # A 1-bit blank image: a few KB of PNG that declares tens of megapixels
+    response = upload(client, headers, Image.new("1", size), "PNG")
+
+    assert response.status_code == 413
+    assert not client.get("/company-profile/", headers=headers).json()["logo_path"]
+
+def test_jpeg_logo_gets_its_variants(client, headers):
+    response = upload(client, headers, Image.new("RGB", (4000, 2000), "navy"), "JPEG")
+
+    assert response.status_code == 200
+    logo_path = response.json()["logo_path"]
+    assert logo_path.endswith(".jpg")
+    for variant, (width, height) in logos.LOGO_VARIANTS.items():
+        stored = logos.upload_storage().read(logos.variant_url(logo_path, variant).rsplit("/", 1)[1])
+        with Image.open(io.BytesIO(stored)) as scaled:
+            assert scaled.width <= width and scaled.height <= height
+            assert max(scaled.width / width, scaled.height / height) > 0.99  # scaled to fit, not shrunk further
@@ -0,0 +1,125 @@
+import socket
+from email.message import EmailMessage
+
+import pytest
+
+pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller
+
+import jobs, mailer
+
+class Recorder:
+    """aiosmtpd handler: records each message with the connection it came on; refuses `refused` recipients."""
+
+    def __init__(self):
+        self.messages = []  # (connection peer, recipients)
+        self.noops = 0
+        self.refused = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refused:
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_NOOP(self, server, session, envelope, arg):
+        self.noops += 1
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((session.peer, list(envelope.rcpt_tos)))
+        return "250 OK"
+
+    def connections(self) -> int:
+        return len({peer for peer, _ in self.messages})
+
+class SmtpServer:
+    def __init__(self, handler: Recorder):
+        self.handler = handler
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.start()
+
+    def start(self):
+        self.controller = Controller(self.handler, hostname="127.0.0.1", port=self.port)
+        self.controller.start()
+
+    def stop(self):
+        self.controller.stop()
+
+@pytest.fixture
+def smtp(monkeypatch):
+    server = SmtpServer(Recorder())
+    monkeypatch.setattr(mailer, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(mailer, "SMTP_PORT", server.port)
+    monkeypatch.setattr(mailer, "SMTP_SECURITY", "none")
+    monkeypatch.setattr(mailer, "SMTP_USERNAME", None)
+    mailer._discard_connection()
+    yield server
+    mailer._discard_connection()
+    server.stop()
+
+def message(to: str = "cliente@example.com", cc: str | None = None) -> EmailMessage:
+    email = EmailMessage()
+    email["Subject"], email["From"], email["To"] = "Cotización", "cotizaciones@localhost", to
+    if cc:
+        email["Cc"] = cc
+    email.set_content("Hola")
+    return email
+
+def test_connection_is_reused(smtp):
+    for _ in range(3):
+        assert mailer.send(message()) == []
+
+    assert len(smtp.handler.messages) == 3
+    assert smtp.handler.connections() == 1
+
+def test_connection_is_replaced_after_max_messages(smtp, monkeypatch):
+    monkeypatch.setattr(mailer, "SMTP_MAX_MESSAGES_PER_CONNECTION", 2)
+    for _ in range(5):
+        mailer.send(message())
+
+    assert smtp.handler.connections() == 3
+
+def test_idle_connection_is_probed_before_reuse(smtp, monkeypatch):
+    monkeypatch.setattr(mailer, "SMTP_IDLE_CHECK_SECONDS", 0)
+    mailer.send(message())
+    mailer.send(message())
+
+    assert smtp.handler.noops == 1
+    assert smtp.handler.connections() == 1
+
+def test_reconnects_when_the_server_dropped_the_connection(smtp):
+    mailer.send(message())
+    smtp.stop()
+    smtp.start()
+
+    mailer.send(message())
+
+    assert len(smtp.handler.messages) == 2
+    assert smtp.handler.connections() == 2
+
+def test_refused_copy_does_not_fail_the_message(smtp):
+    smtp.handler.refused = {"asesor@example.com"}
+
+    assert mailer.send(message(cc="asesor@example.com")) == ["asesor@example.com"]
+    assert smtp.handler.messages[0][1] == ["cliente@example.com"]
+
+def test_refused_main_recipient_fails_the_message(smtp):
+    smtp.handler.refused = {"cliente@example.com"}
+
+    with pytest.raises(mailer.PermanentDeliveryError):
+        mailer.send(message(cc="asesor@example.com"))
+
+def test_job_records_a_refused_copy_as_sent(client, headers, make_quotation, smtp):
+    smtp.handler.refused = {"asesor@example.com"}
+    quotation = make_quotation()
+
+    job = client.post("/quotations/send", json={"quotation_ids": [quotation["id"]]}, headers=headers).json()
+    jobs.work(burst=True)
+
+    [delivery] = client.get(f"/jobs/{job['id']}/deliveries", headers=headers).json()
+    assert delivery["status"] == "sent"
+    assert "asesor@example.com" in delivery["error"]
+    assert client.get(f"/quotations/{quotation['id']}", headers=headers).json()["status"] == "sent"
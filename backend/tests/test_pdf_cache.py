@@ -0,0 +1,37 @@
+import pdf_store
+
+def test_preview_etag_changes_when_a_product_is_renamed(client, headers, make_quotation):
+    quotation = make_quotation()
+    product_id = quotation["items"][0]["product_id"]
+    before = client.get(f"/quotations/{quotation['id']}/preview.png", headers=headers)
+    assert before.status_code == 200
+
+    client.put(f"/products/{product_id}", json={"name": "Producto renombrado"}, headers=headers)
+    after = client.get(f"/quotations/{quotation['id']}/preview.png", headers={**headers, "If-None-Match": before.headers["ETag"]})
+
+    assert after.status_code == 200
+    assert after.headers["ETag"] != before.headers["ETag"]
+
+def test_preview_not_modified_while_unchanged(client, headers, make_quotation):
+    quotation = make_quotation()
+    first = client.get(f"/quotations/{quotation['id']}/preview.png", headers=headers)
+
+    again = client.get(f"/quotations/{quotation['id']}/preview.png", headers={**headers, "If-None-Match": first.headers["ETag"]})
+
+    assert again.status_code == 304
+
+def test_store_keeps_only_the_latest_render_of_each_quotation():
+    pdf_store.save(901, "old", b"old pdf")
+    pdf_store.save(901, "old", b"old png", "png")
+    pdf_store.save(902, "other", b"other pdf")
+
+    pdf_store.save(901, "new", b"new pdf")
+
+    assert pdf_store.load(901, "old") is None
+    assert pdf_store.load(901, "new") == b"new pdf"
+    assert pdf_store.load(901, "old", "png") == b"old png"  # other kinds are left alone
+    assert pdf_store.load(902, "other") == b"other pdf"
+
+    pdf_store.discard(901)
+    assert pdf_store.load(901, "new") is None and pdf_store.load(901, "old", "png") is None
+    assert pdf_store.load(902, "other") == b"other pdf"
@@ -0,0 +1,44 @@
+import io
+
+import pytest
+from pypdf import PdfReader
+
+import pdf
+
+def _weasyprint_loads() -> bool:
+    try:
+        import weasyprint  # noqa: F401
+    except (ImportError, OSError):  # OSError: the package is there, Pango is not
+        return False
+    return True
+
+requires_weasyprint = pytest.mark.skipif(not _weasyprint_loads(), reason="WeasyPrint cannot be loaded")
+
+def test_render_limit_is_unprocessable(client, headers, make_quotation, monkeypatch):
+    quotation = make_quotation()
+
+    def exceed(*args, **kwargs):
+        raise pdf.PdfRenderLimitExceeded("La cotización es demasiado grande para generar su PDF")
+    monkeypatch.setattr(pdf, "get_or_render_quotation_pdf", exceed)
+    response = client.get(f"/quotations/{quotation['id']}/pdf", headers=headers)
+
+    assert response.status_code == 422
+    assert "demasiado grande" in response.json()["detail"]
+
+@requires_weasyprint
+def test_large_quotation_is_rendered_in_chunks(client, headers, make_quotation):
+    quotation = make_quotation(items=pdf.PDF_LARGE_DOCUMENT_ITEMS + 1)
+
+    response = client.get(f"/quotations/{quotation['id']}/pdf", params={"renderer": "weasyprint"}, headers=headers)
+
+    assert response.status_code == 200
+    assert len(PdfReader(io.BytesIO(response.content)).pages) > 1
+
+@requires_weasyprint
+def test_memory_cap_applies_to_the_render(client, headers, make_quotation, monkeypatch):
+    monkeypatch.setattr(pdf, "PDF_RENDER_MEMORY_CAP_MB", 1)
+    quotation = make_quotation(items=pdf.PDF_LARGE_DOCUMENT_ITEMS + 1)
+
+    response = client.get(f"/quotations/{quotation['id']}/pdf", params={"renderer": "weasyprint"}, headers=headers)
+
+    assert response.status_code == 422
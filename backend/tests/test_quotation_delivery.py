@@ -0,0 +1,63 @@
+import smtplib
+
+from sqlalchemy import update
+
+import jobs, mailer, models
+from database import WriteSessionLocal
+
+def send_quotations(client, headers, quotations) -> dict:
+    response = client.post("/quotations/send", json={"quotation_ids": [q["id"] for q in quotations]}, headers=headers)
+    assert response.status_code == 202, response.text
+    jobs.work(burst=True)
+    return response.json()
+
+def retry_now(job_id: int):
+    """Skips the retry backoff."""
+    with WriteSessionLocal() as db:
+        db.execute(update(models.Job).where(models.Job.id == job_id).values(run_at=jobs._utcnow()))
+        db.commit()
+    jobs.work(burst=True)
+
+def subject(quotation) -> str:
+    return f"Cotización {quotation['quotation_number']}"
+
+def test_retry_only_sends_the_pending_messages(client, headers, make_quotation, outbox):
+    sent, failures = outbox
+    quotations = [make_quotation() for _ in range(3)]
+    failures[subject(quotations[1])] = [smtplib.SMTPServerDisconnected("connection lost")]
+
+    job = send_quotations(client, headers, quotations)
+    assert client.get(f"/jobs/{job['id']}", headers=headers).json()["status"] == "queued"  # waiting for its retry
+    retry_now(job["id"])
+
+    assert sorted(sent) == sorted(subject(q) for q in quotations)  # each one exactly once
+    assert client.get(f"/jobs/{job['id']}", headers=headers).json()["status"] == "succeeded"
+    deliveries = client.get(f"/jobs/{job['id']}/deliveries", headers=headers).json()
+    assert [d["status"] for d in deliveries] == ["sent"] * 3
+    for quotation in quotations:
+        assert client.get(f"/quotations/{quotation['id']}", headers=headers).json()["status"] == "sent"
+
+def test_rejected_message_is_not_retried(client, headers, make_quotation, outbox):
+    sent, failures = outbox
+    rejected, accepted = make_quotation(), make_quotation()
+    failures[subject(rejected)] = [mailer.PermanentDeliveryError("550 Mailbox unavailable")]
+
+    job = send_quotations(client, headers, [rejected, accepted])
+
+    assert sent == [subject(accepted)]
+    assert client.get(f"/jobs/{job['id']}", headers=headers).json()["status"] == "succeeded"
+    deliveries = {d["quotation_id"]: d for d in client.get(f"/jobs/{job['id']}/deliveries", headers=headers).json()}
+    assert deliveries[rejected["id"]]["status"] == "failed"
+    assert deliveries[rejected["id"]]["error"] == "550 Mailbox unavailable"
+    assert deliveries[accepted["id"]]["status"] == "sent"
+    assert client.get(f"/quotations/{rejected['id']}", headers=headers).json()["status"] == "draft"
+
+def test_client_without_email_fails_its_delivery(client, headers, make_quotation, outbox):
+    sent, _ = outbox
+    quotation = make_quotation(client_email=None)
+
+    job = send_quotations(client, headers, [quotation])
+
+    assert sent == []
+    [delivery] = client.get(f"/jobs/{job['id']}/deliveries", headers=headers).json()
+    assert delivery["status"] == "failed"
@@ -0,0 +1,60 @@
+import pytest
+
+@pytest.mark.parametrize("field", ["tax_percentage", "other_charges", "valid_until_date", "status", "client_id", "user_id"])
+def test_patch_rejects_null(client, headers, make_quotation, field):
+    quotation = make_quotation()
+
+    response = client.patch(f"/quotations/{quotation['id']}", json={field: None}, headers=headers)
+
+    assert response.status_code == 422
+    assert client.get(f"/quotations/{quotation['id']}", headers=headers).json()[field] == quotation[field]
+
+def test_patch_updates_only_given_fields(client, headers, make_quotation):
+    quotation = make_quotation(items=2)
+
+    response = client.patch(f"/quotations/{quotation['id']}", json={"other_charges": 5}, headers=headers)
+
+    assert response.status_code == 200
+    patched = response.json()
+    assert patched["other_charges"] == 5
+    assert patched["total"] == pytest.approx(quotation["total"] + 5)
+    assert patched["tax_percentage"] == quotation["tax_percentage"]
+    assert len(patched["items"]) == 2
+
+def test_patch_tax_recomputes_totals(client, headers, make_quotation):
+    quotation = make_quotation(items=3)  # 3 x 10, all taxable
+
+    patched = client.patch(f"/quotations/{quotation['id']}", json={"tax_percentage": 10}, headers=headers).json()
+
+    assert patched["total_tax"] == pytest.approx(3.0)
+    assert patched["total"] == pytest.approx(33.0 + patched["other_charges"])
+
+def test_put_without_items_rejects_null(client, headers, make_quotation):
+    quotation = make_quotation()
+
+    response = client.put(f"/quotations/{quotation['id']}", json={"tax_percentage": None, "other_charges": 2}, headers=headers)
+
+    assert response.status_code == 422
+    assert client.get(f"/quotations/{quotation['id']}", headers=headers).json()["other_charges"] == quotation["other_charges"]
+
+@pytest.mark.parametrize("method, path", [
+    ("PATCH", "/quotations/{id}"),
+    ("PUT", "/quotations/{id}"),
+    ("POST", "/quotations/{id}/clone"),
+])
+def test_unknown_status_is_rejected(client, headers, make_quotation, method, path):
+    quotation = make_quotation()
+
+    response = client.request(method, path.format(id=quotation["id"]), json={"status": "bogus"}, headers=headers)
+
+    assert response.status_code == 422
+    assert client.get(f"/quotations/{quotation['id']}", headers=headers).json()["status"] == "draft"
+
+def test_bulk_status_rejects_unknown_status(client, headers, make_quotation):
+    quotation = make_quotation()
+
+    response = client.patch("/quotations/status", json={"quotation_ids": [quotation["id"]], "status": "bogus"}, headers=headers)
+    accepted = client.patch("/quotations/status", json={"quotation_ids": [quotation["id"]], "status": "accepted"}, headers=headers)
+
+    assert response.status_code == 422
+    assert accepted.json() == {"updated": 1}
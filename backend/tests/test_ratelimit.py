@@ -0,0 +1,87 @@
+import uuid
+
+import pytest
+
+import models, ratelimit
+from database import WriteSessionLocal
+
+@pytest.mark.parametrize("method, path, expected", [
+    ("GET", "/quotations/7/pdf", "expensive"),
+    ("GET", "/quotations/7/preview.png", "expensive"),
+    ("POST", "/quotations/send", "expensive"),
+    ("GET", "/quotations/7", "read"),
+    ("PATCH", "/quotations/7", "write"),
+    ("POST", "/token", "auth"),
+])
+def test_classify(method, path, expected):
+    assert ratelimit.classify(method, path) == expected
+
+class FakeClock:
+    """Stands in for the time module in ratelimit: both clocks only move when told to."""
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", fake)
+    return fake
+
+@pytest.fixture(params=[ratelimit.LocalBuckets, ratelimit.DatabaseBuckets], ids=["local", "database"])
+def buckets(request):
+    return request.param()
+
+def test_bucket_allows_a_burst_then_asks_to_wait(buckets, clock):
+    key = uuid.uuid4().hex
+    assert [buckets.take(key, rate=2, burst=3) for _ in range(3)] == [0.0] * 3
+
+    assert buckets.take(key, rate=2, burst=3) == pytest.approx(0.5)
+    clock.now += 0.25
+    assert buckets.take(key, rate=2, burst=3) == pytest.approx(0.25)  # a refused request costs nothing
+
+def test_bucket_refills_at_its_rate_up_to_the_burst(buckets, clock):
+    key = uuid.uuid4().hex
+    for _ in range(3):
+        buckets.take(key, rate=2, burst=3)
+
+    clock.now += 0.5
+    assert buckets.take(key, rate=2, burst=3) == 0.0
+    assert buckets.take(key, rate=2, burst=3) > 0
+
+    clock.now += 3600  # idle for long: full again, but never above the burst
+    assert [buckets.take(key, rate=2, burst=3) for _ in range(3)] == [0.0] * 3
+    assert buckets.take(key, rate=2, burst=3) > 0
+
+def test_buckets_are_per_key(buckets, clock):
+    first, second = uuid.uuid4().hex, uuid.uuid4().hex
+    buckets.take(first, rate=1, burst=1)
+
+    assert buckets.take(first, rate=1, burst=1) > 0
+    assert buckets.take(second, rate=1, burst=1) == 0.0
+
+def test_database_bucket_charges_the_row_a_concurrent_worker_created(clock, monkeypatch):
+    key = uuid.uuid4().hex
+    buckets = ratelimit.DatabaseBuckets()
+    charge = buckets._charge
+
+    def lose_the_race(db, *args):
+        # The other worker creates the bucket, with its burst already spent, between our check and our insert
+        with WriteSessionLocal() as other:
+            other.add(models.RateLimitBucket(key=key, tokens=0.0, updated_at=clock.time()))
+            other.commit()
+        monkeypatch.setattr(buckets, "_charge", charge)
+        return None
+
+    monkeypatch.setattr(buckets, "_charge", lose_the_race)
+
+    assert buckets.take(key, rate=1.0, burst=3) == pytest.approx(1.0)
+
+def test_database_backend_is_refused_on_sqlite():
+    with pytest.raises(ValueError, match="PostgreSQL"):
+        ratelimit.RateLimitMiddleware(app=None, backend="database")
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+import revisions
+
+def row(description: str, quantity: int = 1) -> list:
+    return [1, description, 10.0, quantity, True, 10.0 * quantity]
+
+def state(*rows, **header) -> dict:
+    return {"header": {"tax_percentage": 16.0, "other_charges": 0.0, **header}, "items": list(rows)}
+
+OLD = state(row("a"), row("b"), row("c"), row("d"))
+
+@pytest.mark.parametrize("new", [
+    OLD,
+    state(row("a"), row("b"), row("c"), row("d"), other_charges=5.0),
+    state(row("x"), row("a"), row("b"), row("y"), row("c"), row("d"), row("z")),  # inserts
+    state(row("b"), row("d")),  # removals
+    state(row("a"), row("b", 2), row("c"), row("d", 3)),  # modifications
+    state(row("a"), row("b", 5), row("e"), row("f"), row("g")),  # more new rows than replaced ones
+    state(row("a", 7), row("d")),  # fewer new rows than replaced ones
+    state(row("d"), row("c"), row("b"), row("a")),  # reordered
+    state(),
+], ids=["unchanged", "header", "insert", "remove", "modify", "grow", "shrink", "reorder", "empty"])
+def test_apply_of_diff_rebuilds_the_new_state(new):
+    assert revisions.apply(OLD, revisions.diff(OLD, new)) == new
+
+def test_first_revision_is_a_diff_from_the_empty_state():
+    assert revisions.apply(revisions.EMPTY_STATE, revisions.diff(revisions.EMPTY_STATE, OLD)) == OLD
+
+def test_random_edit_sequences_round_trip():
+    randomizer = random.Random(20240501)
+    current = OLD
+    for _ in range(200):
+        rows = [list(r) for r in current["items"]]
+        for _ in range(randomizer.randint(1, 4)):
+            choice = randomizer.choice(("insert", "remove", "modify"))
+            position = randomizer.randint(0, len(rows))
+            if choice == "insert" or not rows:
+                rows.insert(position, row(f"item {randomizer.randint(0, 30)}", randomizer.randint(1, 3)))
+            elif choice == "remove":
+                rows.pop(min(position, len(rows) - 1))
+            else:
+                rows[min(position, len(rows) - 1)][3] = randomizer.randint(1, 9)
+        new = state(*rows, other_charges=float(randomizer.randint(0, 2)))
+        assert revisions.apply(current, revisions.diff(current, new)) == new
+        current = new
+
+def test_every_revision_is_rebuilt_across_snapshots(client, headers, make_quotation):
+    quotation = make_quotation(items=2)
+    product_id = quotation["items"][0]["product_id"]
+    saved = {1: quotation}
+    descriptions = ["Partida 0", "Partida 1"]
+    # Enough saves to pass the second snapshot, with inserts, removals and modifications among them
+    for number in range(2, revisions.QUOTATION_SNAPSHOT_INTERVAL + 4):
+        if number % 3 == 0:
+            descriptions.insert(1, f"Nueva {number}")
+        elif number % 3 == 1 and len(descriptions) > 1:
+            descriptions.pop(0)
+        items = [
+            {"product_id": product_id, "description": description, "unit_price": 10, "quantity": 1 + (n == 0) * number}
+            for n, description in enumerate(descriptions)
+        ]
+        response = client.put(f"/quotations/{quotation['id']}", json={"items": items, "other_charges": number}, headers=headers)
+        assert response.status_code == 200, response.text
+        saved[number] = response.json()
+
+    listed = client.get(f"/quotations/{quotation['id']}/revisions", headers=headers).json()
+    assert sorted(entry["revision"] for entry in listed) == sorted(saved)
+    for number, expected in saved.items():
+        rebuilt = client.get(f"/quotations/{quotation['id']}/revisions/{number}", headers=headers).json()
+        assert rebuilt["other_charges"] == expected["other_charges"]
+        assert rebuilt["total"] == pytest.approx(expected["total"])
+        assert [(item["description"], item["quantity"]) for item in rebuilt["items"]] == \
+            [(item["description"], item["quantity"]) for item in expected["items"]]
@@ -0,0 +1,20 @@
+# worker.py
+# Background job worker. Run from the backend directory:
+#   python worker.py --concurrency 4
+
+import argparse
+import logging
+import os
+
+import jobs, migrations
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs queued background jobs (PDF rendering, exports, repricing).")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("JOB_WORKER_CONCURRENCY", "1")),
+                        help="Number of worker processes")
+    parser.add_argument("--burst", action="store_true", help="Exit once the queue is empty")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    migrations.upgrade()
+    jobs.run_worker(concurrency=args.concurrency, burst=args.burst)
@@ -11,6 +11,11 @@ apiClient.interceptors.request.use(
         if (token) {
             config.headers['Authorization'] = `Bearer ${token}`;
         }
+        // Read-your-writes: until then, the server reads from the primary instead of a replica
+        const primaryUntil = localStorage.getItem('primaryUntil');
+        if (primaryUntil && Number(primaryUntil) > Date.now() / 1000) {
+            config.headers['X-Primary-Until'] = primaryUntil;
+        }
         return config;
     },
     (error) => {
@@ -18,9 +23,18 @@ apiClient.interceptors.request.use(
     }
 );
 
-// Response interceptor to handle token expiration (401 errors)
+const MAX_RETRY_AFTER_SECONDS = 5;
+
+// Response interceptor to keep the read-your-writes marker and handle token expiration (401 errors) and rate limiting (429/503)
 apiClient.interceptors.response.use(
-    (response) => response, // Pass through successful responses
+    (response) => {
+        // Sent after a write when the server reads from replicas
+        const primaryUntil = response.headers['x-primary-until'];
+        if (primaryUntil) {
+            localStorage.setItem('primaryUntil', primaryUntil);
+        }
+        return response;
+    },
     (error) => {
         // Check if the error is a 401 Unauthorized
         if (error.response && error.response.status === 401) {
@@ -31,6 +45,16 @@ apiClient.interceptors.response.use(
                 window.location.href = '/'; // Redirect to login page
             }
         }
+        // Rate limited or shed under load: retry a read once after the server's Retry-After
+        const config = error.config;
+        if (error.response && [429, 503].includes(error.response.status)
+            && config && config.method === 'get' && !config._retried) {
+            const retryAfter = Number(error.response.headers['retry-after']) || 1;
+            if (retryAfter <= MAX_RETRY_AFTER_SECONDS) {
+                config._retried = true;
+                return new Promise((resolve) => setTimeout(resolve, retryAfter * 1000)).then(() => apiClient(config));
+            }
+        }
         // For all other errors, just pass them on
         return Promise.reject(error);
     }
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useMemo } from 'react';
+import React, { useState, useEffect, useMemo, useRef } from 'react';
 import apiClient from '../api/axios';
 import { useNavigate } from 'react-router-dom';
 import {
@@ -41,23 +41,22 @@ function CreateQuotation() {
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
     const [submitError, setSubmitError] = useState('');
+    // Same key for every retry of this submission, so the server creates the quotation only once
+    const idempotencyKey = useRef(crypto.randomUUID());
 
     useEffect(() => {
         const fetchData = async () => {
             try {
                 setLoading(true);
                 setError('');
-                const [clientsRes, productsRes, usersRes] = await Promise.all([
-                    apiClient.get('/clients/'),
-                    apiClient.get('/products/'),
-                    apiClient.get('/users/')
-                ]);
-                setClients(clientsRes.data);
-                setProducts(productsRes.data);
-                setUsers(usersRes.data);
-                if (usersRes.data.length > 0) {
+                // One round trip (a 304 when nothing changed) for everything the editor needs
+                const { data } = await apiClient.get('/bootstrap/quotation-editor');
+                setClients(data.clients);
+                setProducts(data.products);
+                setUsers(data.users);
+                if (data.users.length > 0) {
                     // You might want to set a default or let the user choose
-                    // setSelectedUserId(usersRes.data[0]); 
+                    // setSelectedUserId(data.users[0]); 
                 }
             } catch (error) {
                 console.error("Error fetching data:", error);
@@ -127,10 +126,16 @@ function CreateQuotation() {
         };
 
         try {
-            await apiClient.post('/quotations/', quotationData);
+            await apiClient.post('/quotations/', quotationData, {
+                headers: { 'Idempotency-Key': idempotencyKey.current },
+            });
             navigate('/quotations');
         } catch (error) {
             console.error("Error creating quotation:", error);
+            if (error.response) {
+                // The server answered, so the next attempt is a new submission
+                idempotencyKey.current = crypto.randomUUID();
+            }
             setSubmitError('Error al guardar la cotización. Por favor, intente de nuevo.');
         }
     };
@@ -32,6 +32,7 @@ const statusOptions = [
     { value: 'sent', label: 'Enviada' },
     { value: 'accepted', label: 'Aceptada' },
     { value: 'rejected', label: 'Rechazada' },
+    { value: 'expired', label: 'Vencida' },
 ];
 
 function EditQuotation() {
@@ -54,17 +55,13 @@ function EditQuotation() {
             try {
                 setLoading(true);
                 setError('');
-                const [clientsRes, productsRes, usersRes, quotationRes] = await Promise.all([
-                    apiClient.get('/clients/'),
-                    apiClient.get('/products/'),
-                    apiClient.get('/users/'),
-                    apiClient.get(`/quotations/${id}`)
-                ]);
+                // One round trip (a 304 when nothing changed) for everything the editor needs
+                const { data } = await apiClient.get('/bootstrap/quotation-editor', { params: { quotation_id: id } });
 
-                const allClients = clientsRes.data;
-                const allProducts = productsRes.data;
-                const allUsers = usersRes.data;
-                const qData = quotationRes.data;
+                const allClients = data.clients;
+                const allProducts = data.products;
+                const allUsers = data.users;
+                const qData = data.quotation;
 
                 setClients(allClients);
                 setProducts(allProducts);
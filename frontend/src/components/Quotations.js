@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import apiClient from '../api/axios';
 import { Link as RouterLink } from 'react-router-dom';
 import {
@@ -21,18 +21,22 @@ import {
     DialogContentText,
     DialogTitle,
     CircularProgress,
-    Alert
+    Alert,
+    FormControlLabel,
+    Switch
 } from '@mui/material';
 import EditIcon from '@mui/icons-material/Edit';
 import DeleteIcon from '@mui/icons-material/Delete';
 import AddIcon from '@mui/icons-material/Add';
 import PictureAsPdfIcon from '@mui/icons-material/PictureAsPdf';
+import SendIcon from '@mui/icons-material/Send';
 
 const statusColors = {
     draft: 'default',
     sent: 'primary',
     accepted: 'success',
     rejected: 'error',
+    expired: 'warning',
 };
 
 const statusTranslations = {
@@ -40,23 +44,77 @@ const statusTranslations = {
     sent: 'Enviada',
     accepted: 'Aceptada',
     rejected: 'Rechazada',
+    expired: 'Vencida',
 };
 
+// First-page thumbnail, fetched once the row scrolls into view. The server answers with an ETag,
+// so the browser revalidates its cached copy instead of downloading the image again.
+function QuotationPreview({ quotation }) {
+    const containerRef = useRef(null);
+    const [visible, setVisible] = useState(false);
+    const [src, setSrc] = useState(null);
+
+    useEffect(() => {
+        const element = containerRef.current;
+        if (!element || !('IntersectionObserver' in window)) {
+            setVisible(true);
+            return undefined;
+        }
+        const observer = new IntersectionObserver((entries) => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                setVisible(true);
+                observer.disconnect();
+            }
+        }, { rootMargin: '200px' });
+        observer.observe(element);
+        return () => observer.disconnect();
+    }, []);
+
+    useEffect(() => {
+        if (!visible) return undefined;
+        let objectUrl = null;
+        let cancelled = false;
+        apiClient.get(`/quotations/${quotation.id}/preview.png`, { responseType: 'blob' })
+            .then((response) => {
+                if (cancelled) return;
+                objectUrl = URL.createObjectURL(response.data);
+                setSrc(objectUrl);
+            })
+            .catch((error) => console.error("Error fetching preview:", error));
+        return () => {
+            cancelled = true;
+            if (objectUrl) URL.revokeObjectURL(objectUrl);
+        };
+    }, [visible, quotation.id, quotation.total, quotation.status]);
+
+    return (
+        <Box ref={containerRef} sx={{ width: 60, height: 78, border: '1px solid #ddd', bgcolor: '#fafafa' }}>
+            {src && (
+                <img src={src} alt={`Cotización ${quotation.quotation_number}`} style={{ width: '100%', height: '100%', objectFit: 'cover', objectPosition: 'top' }} />
+            )}
+        </Box>
+    );
+}
+
 function Quotations() {
     const [quotations, setQuotations] = useState([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
+    const [notice, setNotice] = useState('');
+    const [showArchived, setShowArchived] = useState(false);
+    const sendKeys = useRef({});
     const [openDeleteDialog, setOpenDeleteDialog] = useState(false);
     const [quotationToDelete, setQuotationToDelete] = useState(null);
 
     useEffect(() => {
         fetchQuotations();
-    }, []);
+    }, [showArchived]);
 
     const fetchQuotations = async () => {
         try {
             setLoading(true);
-            const response = await apiClient.get('/quotations/');
+            // Old closed quotations live in the archive and are listed separately
+            const response = await apiClient.get('/quotations/', { params: showArchived ? { archived: true } : {} });
             setQuotations(response.data);
             setError('');
         } catch (error) {
@@ -103,12 +161,31 @@ function Quotations() {
         }
     };
 
+    const handleSendEmail = async (id) => {
+        // One key per quotation while the page is open: a double click reuses the same job
+        // instead of emailing the client twice
+        sendKeys.current[id] = sendKeys.current[id] || crypto.randomUUID();
+        try {
+            await apiClient.post('/quotations/send', { quotation_ids: [id] }, {
+                headers: { 'Idempotency-Key': sendKeys.current[id] },
+            });
+            setNotice('La cotización se está enviando por correo al cliente.');
+        } catch (error) {
+            console.error("Error sending quotation:", error);
+            setNotice(error.response?.data?.detail || 'No se pudo enviar la cotización.');
+        }
+    };
+
     return (
         <Container>
             <Box sx={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', mb: 4 }}>
                 <Typography variant="h4" component="h1">
                     Gestión de Cotizaciones
                 </Typography>
+                <FormControlLabel
+                    control={<Switch checked={showArchived} onChange={(event) => setShowArchived(event.target.checked)} />}
+                    label="Archivadas"
+                />
                 <Button
                     variant="contained"
                     startIcon={<AddIcon />}
@@ -119,6 +196,10 @@ function Quotations() {
                 </Button>
             </Box>
 
+            {notice && (
+                <Alert severity="info" onClose={() => setNotice('')} sx={{ mb: 2 }}>{notice}</Alert>
+            )}
+
             {loading ? (
                 <Box sx={{ display: 'flex', justifyContent: 'center', mt: 4 }}>
                     <CircularProgress />
@@ -130,6 +211,7 @@ function Quotations() {
                     <Table>
                         <TableHead>
                             <TableRow>
+                                <TableCell>Vista previa</TableCell>
                                 <TableCell>N° Cotización</TableCell>
                                 <TableCell>Cliente</TableCell>
                                 <TableCell>Fecha</TableCell>
@@ -141,6 +223,9 @@ function Quotations() {
                         <TableBody>
                             {quotations.map(q => (
                                 <TableRow key={q.id} hover>
+                                    <TableCell>
+                                        <QuotationPreview quotation={q} />
+                                    </TableCell>
                                     <TableCell>{q.quotation_number}</TableCell>
                                     <TableCell>{q.client.name}</TableCell>
                                     <TableCell>{new Date(q.created_date).toLocaleDateString()}</TableCell>
@@ -149,8 +234,13 @@ function Quotations() {
                                         <Chip label={statusTranslations[q.status] || q.status} color={statusColors[q.status] || 'default'} size="small" />
                                     </TableCell>
                                     <TableCell align="right">
-                                        <IconButton component={RouterLink} to={`/quotations/${q.id}/edit`}><EditIcon /></IconButton>
+                                        {!q.archived && (
+                                            <IconButton component={RouterLink} to={`/quotations/${q.id}/edit`}><EditIcon /></IconButton>
+                                        )}
                                         <IconButton onClick={() => handleViewPdf(q.id)}><PictureAsPdfIcon /></IconButton>
+                                        {!q.archived && (
+                                            <IconButton onClick={() => handleSendEmail(q.id)} title="Enviar por correo"><SendIcon /></IconButton>
+                                        )}
                                         <IconButton onClick={() => handleOpenDeleteDialog(q.id)} color="error" sx={{ ml: 2 }}><DeleteIcon /></IconButton>
                                     </TableCell>
                                 </TableRow>
@@ -103,8 +103,8 @@ function Settings() {
             const response = await apiClient.post('/company-profile/logo', formData, {
                 headers: { 'Content-Type': 'multipart/form-data' }
             });
-            const newLogoPath = `${response.data.logo_path}?t=${new Date().getTime()}`;
-            setProfile(prev => ({ ...prev, logo_path: newLogoPath }));
+            // Logos are stored under a content hash, so a new upload always gets a new URL
+            setProfile(prev => ({ ...prev, logo_path: response.data.logo_path, logo_web_path: response.data.logo_web_path }));
             setSelectedFile(null);
             handleFeedback(setSuccess, 'Logo subido con éxito.');
         } catch (err) {
@@ -189,7 +189,7 @@ function Settings() {
                                 <CardMedia
                                     component="img"
                                     height="140"
-                                    image={profile.logo_path ? `http://127.0.0.1:8000${profile.logo_path}` : 'https://via.placeholder.com/345x140?text=No+Logo'}
+                                    image={profile.logo_path ? `http://127.0.0.1:8000${profile.logo_web_path || profile.logo_path}` : 'https://via.placeholder.com/345x140?text=No+Logo'}
                                     alt="Logo de la empresa"
                                     sx={{ objectFit: 'contain' }}
                                 />